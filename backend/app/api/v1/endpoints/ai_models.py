@@ -31,7 +31,7 @@ router = APIRouter()
 # 初始化服务
 ai_model_service = AIModelService()
 cost_tracking_service = CostTrackingService()
-rate_limiter = RateLimiter()
+rate_limiter = RateLimiter(default_algorithm="fixed")
 
 @router.get("/providers", response_model=Dict[str, Any])
 @limiter.limit("60/minute")
@@ -4,7 +4,9 @@
 import time
 from datetime import datetime
 from typing import List, Optional
+import orjson
 from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.api.deps import get_current_user, get_db
@@ -233,6 +235,7 @@ async def get_knowledge_nodes(
     search_term: Optional[str] = Query(None, description="搜索关键词"),
     min_confidence: Optional[float] = Query(None, ge=0.0, le=1.0, description="最小置信度"),
     limit: int = Query(20, ge=1, le=100, description="返回数量限制"),
+    offset: int = Query(0, ge=0, description="结果偏移量"),
     current_user: User = Depends(get_current_user),
     db: AsyncSession = Depends(get_db)
 ):
@@ -243,7 +246,9 @@ async def get_knowledge_nodes(
             node_type=node_type,
             search_term=search_term,
             min_confidence=min_confidence,
-            limit=limit
+            limit=limit,
+            offset=offset,
+            include_total=False  # 列表接口不返回总数
         )
 
         result = await knowledge_graph_service.query_knowledge_graph(
@@ -315,6 +320,7 @@ async def get_knowledge_relations(
     source_node_id: Optional[int] = Query(None, description="源节点ID"),
     target_node_id: Optional[int] = Query(None, description="目标节点ID"),
     limit: int = Query(20, ge=1, le=100, description="返回数量限制"),
+    offset: int = Query(0, ge=0, description="结果偏移量"),
     current_user: User = Depends(get_current_user),
     db: AsyncSession = Depends(get_db)
 ):
@@ -325,7 +331,9 @@ async def get_knowledge_relations(
             relation_type=relation_type,
             source_node_id=source_node_id,
             target_node_id=target_node_id,
-            limit=limit
+            limit=limit,
+            offset=offset,
+            include_total=False  # 列表接口不返回总数
         )
 
         result = await knowledge_graph_service.query_knowledge_graph(
@@ -367,24 +375,17 @@ async def find_knowledge_paths(
             query_type="path_search",
             source_node_id=source_node_id,
             target_node_id=target_node_id,
+            max_length=max_length,
             limit=limit
         )
 
+        # 路径长度在Cypher查询中过滤
         result = await knowledge_graph_service.query_knowledge_graph(
             query_request=query_request,
             user_id=current_user.id,
             db=db
         )
 
-        # 过滤路径长度
-        if 'paths' in result:
-            filtered_paths = [
-                path for path in result['paths']
-                if path['length'] <= max_length
-            ]
-            result['paths'] = filtered_paths[:limit]
-            result['total'] = len(filtered_paths)
-
         return GraphQueryResult(
             query_type="path_search",
             total=result.get('total', 0),
@@ -397,6 +398,38 @@ async def find_knowledge_paths(
         raise HTTPException(status_code=500, detail="查找知识路径失败")
 
 
+@router.get("/paths/stream")
+async def stream_knowledge_paths(
+    source_node_id: int = Query(..., description="源节点ID"),
+    target_node_id: int = Query(..., description="目标节点ID"),
+    max_length: int = Query(6, ge=1, le=10, description="最大路径长度"),
+    limit: int = Query(100, ge=1, le=100, description="返回路径数量"),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    流式查找知识路径
+
+    以NDJSON逐行返回路径，结果集较大时无需等待全部路径查询完成
+    """
+    query_request = GraphQueryRequest(
+        query_type="path_search",
+        source_node_id=source_node_id,
+        target_node_id=target_node_id,
+        max_length=max_length,
+        limit=limit
+    )
+
+    async def iterpaths():
+        try:
+            async for path in knowledge_graph_service.stream_paths(query_request, current_user.id):
+                yield orjson.dumps(path) + b"\n"
+        except Exception as e:
+            # 响应头已发出，只能记录错误并结束流
+            logger.error(f"流式查找知识路径失败: {str(e)}")
+
+    return StreamingResponse(iterpaths(), media_type="application/x-ndjson")
+
+
 @router.post("/cypher-query", response_model=GraphQueryResult)
 async def execute_cypher_query(
     cypher_query: str,
@@ -405,11 +438,7 @@ async def execute_cypher_query(
 ):
     """执行Cypher查询"""
     try:
-        # 安全检查：确保查询包含必要的过滤条件
-        if "user_id" not in cypher_query and "Entity" in cypher_query:
-            # 自动添加用户过滤条件以确保数据安全
-            cypher_query = cypher_query.replace("MATCH (n:Entity)", "MATCH (n:Entity {user_id: " + str(current_user.id) + "})")
-
+        # 服务层以只读方式执行，并校验结果只包含当前用户的图数据
         query_request = GraphQueryRequest(
             query_type="cypher",
             cypher_query=cypher_query
@@ -1,8 +1,10 @@
 """
 智能问答相关的API端点
 """
+import json
 from typing import List, Dict, Any, Optional
-from fastapi import APIRouter, Depends, HTTPException, Query, BackgroundTasks
+from fastapi import APIRouter, Depends, HTTPException, Query, BackgroundTasks, Request
+from fastapi.responses import StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
 from slowapi import limiter
 from slowapi.util import get_remote_address
@@ -24,7 +26,7 @@ router = APIRouter()
 
 # 初始化服务
 qa_service = QAService()
-rate_limiter = RateLimiter()
+rate_limiter = RateLimiter(default_algorithm="fixed")
 
 @router.post("/query", response_model=QueryResponse)
 @limiter.limit("30/minute")
@@ -73,6 +75,43 @@ async def process_query(
         logger.error(f"查询处理失败: {str(e)}")
         raise HTTPException(status_code=500, detail="查询处理失败")
 
+@router.post("/query/stream")
+@limiter.limit("30/minute")
+async def stream_query(
+    request: Request,
+    query_request: QueryRequest,
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    流式处理智能问答查询
+
+    以SSE返回：生成过程中的 delta 事件携带增量文本，最后的 answer 事件携带完整查询响应
+    """
+    user_id = current_user.id
+    if not await rate_limiter.check_limit(f"query:{user_id}", 30, 60):
+        raise HTTPException(status_code=429, detail="查询过于频繁，请稍后再试")
+
+    query_request.user_id = user_id
+    if not query_request.session_id:
+        import uuid
+        query_request.session_id = f"session_{uuid.uuid4().hex[:12]}"
+
+    async def event_stream():
+        try:
+            async for event in qa_service.stream_query(query_request):
+                if event["event"] == "delta":
+                    data = json.dumps({"content": event["content"]}, ensure_ascii=False)
+                else:
+                    data = event["response"].model_dump_json()
+                yield f"event: {event['event']}\ndata: {data}\n\n"
+        except Exception as e:
+            # 响应头已发出，以错误事件通知客户端
+            logger.error(f"流式查询处理失败: {str(e)}")
+            yield f"event: error\ndata: {json.dumps({'detail': '查询处理失败'}, ensure_ascii=False)}\n\n"
+
+    return StreamingResponse(event_stream(), media_type="text/event-stream")
+
 @router.post("/batch-query", response_model=BatchQueryResponse)
 @limiter.limit("5/minute")
 async def batch_process_queries(
@@ -26,6 +26,8 @@ class Settings(BaseSettings):
     DATABASE_URL: str
     DATABASE_POOL_SIZE: int = 10
     DATABASE_MAX_OVERFLOW: int = 20
+    DATABASE_REPLICA_URL: Optional[str] = None  # 只读副本，未配置时读写都走主库
+    DATABASE_PREPARED_STATEMENT_CACHE_SIZE: int = 500  # 每个连接缓存的预编译语句数
 
     @validator("DATABASE_URL", pre=True)
     def assemble_db_connection(cls, v: Optional[str], values: dict[str, Any]) -> str:
@@ -62,12 +64,34 @@ class Settings(BaseSettings):
 
     # 向量数据库配置
     QDRANT_URL: str = "http://localhost:6333"
+    QDRANT_HOST: str = "localhost"
+    QDRANT_PORT: int = 6333
+    QDRANT_GRPC_PORT: int = 6334
+    QDRANT_PREFER_GRPC: bool = True
     QDRANT_API_KEY: Optional[str] = None
+    QDRANT_UPSERT_BATCH_SIZE: int = 256
+    QDRANT_UPSERT_PARALLELISM: int = 4
+    QDRANT_TIMEOUT: int = 30  # 请求超时（秒）
+    QDRANT_HTTP_MAX_CONNECTIONS: int = 100  # REST连接池大小（未使用gRPC时生效）
+    QDRANT_HNSW_M: int = 16  # HNSW每个节点的边数
+    QDRANT_HNSW_EF_CONSTRUCT: int = 200  # 建索引时的候选集大小
+    QDRANT_HNSW_FULL_SCAN_THRESHOLD: int = 10000  # 过滤后点数低于该值时改为全量扫描
+    QDRANT_SEARCH_HNSW_EF: int = 64  # 搜索时的默认候选集大小
+    QDRANT_SCALAR_QUANTIZATION: bool = True  # 新建集合时启用int8标量量化
+    QDRANT_QUANTIZATION_OVERSAMPLING: float = 2.0  # 量化搜索的候选过采样倍数
 
     # 知识图谱配置
     NEO4J_URI: str = "bolt://localhost:7687"
     NEO4J_USER: str = "neo4j"
     NEO4J_PASSWORD: str
+    NEO4J_DATABASE: str = "neo4j"
+    NEO4J_MAX_CONNECTION_POOL_SIZE: int = 100
+    NEO4J_CONNECTION_ACQUISITION_TIMEOUT: float = 30.0
+
+    # 实体消解配置
+    ENTITY_RESOLUTION_ENABLED: bool = True
+    ENTITY_RESOLUTION_MODEL: str = "BAAI/bge-small-zh"
+    ENTITY_RESOLUTION_THRESHOLD: float = 0.8  # 余弦相似度阈值
 
     # 国产AI模型配置
     # 智谱AI
@@ -109,6 +133,11 @@ class Settings(BaseSettings):
     ANTHROPIC_API_KEY: Optional[str] = None
     ANTHROPIC_BASE_URL: str = "https://api.anthropic.com"
 
+    # AI接口HTTP连接配置
+    AI_HTTP_MAX_CONNECTIONS: int = 100  # 连接池总连接数
+    AI_HTTP_MAX_CONNECTIONS_PER_HOST: int = 20  # 每个提供商的并发连接数
+    AI_HTTP_KEEPALIVE_TIMEOUT: float = 60.0  # 空闲连接保持时间（秒）
+
     # 文档处理配置
     DOCUMENT_CHUNK_SIZE: int = 1000
     DOCUMENT_CHUNK_OVERLAP: int = 200
@@ -123,9 +152,20 @@ class Settings(BaseSettings):
     RAG_SIMILARITY_THRESHOLD: float = 0.7
     RAG_MAX_CONTEXT_LENGTH: int = 4000
 
+    # 问答答案缓存配置
+    QA_ANSWER_CACHE_ENABLED: bool = True
+    QA_ANSWER_CACHE_SIZE: int = 10000  # 精确缓存条目数
+    QA_ANSWER_CACHE_TTL: int = 3600  # 答案缓存（精确与语义）过期时间（秒）
+    QA_SEMANTIC_CACHE_SIZE: int = 2000  # 语义缓存条目数
+    QA_SEMANTIC_CACHE_THRESHOLD: float = 0.95  # 问题嵌入余弦相似度阈值
+    QA_CONVERSATION_CACHE_SIZE: int = 10000  # 内存中保留的会话数
+    QA_CONVERSATION_TTL: int = 3600  # 会话上下文闲置过期时间（秒）
+
     # 缓存配置
     CACHE_ENABLED: bool = True
     CACHE_TTL: int = 3600  # 1小时
+    DOCUMENT_ANALYTICS_CACHE_TTL: int = 60  # 文档分析缓存 1分钟
+    KNOWLEDGE_STATISTICS_CACHE_TTL: int = 60  # 知识图谱统计缓存 1分钟
 
     # 日志配置
     LOG_LEVEL: str = "INFO"
@@ -4,17 +4,24 @@
 from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine, async_sessionmaker
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from contextlib import asynccontextmanager
 from typing import AsyncGenerator
 import redis.asyncio as redis
 
 from app.core.config import settings
 
+# asyncpg在每个连接上缓存预编译语句，参数化的重复查询复用服务端执行计划
+_connect_args = {
+    "prepared_statement_cache_size": settings.DATABASE_PREPARED_STATEMENT_CACHE_SIZE,
+}
+
 # 异步数据库引擎
 engine = create_async_engine(
     settings.DATABASE_URL,
     pool_size=settings.DATABASE_POOL_SIZE,
     max_overflow=settings.DATABASE_MAX_OVERFLOW,
     echo=settings.DEBUG,
+    connect_args=_connect_args,
 )
 
 # 异步会话工厂
@@ -24,6 +31,21 @@ AsyncSessionLocal = async_sessionmaker(
     expire_on_commit=False,
 )
 
+# 只读副本引擎，未配置副本时复用主库引擎
+replica_engine = create_async_engine(
+    settings.DATABASE_REPLICA_URL,
+    pool_size=settings.DATABASE_POOL_SIZE,
+    max_overflow=settings.DATABASE_MAX_OVERFLOW,
+    echo=settings.DEBUG,
+    connect_args=_connect_args,
+) if settings.DATABASE_REPLICA_URL else engine
+
+ReplicaSessionLocal = async_sessionmaker(
+    replica_engine,
+    class_=AsyncSession,
+    expire_on_commit=False,
+)
+
 # 基础模型类
 Base = declarative_base()
 
@@ -58,6 +80,30 @@ async def get_db() -> AsyncGenerator[AsyncSession, None]:
         yield session
 
 
+@asynccontextmanager
+async def get_db_session() -> AsyncGenerator[AsyncSession, None]:
+    """
+    获取异步数据库会话（上下文管理器，供后台任务使用）
+
+    会话工厂设置了 expire_on_commit=False，提交后已加载的实体不会被过期重载
+    """
+    async with AsyncSessionLocal() as session:
+        try:
+            yield session
+        except Exception:
+            await session.rollback()
+            raise
+
+
+@asynccontextmanager
+async def get_read_db_session() -> AsyncGenerator[AsyncSession, None]:
+    """
+    获取只读副本会话（上下文管理器，供可容忍秒级延迟的统计查询使用）
+    """
+    async with ReplicaSessionLocal() as session:
+        yield session
+
+
 async def get_redis() -> redis.Redis:
     """
     获取Redis客户端
@@ -8,7 +8,7 @@ from typing import AsyncGenerator
 from fastapi import FastAPI, Request, status
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.middleware.trustedhost import TrustedHostMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, ORJSONResponse
 from fastapi.staticfiles import StaticFiles
 import uvicorn
 
@@ -17,10 +17,21 @@ from app.db.session import engine, Base
 from app.api.v1.api import api_router
 from app.core.logging import setup_logging
 from app.core.exceptions import setup_exception_handlers
+from app.services.knowledge_graph_service import knowledge_graph_service
+from app.services.ai_model_service import ai_model_service
+from app.utils.rate_limit import default_rate_limiter
+from app.api.v1.endpoints import qa as qa_endpoints, ai_models as ai_model_endpoints
 
 # 设置日志
 setup_logging()
 
+# 需要后台清理内存限流键的速率限制器
+RATE_LIMITERS = (
+    default_rate_limiter,
+    qa_endpoints.rate_limiter,
+    ai_model_endpoints.rate_limiter,
+)
+
 # 创建FastAPI应用实例
 app = FastAPI(
     title=settings.APP_NAME,
@@ -29,6 +40,8 @@ app = FastAPI(
     openapi_url=f"{settings.API_V1_STR}/openapi.json",
     docs_url=f"{settings.API_V1_STR}/docs",
     redoc_url=f"{settings.API_V1_STR}/redoc",
+    # 响应体统一使用orjson序列化，大型问答响应编码更快
+    default_response_class=ORJSONResponse,
     contact={
         "name": "Cost-RAG Team",
         "email": "support@cost-rag.com",
@@ -77,10 +90,21 @@ async def lifespan(app: FastAPI) -> AsyncGenerator[None, None]:
     print(f"🧠 Qdrant URL: {settings.QDRANT_URL}")
     print(f"🌐 Neo4j URL: {settings.NEO4J_URI}")
 
+    # 启动时建立Neo4j驱动（连接池），各请求共享
+    await knowledge_graph_service.connect_neo4j()
+
+    # 启动速率限制器的后台清理任务（只在启动时启动一次，不在每次检查时判断）
+    for rate_limiter in RATE_LIMITERS:
+        rate_limiter.start()
+
     yield
 
     # 关闭时执行
     print("🛑 Cost-RAG API is shutting down...")
+    await knowledge_graph_service.disconnect_neo4j()
+    await ai_model_service.close()
+    for rate_limiter in RATE_LIMITERS:
+        await rate_limiter.close()
 
 
 # 设置生命周期
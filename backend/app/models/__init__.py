@@ -5,13 +5,13 @@
 from .user import User
 from .project import Project, CostEstimate, CostItem, ProjectType
 from .document import Document, DocumentChunk
-from .knowledge import KnowledgeNode, KnowledgeRelation, KnowledgePath
+from .knowledge import KnowledgeNode, KnowledgeRelation, KnowledgePath, KnowledgeUserStats
 from .query import QueryHistory, QueryResult, UserFeedback
 
 __all__ = [
     "User",
     "Project", "ProjectType", "CostEstimate", "CostItem",
     "Document", "DocumentChunk",
-    "KnowledgeNode", "KnowledgeRelation", "KnowledgePath",
+    "KnowledgeNode", "KnowledgeRelation", "KnowledgePath", "KnowledgeUserStats",
     "QueryHistory", "QueryResult", "UserFeedback"
 ]
\ No newline at end of file
@@ -1,9 +1,9 @@
 """
 文档管理数据模型
 """
-from sqlalchemy import Column, Integer, String, Float, DateTime, Text, JSON, Boolean, ForeignKey, LargeBinary
-from sqlalchemy.sql import func
-from sqlalchemy.orm import relationship
+from sqlalchemy import Column, Integer, String, Float, DateTime, Text, JSON, Boolean, ForeignKey, LargeBinary, Index
+from sqlalchemy.sql import func, text
+from sqlalchemy.orm import relationship, synonym
 from sqlalchemy.dialects.postgresql import ARRAY, UUID
 import uuid
 
@@ -24,6 +24,7 @@ class Document(Base):
     file_name = Column(String(255), nullable=False)
     file_path = Column(String(1000), nullable=False)
     file_size = Column(Float, nullable=False)  # 文件大小（字节）
+    file_hash = Column(String(64), nullable=True)  # 文件内容哈希，用于去重
 
     # 文件类型和格式
     mime_type = Column(String(100), nullable=False)
@@ -55,6 +56,7 @@ class Document(Base):
     is_public = Column(Boolean, default=False)
     access_level = Column(String(20), default="private")  # private, team, public
     allowed_users = Column(ARRAY(Integer), nullable=True)
+    is_active = Column(Boolean, default=True)  # 软删除标记
 
     # 元数据
     metadata = Column(JSON, nullable=True)  # 文档元数据
@@ -63,6 +65,7 @@ class Document(Base):
 
     # 上传信息
     uploaded_by = Column(Integer, ForeignKey("users.id"), nullable=False)
+    user_id = synonym("uploaded_by")
     upload_ip = Column(String(45), nullable=True)
     upload_source = Column(String(50), nullable=True)  # web, api, batch
 
@@ -92,6 +95,15 @@ class Document(Base):
     parent_document = relationship("Document", remote_side=[id])
     child_documents = relationship("Document", remote_side=[parent_document_id])
 
+    __table_args__ = (
+        Index('idx_documents_tags_gin', 'tags', postgresql_using='gin'),
+        # 同一用户的有效文档按内容哈希唯一，配合 INSERT ... ON CONFLICT 去重
+        Index(
+            'uq_documents_owner_file_hash', 'uploaded_by', 'file_hash',
+            unique=True, postgresql_where=text('is_active')
+        ),
+    )
+
     def __repr__(self):
         return f"<Document(id={self.id}, title='{self.title}', status='{self.status}')>"
 
@@ -1,10 +1,10 @@
 """
 知识图谱数据模型
 """
-from sqlalchemy import Column, Integer, String, Float, DateTime, Text, JSON, Boolean, ForeignKey, Index
+from sqlalchemy import Column, Integer, String, Float, DateTime, Text, JSON, Boolean, ForeignKey, Index, DDL, event
 from sqlalchemy.sql import func
-from sqlalchemy.orm import relationship
-from sqlalchemy.dialects.postgresql import ARRAY
+from sqlalchemy.orm import relationship, synonym
+from sqlalchemy.dialects.postgresql import ARRAY, JSONB
 from datetime import datetime, timezone
 
 from app.db.session import Base
@@ -20,6 +20,7 @@ class KnowledgeNode(Base):
     # 节点基本信息
     name = Column(String(500), nullable=False, index=True)
     node_type = Column(String(100), nullable=False, index=True)  # 材料、工艺、规范、项目等
+    type = synonym("node_type")
     category = Column(String(100), nullable=True)  # 子分类
     alias = Column(ARRAY(String), nullable=True)  # 别名
 
@@ -28,6 +29,9 @@ class KnowledgeNode(Base):
     definition = Column(Text, nullable=True)  # 标准定义
     properties = Column(JSON, nullable=True)  # 属性信息
 
+    # 所属用户
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=True)
+
     # 向量数据
     embedding_vector = Column(ARRAY(Float), nullable=True)  # 嵌入向量
     embedding_model = Column(String(100), nullable=True)
@@ -42,6 +46,7 @@ class KnowledgeNode(Base):
     source_type = Column(String(50), nullable=True)  # document, manual, api
     source_id = Column(Integer, nullable=True)  # 源ID
     source_url = Column(String(1000), nullable=True)
+    source = Column(String(500), nullable=True)  # 来源描述，如 document_{文档ID}_chunk_{分块ID}
     extraction_date = Column(DateTime(timezone=True), nullable=True)
 
     # 统计信息
@@ -65,7 +70,7 @@ class KnowledgeNode(Base):
     last_accessed_at = Column(DateTime(timezone=True), nullable=True)
 
     # 关系
-    verified_user = relationship("User")
+    verified_user = relationship("User", foreign_keys=[verified_by])
     outgoing_relations = relationship(
         "KnowledgeRelation",
         foreign_keys="KnowledgeRelation.source_node_id",
@@ -79,6 +84,18 @@ class KnowledgeNode(Base):
         cascade="all, delete-orphan"
     )
 
+    # 复合索引
+    __table_args__ = (
+        # 按用户分组统计类型时走仅索引扫描
+        Index('idx_node_user_type', 'user_id', 'node_type'),
+        Index('idx_node_type_name', 'node_type', 'name'),
+        # 名称子串检索（ILIKE '%term%'）走三元组索引，需要pg_trgm扩展
+        Index(
+            'idx_node_name_trgm', 'name',
+            postgresql_using='gin', postgresql_ops={'name': 'gin_trgm_ops'}
+        ),
+    )
+
     def __repr__(self):
         return f"<KnowledgeNode(id={self.id}, name='{self.name}', type='{self.node_type}')>"
 
@@ -117,6 +134,7 @@ class KnowledgeRelation(Base):
 
     # 关系类型和方向
     relation_type = Column(String(100), nullable=False, index=True)  # 包含、属于、依赖、相关等
+    type = synonym("relation_type")
     relation_subtype = Column(String(100), nullable=True)  # 子类型
     direction = Column(String(20), default="directed")  # directed, undirected, bidirectional
 
@@ -125,6 +143,9 @@ class KnowledgeRelation(Base):
     weight = Column(Float, default=1.0)  # 关系权重
     strength = Column(Float, nullable=True)  # 关系强度 0-1
 
+    # 所属用户
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=True)
+
     # 置信度和质量
     confidence = Column(Float, nullable=True)  # 置信度 0-1
     reliability = Column(String(20), default="medium")  # high, medium, low
@@ -132,6 +153,7 @@ class KnowledgeRelation(Base):
     # 来源信息
     source_type = Column(String(50), nullable=True)  # document, manual, api
     source_id = Column(Integer, nullable=True)
+    source = Column(String(500), nullable=True)  # 来源描述，如 document_{文档ID}_chunk_{分块ID}
     extraction_method = Column(String(100), nullable=True)  # 提取方法
 
     # 上下文信息
@@ -160,12 +182,13 @@ class KnowledgeRelation(Base):
     # 关系
     source_node = relationship("KnowledgeNode", foreign_keys=[source_node_id], back_populates="outgoing_relations")
     target_node = relationship("KnowledgeNode", foreign_keys=[target_node_id], back_populates="incoming_relations")
-    verified_user = relationship("User")
+    verified_user = relationship("User", foreign_keys=[verified_by])
 
     # 复合索引
     __table_args__ = (
         Index('idx_relation_nodes_type', 'source_node_id', 'target_node_id', 'relation_type'),
         Index('idx_relation_type_weight', 'relation_type', 'weight'),
+        Index('idx_relation_user_type', 'user_id', 'relation_type'),
     )
 
     def __repr__(self):
@@ -243,4 +266,103 @@ class KnowledgePath(Base):
     @property
     def relation_types(self) -> list:
         """获取关系类型列表"""
-        return self.relation_sequence if self.relation_sequence else []
\ No newline at end of file
+        return self.relation_sequence if self.relation_sequence else []
+
+class KnowledgeUserStats(Base):
+    """用户知识图谱统计模型（由触发器随节点、关系的增删增量维护）"""
+
+    __tablename__ = "kg_user_stats"
+
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+
+    # 计数
+    total_nodes = Column(Integer, nullable=False, default=0)
+    total_relations = Column(Integer, nullable=False, default=0)
+    node_types = Column(JSONB, nullable=False, default=dict)  # 类型 -> 节点数
+    relation_types = Column(JSONB, nullable=False, default=dict)  # 类型 -> 关系数
+
+    # 时间戳
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+    def __repr__(self):
+        return f"<KnowledgeUserStats(user_id={self.user_id}, nodes={self.total_nodes}, relations={self.total_relations})>"
+
+
+# 节点名称的三元组索引使用 gin_trgm_ops 操作符类，建表前先启用 pg_trgm 扩展
+event.listen(
+    Base.metadata, "before_create",
+    DDL("CREATE EXTENSION IF NOT EXISTS pg_trgm").execute_if(dialect="postgresql")
+)
+
+# 统计行重建与触发器增量维护通过同一用户的事务级咨询锁串行化：
+# 重建持锁期间的增删会等待其提交后再更新统计行，不会在快照与写入之间丢失
+KG_USER_STATS_LOCK_CLASS = 20315
+
+# 统计计数触发器：只更新已存在的统计行，缺失的行由服务首次查询时全量计算后写入
+_BUMP_TYPE_COUNT_FUNCTION = """
+CREATE OR REPLACE FUNCTION kg_bump_type_count(counts jsonb, type_name text, delta integer)
+RETURNS jsonb AS $$
+    SELECT CASE
+        WHEN COALESCE((counts ->> type_name)::integer, 0) + delta > 0
+            THEN counts || jsonb_build_object(type_name, COALESCE((counts ->> type_name)::integer, 0) + delta)
+        ELSE counts - type_name
+    END
+$$ LANGUAGE sql IMMUTABLE
+"""
+
+_STATS_TRIGGER_FUNCTION = """
+CREATE OR REPLACE FUNCTION {function}() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'UPDATE'
+        AND OLD.{type_column} IS NOT DISTINCT FROM NEW.{type_column}
+        AND OLD.user_id IS NOT DISTINCT FROM NEW.user_id THEN
+        RETURN NULL;
+    END IF;
+    IF TG_OP IN ('DELETE', 'UPDATE') AND OLD.user_id IS NOT NULL THEN
+        PERFORM pg_advisory_xact_lock({lock_class}, OLD.user_id);
+        UPDATE kg_user_stats
+        SET {total_column} = {total_column} - 1,
+            {types_column} = kg_bump_type_count({types_column}, OLD.{type_column}, -1),
+            updated_at = now()
+        WHERE user_id = OLD.user_id;
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') AND NEW.user_id IS NOT NULL THEN
+        PERFORM pg_advisory_xact_lock({lock_class}, NEW.user_id);
+        UPDATE kg_user_stats
+        SET {total_column} = {total_column} + 1,
+            {types_column} = kg_bump_type_count({types_column}, NEW.{type_column}, 1),
+            updated_at = now()
+        WHERE user_id = NEW.user_id;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql
+"""
+
+_STATS_TRIGGER = """
+CREATE OR REPLACE TRIGGER {trigger}
+AFTER INSERT OR DELETE OR UPDATE OF {type_column}, user_id ON {table}
+FOR EACH ROW EXECUTE FUNCTION {function}()
+"""
+
+# 全部语句可重复执行，既用于建表后安装，也用于已有数据库的升级脚本
+KG_USER_STATS_DDL = [_BUMP_TYPE_COUNT_FUNCTION]
+for _table, _total_column, _types_column, _type_column in (
+    ("knowledge_nodes", "total_nodes", "node_types", "node_type"),
+    ("knowledge_relations", "total_relations", "relation_types", "relation_type"),
+):
+    _function = f"kg_user_stats_on_{_table}_change"
+    KG_USER_STATS_DDL.append(_STATS_TRIGGER_FUNCTION.format(
+        function=_function, total_column=_total_column, types_column=_types_column,
+        type_column=_type_column, lock_class=KG_USER_STATS_LOCK_CLASS
+    ))
+    KG_USER_STATS_DDL.append(_STATS_TRIGGER.format(
+        trigger=f"trg_kg_user_stats_{_table}", table=_table,
+        type_column=_type_column, function=_function
+    ))
+
+for _statement in KG_USER_STATS_DDL:
+    event.listen(
+        Base.metadata, "after_create",
+        DDL(_statement).execute_if(dialect="postgresql")
+    )
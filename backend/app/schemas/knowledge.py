@@ -239,6 +239,11 @@ class GraphQueryRequest(BaseModel):
     target_node_id: Optional[int] = Field(None, description="目标节点ID")
     min_confidence: Optional[float] = Field(None, ge=0.0, le=1.0, description="最小置信度")
     limit: Optional[int] = Field(20, ge=1, le=100, description="返回数量限制")
+    offset: int = Field(0, ge=0, description="结果偏移量")
+    min_length: int = Field(1, ge=1, le=10, description="路径最小长度")
+    max_length: int = Field(4, ge=1, le=10, description="路径最大长度")
+    relation_types: Optional[List[RelationType]] = Field(None, description="路径允许经过的关系类型")
+    include_total: bool = Field(True, description="是否统计结果总数，不统计时total为已返回的结果数")
     cypher_query: Optional[str] = Field(None, description="Cypher查询语句")
 
 
@@ -258,7 +263,10 @@ class GraphQueryResult(BaseModel):
     total: int = Field(..., description="结果总数")
     nodes: Optional[List[Dict[str, Any]]] = Field(None, description="节点列表")
     relations: Optional[List[Dict[str, Any]]] = Field(None, description="关系列表")
-    paths: Optional[List[Dict[str, Any]]] = Field(None, description="路径列表")
+    paths: Optional[List[Dict[str, Any]]] = Field(
+        None,
+        description="路径列表，每条路径的nodes、relations按列组织，如 nodes: {id: [...], name: [...], type: [...]}"
+    )
     records: Optional[List[Dict[str, Any]]] = Field(None, description="查询记录")
     execution_time: float = Field(..., description="执行时间（秒）")
 
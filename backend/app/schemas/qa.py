@@ -79,6 +79,9 @@ class RetrievedDocument(BaseModel):
     chunks: List[Dict[str, Any]]
     metadata: Dict[str, Any]
 
+    class Config:
+        frozen = True
+
 
 class RetrievedKnowledge(BaseModel):
     """检索到的知识"""
@@ -90,6 +93,9 @@ class RetrievedKnowledge(BaseModel):
     relevance_score: float
     explanation: str
 
+    class Config:
+        frozen = True
+
 
 class RetrievedCostData(BaseModel):
     """检索到的成本数据"""
@@ -103,6 +109,9 @@ class RetrievedCostData(BaseModel):
     relevance_score: float
     source: str
 
+    class Config:
+        frozen = True
+
 
 class RetrievalResult(BaseModel):
     """检索结果"""
@@ -113,6 +122,7 @@ class RetrievalResult(BaseModel):
     total_retrieved: int = Field(0, description="总检索数量")
     processing_time: float = Field(..., description="处理时间（秒）")
     retrieval_method: str = Field(..., description="检索方法")
+    fingerprint: Optional[str] = Field(None, description="检索结果指纹，相同的检索结果指纹相同")
 
 
 class AnswerGenerationRequest(BaseModel):
@@ -4,7 +4,7 @@ AI模型服务模块 - 集成7个主要国产AI厂商接口
 import asyncio
 import json
 import aiohttp
-from typing import List, Dict, Any, Optional, Union
+from typing import List, Dict, Any, Optional, Union, AsyncIterator
 from datetime import datetime
 from enum import Enum
 import hashlib
@@ -35,6 +35,10 @@ class AIModelType(str, Enum):
     AUDIO = "audio"  # 音频模型
 
 
+# 提供OpenAI兼容SSE流式对话接口的提供商
+STREAM_PROVIDERS = {AIProvider.ZHIPUAI, AIProvider.MOONSHOT, AIProvider.DEEPSEEK, AIProvider.YI}
+
+
 class AIModelService:
     """AI模型服务类"""
 
@@ -129,9 +133,16 @@ class AIModelService:
         }
 
     async def _get_session(self):
-        """获取HTTP会话"""
+        """获取HTTP会话（各次请求共享，批量请求复用已建立的长连接）"""
         if self.session is None or self.session.closed:
-            self.session = aiohttp.ClientSession(timeout=self.timeout)
+            connector = aiohttp.TCPConnector(
+                limit=settings.AI_HTTP_MAX_CONNECTIONS,
+                limit_per_host=settings.AI_HTTP_MAX_CONNECTIONS_PER_HOST,
+                keepalive_timeout=settings.AI_HTTP_KEEPALIVE_TIMEOUT,
+                ttl_dns_cache=300,
+                enable_cleanup_closed=True
+            )
+            self.session = aiohttp.ClientSession(timeout=self.timeout, connector=connector)
         return self.session
 
     async def _close_session(self):
@@ -312,6 +323,80 @@ class AIModelService:
             logger.error(f"对话补全API调用失败: {str(e)}")
             raise
 
+    async def chat_completion_stream(
+        self,
+        provider: AIProvider,
+        messages: List[Dict[str, str]],
+        model: Optional[str] = None,
+        temperature: float = 0.7,
+        max_tokens: Optional[int] = None,
+        **kwargs
+    ) -> AsyncIterator[str]:
+        """
+        流式对话补全API调用
+
+        Args:
+            provider: AI提供商（需支持OpenAI兼容的SSE接口）
+            messages: 对话消息列表
+            model: 模型名称
+            temperature: 温度参数
+            max_tokens: 最大令牌数
+            **kwargs: 其他参数
+
+        Yields:
+            增量生成的文本片段
+        """
+        if provider not in STREAM_PROVIDERS:
+            raise ValueError(f"提供商 {provider.value} 不支持流式对话")
+
+        session = await self._get_session()
+        provider_config = self.providers[provider]
+
+        if not model:
+            available_models = provider_config["models"].get(AIModelType.CHAT, [])
+            model = available_models[0] if available_models else None
+
+        if not model:
+            raise ValueError(f"提供商 {provider.value} 没有可用的对话模型")
+
+        request_data = {
+            "model": model,
+            "messages": messages,
+            "temperature": temperature,
+            "max_tokens": max_tokens,
+            "stream": True,
+            **kwargs
+        }
+
+        async with session.post(
+            f"{provider_config['base_url']}/chat/completions",
+            headers=provider_config["headers"].copy(),
+            json=request_data
+        ) as response:
+            if response.status != 200:
+                error_text = await response.text()
+                logger.error(f"AI流式API调用失败: {response.status} - {error_text}")
+                raise aiohttp.ClientResponseError(
+                    request_info=response.request_info,
+                    history=response.history,
+                    status=response.status,
+                    message=error_text
+                )
+
+            # 逐行读取SSE事件，每个data行携带一个增量片段
+            async for line in response.content:
+                line = line.decode("utf-8").strip()
+                if not line.startswith("data:"):
+                    continue
+
+                data = line[len("data:"):].strip()
+                if data == "[DONE]":
+                    break
+
+                delta = json.loads(data).get("choices", [{}])[0].get("delta", {}).get("content")
+                if delta:
+                    yield delta
+
     async def text_embedding(
         self,
         provider: AIProvider,
@@ -631,6 +716,10 @@ class AIModelService:
                 "error": str(e)
             }
 
+    async def close(self):
+        """关闭共享的HTTP连接池"""
+        await self._close_session()
+
     async def __aenter__(self):
         """异步上下文管理器入口"""
         return self
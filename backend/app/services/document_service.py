@@ -2,12 +2,17 @@
 文档服务层 - 业务逻辑处理
 """
 import os
+import asyncio
+import json
+import mimetypes
 import shutil
+from operator import itemgetter
 from pathlib import Path
 from datetime import datetime
 from typing import Optional, List, Dict, Any, Tuple
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, and_, or_, func, desc
+from sqlalchemy import select, update, and_, or_, func, desc
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 from fastapi import UploadFile, HTTPException
 import numpy as np
 
@@ -15,12 +20,14 @@ from app.models.document import Document, DocumentChunk
 from app.models.user import User
 from app.schemas.document import (
     DocumentCreate, DocumentUpdate, DocumentSearchRequest,
-    VectorSearchRequest, DocumentProcessingStatus
+    VectorSearchRequest, VectorSearchResult
 )
 from app.services.document_processor import document_processor
 from app.services.vector_service import vector_service
+from app.utils.similarity import cosine_scores
 from app.core.config import settings
 from app.core.logging import logger
+from app.db.session import redis_client
 
 
 class DocumentService:
@@ -67,37 +74,41 @@ class DocumentService:
             # 4. 计算文件哈希
             file_hash = await document_processor._calculate_file_hash(file_path)
 
-            # 5. 检查是否已存在相同文件
-            existing_doc = await self._get_document_by_hash(file_hash, user_id, db)
-            if existing_doc:
-                # 删除文件
-                os.remove(file_path)
-                raise HTTPException(status_code=409, detail="文件已存在")
-
-            # 6. 创建文档记录
-            document = Document(
-                user_id=user_id,
-                title=document_data.title,
-                description=document_data.description,
-                category=document_data.category,
-                tags=document_data.tags or [],
-                project_id=document_data.project_id,
-                is_public=document_data.is_public,
-                file_hash=file_hash,
-                file_path=str(file_path),
-                processing_status=DocumentProcessingStatus(
+            # 5. 创建文档记录，(user_id, file_hash) 唯一索引保证并发上传不会重复插入
+            stmt = (
+                pg_insert(Document)
+                .values(
+                    uploaded_by=user_id,
+                    title=document_data.title,
+                    description=document_data.description,
+                    category=document_data.category,
+                    tags=document_data.tags or [],
+                    is_public=document_data.is_public,
+                    file_name=file.filename,
+                    file_path=str(file_path),
+                    file_size=validation_result['file_size'],
+                    file_hash=file_hash,
+                    mime_type=mimetypes.guess_type(file.filename)[0] or "application/octet-stream",
+                    file_extension=validation_result['file_type'],
                     status="pending",
-                    progress=0.0,
-                    started_at=datetime.utcnow()
+                    processing_progress=0.0
                 )
+                .on_conflict_do_nothing(
+                    index_elements=[Document.uploaded_by, Document.file_hash],
+                    index_where=Document.is_active == True
+                )
+                .returning(Document)
             )
-
-            db.add(document)
+            document = await db.scalar(stmt)
+            if document is None:
+                # 删除文件
+                os.remove(file_path)
+                raise HTTPException(status_code=409, detail="文件已存在")
             await db.commit()
-            await db.refresh(document)
 
-            # 7. 异步处理文档
+            # 6. 异步处理文档
             await self._process_document_async(document.id, file_path, file.filename)
+            await self._invalidate_analytics_cache(user_id)
 
             logger.info(f"文档上传成功: {file.filename}, ID: {document.id}")
             return document
@@ -141,7 +152,7 @@ class DocumentService:
 
         async with get_db_session() as db:
             try:
-                # 获取文档记录
+                # 获取文档记录（会话不在提交时过期实体，后续读取无需重新加载）
                 result = await db.execute(select(Document).where(Document.id == document_id))
                 document = result.scalar_one_or_none()
                 if not document:
@@ -149,37 +160,44 @@ class DocumentService:
                     return
 
                 # 更新处理状态
-                document.processing_status.status = "processing"
-                document.processing_status.progress = 0.1
-                await db.commit()
+                await self._update_processing_state(
+                    db, document_id,
+                    status="processing",
+                    processing_progress=0.1
+                )
 
                 # 处理文档
                 process_result = await document_processor.process_document(file_path, filename)
 
                 if process_result['processing_status'] == 'error':
                     # 处理失败
-                    document.processing_status.status = "failed"
-                    document.processing_status.error_message = process_result.get('error_message', '未知错误')
-                    document.processing_status.progress = 0.0
-                    document.processing_status.completed_at = datetime.utcnow()
-                    await db.commit()
+                    await self._update_processing_state(
+                        db, document_id,
+                        status="failed",
+                        error_message=process_result.get('error_message', '未知错误'),
+                        processing_progress=0.0,
+                        processed_at=datetime.utcnow()
+                    )
                     return
 
                 # 更新文档信息
-                document.metadata = process_result.get('metadata', {})
-                document.total_length = process_result.get('total_length', 0)
-                document.chunk_count = process_result.get('chunk_count', 0)
-                document.processing_status.progress = 0.8
-                await db.commit()
+                document_metadata = process_result.get('metadata', {})
+                await self._update_processing_state(
+                    db, document_id,
+                    metadata=document_metadata,
+                    char_count=process_result.get('total_length', 0),
+                    chunk_count=process_result.get('chunk_count', 0),
+                    processing_progress=0.8
+                )
 
                 # 保存文档分块
                 chunks = process_result.get('chunks', [])
                 embeddings = process_result.get('embeddings')
 
                 if chunks and embeddings is not None:
-                    # 保存分块到数据库
-                    for chunk in chunks:
-                        document_chunk = DocumentChunk(
+                    # 保存分块到数据库，保留实体引用以便回填向量ID
+                    db_chunks = [
+                        DocumentChunk(
                             document_id=document_id,
                             chunk_index=chunk['chunk_index'],
                             content=chunk['content'],
@@ -188,8 +206,9 @@ class DocumentService:
                             word_count=chunk.get('word_count', 0),
                             char_count=chunk.get('char_count', 0)
                         )
-                        db.add(document_chunk)
-
+                        for chunk in chunks
+                    ]
+                    db.add_all(db_chunks)
                     await db.commit()
 
                     # 向量化并存储
@@ -197,11 +216,12 @@ class DocumentService:
                         await vector_service.connect()
                         metadata = {
                             'document_id': document_id,
+                            'user_id': document.user_id,
                             'title': document.title,
                             'category': document.category,
                             'tags': document.tags,
-                            'file_type': document.metadata.get('file_type', ''),
-                            **document.metadata
+                            'file_type': document_metadata.get('file_type', ''),
+                            **document_metadata
                         }
 
                         vector_ids = await vector_service.add_document_vectors(
@@ -212,19 +232,8 @@ class DocumentService:
                         )
 
                         # 更新分块的向量ID
-                        for i, chunk in enumerate(chunks):
-                            if i < len(vector_ids):
-                                result = await db.execute(
-                                    select(DocumentChunk).where(
-                                        and_(
-                                            DocumentChunk.document_id == document_id,
-                                            DocumentChunk.chunk_index == chunk['chunk_index']
-                                        )
-                                    )
-                                )
-                                db_chunk = result.scalar_one_or_none()
-                                if db_chunk:
-                                    db_chunk.vector_id = vector_ids[i]
+                        for db_chunk, vector_id in zip(db_chunks, vector_ids):
+                            db_chunk.vector_id = vector_id
 
                         await db.commit()
 
@@ -233,21 +242,35 @@ class DocumentService:
                         # 向量化失败不影响文档处理完成
 
                 # 标记处理完成
-                document.processing_status.status = "completed"
-                document.processing_status.progress = 1.0
-                document.processing_status.completed_at = datetime.utcnow()
-                await db.commit()
+                await self._update_processing_state(
+                    db, document_id,
+                    status="completed",
+                    processing_progress=1.0,
+                    processed_at=datetime.utcnow()
+                )
 
                 logger.info(f"文档处理完成: {document_id}")
 
             except Exception as e:
                 logger.error(f"文档处理失败 {document_id}: {str(e)}")
                 # 标记处理失败
-                if document:
-                    document.processing_status.status = "failed"
-                    document.processing_status.error_message = str(e)
-                    document.processing_status.completed_at = datetime.utcnow()
-                    await db.commit()
+                await db.rollback()
+                await self._update_processing_state(
+                    db, document_id,
+                    status="failed",
+                    error_message=str(e),
+                    processed_at=datetime.utcnow()
+                )
+
+    async def _update_processing_state(self, db: AsyncSession, document_id: int, **values):
+        """以单条UPDATE语句更新文档处理状态，不经过ORM脏检查与重载"""
+        await db.execute(
+            update(Document)
+            .where(Document.id == document_id)
+            .values(**values)
+            .execution_options(synchronize_session=False)
+        )
+        await db.commit()
 
     async def get_document(
         self,
@@ -342,6 +365,7 @@ class DocumentService:
         document.updated_at = datetime.utcnow()
         await db.commit()
         await db.refresh(document)
+        await self._invalidate_analytics_cache(user_id)
 
         return document
 
@@ -370,6 +394,7 @@ class DocumentService:
         document.is_active = False
         document.updated_at = datetime.utcnow()
         await db.commit()
+        await self._invalidate_analytics_cache(user_id)
 
         # 删除向量数据
         try:
@@ -417,16 +442,13 @@ class DocumentService:
             query = query.where(Document.project_id == search_request.project_id)
 
         if search_request.tags:
-            for tag in search_request.tags:
-                query = query.where(Document.tags.contains([tag]))
+            # 单次 @> 包含判断，命中 tags 上的 GIN 索引
+            query = query.where(Document.tags.contains(search_request.tags))
 
         if search_request.file_types:
-            file_type_conditions = []
-            for file_type in search_request.file_types:
-                file_type_conditions.append(
-                    Document.metadata['file_type'].astext == file_type
-                )
-            query = query.where(or_(*file_type_conditions))
+            query = query.where(
+                Document.metadata['file_type'].astext.in_(search_request.file_types)
+            )
 
         if search_request.date_from:
             query = query.where(Document.created_at >= search_request.date_from)
@@ -439,32 +461,56 @@ class DocumentService:
         result = await db.execute(query)
         documents = result.scalars().all()
 
+        # 有查询词时在本地对候选文档做语义相关性打分，编码放到线程中避免阻塞事件循环
+        relevance_scores = None
+        if search_request.query and documents:
+            relevance_scores = await asyncio.to_thread(
+                self._score_documents, search_request.query, documents
+            )
+
         # 转换为搜索结果格式
-        search_results = []
-        for doc in documents:
-            search_results.append({
-                'document_id': doc.id,
-                'title': doc.title,
-                'description': doc.description,
-                'category': doc.category,
-                'tags': doc.tags,
-                'file_type': doc.metadata.get('file_type', '') if doc.metadata else '',
-                'file_size': doc.metadata.get('file_size', 0) if doc.metadata else 0,
-                'processing_status': doc.processing_status.status,
-                'chunk_count': doc.chunk_count,
-                'created_at': doc.created_at,
-                'updated_at': doc.updated_at,
-                'relevance_score': 1.0  # 简化处理
-            })
+        scores = relevance_scores.tolist() if relevance_scores is not None else [1.0] * len(documents)
+        search_results = [
+            self._to_search_result(doc, score)
+            for doc, score in zip(documents, scores)
+        ]
+
+        if relevance_scores is not None:
+            search_results.sort(key=itemgetter('relevance_score'), reverse=True)
 
         return search_results
 
+    @staticmethod
+    def _to_search_result(doc: Document, relevance_score: float) -> Dict[str, Any]:
+        """文档行转换为搜索结果"""
+        metadata = doc.metadata or {}
+        return {
+            'document_id': doc.id,
+            'title': doc.title,
+            'description': doc.description,
+            'category': doc.category,
+            'tags': doc.tags,
+            'file_type': metadata.get('file_type', ''),
+            'file_size': metadata.get('file_size', 0),
+            'processing_status': doc.processing_status.status,
+            'chunk_count': doc.chunk_count,
+            'created_at': doc.created_at,
+            'updated_at': doc.updated_at,
+            'relevance_score': relevance_score
+        }
+
+    def _score_documents(self, query: str, documents: List[Document]) -> np.ndarray:
+        """一次性编码查询与候选文档，计算余弦相关性"""
+        texts = [f"{doc.title} {doc.description or ''}" for doc in documents]
+        vectors = document_processor.embedding_model.encode([query] + texts)
+        return cosine_scores(vectors[0], vectors[1:])
+
     async def vector_search(
         self,
         search_request: VectorSearchRequest,
         user_id: int,
         db: AsyncSession
-    ) -> List[Dict[str, Any]]:
+    ) -> List[VectorSearchResult]:
         """向量搜索"""
         try:
             # 连接向量数据库
@@ -488,47 +534,59 @@ class DocumentService:
                 filters=filters
             )
 
-            # 获取文档信息
-            results = []
-            for result in vector_results:
-                payload = result['payload']
-                document_id = payload.get('document_id')
-
-                # 验证文档权限
+            # 一次查询验证所有命中文档的权限
+            document_ids = {result['payload'].get('document_id') for result in vector_results}
+            documents = {}
+            if document_ids:
                 doc_result = await db.execute(
                     select(Document).where(
                         and_(
-                            Document.id == document_id,
+                            Document.id.in_(document_ids),
                             Document.user_id == user_id,
                             Document.is_active == True
                         )
                     )
                 )
-                document = doc_result.scalar_one_or_none()
-
-                if document:
-                    results.append({
-                        'document_id': document_id,
-                        'chunk_index': payload.get('chunk_index', 0),
-                        'content': payload.get('content', ''),
-                        'relevance_score': result['score'],
-                        'metadata': {
-                            'title': document.title,
-                            'category': document.category,
-                            'file_type': payload.get('file_type', ''),
-                            'char_count': payload.get('char_count', 0),
-                            'word_count': payload.get('word_count', 0)
-                        }
-                    })
+                documents = {doc.id: doc for doc in doc_result.scalars()}
 
-            return results
+            return [
+                self._to_vector_search_result(result, documents[result['payload'].get('document_id')])
+                for result in vector_results
+                if result['payload'].get('document_id') in documents
+            ]
 
         except Exception as e:
             logger.error(f"向量搜索失败: {str(e)}")
             return []
 
+    @staticmethod
+    def _to_vector_search_result(result: Dict[str, Any], document: Document) -> VectorSearchResult:
+        """向量命中转换为搜索结果"""
+        payload = result['payload']
+        return VectorSearchResult(
+            document_id=document.id,
+            chunk_index=payload.get('chunk_index', 0),
+            content=payload.get('content', ''),
+            relevance_score=result['score'],
+            metadata={
+                'title': document.title,
+                'category': document.category,
+                'file_type': payload.get('file_type', ''),
+                'char_count': payload.get('char_count', 0),
+                'word_count': payload.get('word_count', 0)
+            }
+        )
+
     async def get_document_analytics(self, user_id: int, db: AsyncSession) -> Dict[str, Any]:
-        """获取文档分析数据"""
+        """获取文档分析数据（结果按用户缓存在Redis中，短TTL）"""
+        cache_key = self._analytics_cache_key(user_id)
+        try:
+            cached = await redis_client.get(cache_key)
+            if cached:
+                return json.loads(cached)
+        except Exception as e:
+            logger.warning(f"读取文档分析缓存失败: {str(e)}")
+
         try:
             # 基础统计
             total_docs_query = select(func.count(Document.id)).where(
@@ -639,7 +697,7 @@ class DocumentService:
             size_result = await db.execute(size_query)
             total_size = size_result.scalar() or 0
 
-            return {
+            analytics = {
                 'total_documents': total_documents,
                 'total_size': total_size,
                 'file_type_distribution': file_type_distribution,
@@ -649,6 +707,17 @@ class DocumentService:
                 'popular_tags': popular_tags
             }
 
+            try:
+                await redis_client.setex(
+                    cache_key,
+                    settings.DOCUMENT_ANALYTICS_CACHE_TTL,
+                    json.dumps(analytics, default=str)
+                )
+            except Exception as e:
+                logger.warning(f"写入文档分析缓存失败: {str(e)}")
+
+            return analytics
+
         except Exception as e:
             logger.error(f"获取文档分析失败: {str(e)}")
             return {
@@ -661,23 +730,17 @@ class DocumentService:
                 'popular_tags': []
             }
 
-    async def _get_document_by_hash(
-        self,
-        file_hash: str,
-        user_id: int,
-        db: AsyncSession
-    ) -> Optional[Document]:
-        """根据文件哈希获取文档"""
-        result = await db.execute(
-            select(Document).where(
-                and_(
-                    Document.file_hash == file_hash,
-                    Document.user_id == user_id,
-                    Document.is_active == True
-                )
-            )
-        )
-        return result.scalar_one_or_none()
+    @staticmethod
+    def _analytics_cache_key(user_id: int) -> str:
+        """文档分析缓存键"""
+        return f"doc:analytics:{user_id}"
+
+    async def _invalidate_analytics_cache(self, user_id: int):
+        """文档变更后失效分析缓存"""
+        try:
+            await redis_client.delete(self._analytics_cache_key(user_id))
+        except Exception as e:
+            logger.warning(f"清除文档分析缓存失败: {str(e)}")
 
 
 # 全局文档服务实例
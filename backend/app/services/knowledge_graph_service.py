@@ -2,20 +2,33 @@
 知识图谱服务模块 - 实体识别、关系抽取和图谱构建
 """
 import asyncio
+import base64
+import hashlib
 import json
 import re
-from typing import List, Dict, Any, Optional, Tuple, Set
-from datetime import datetime
+from bisect import bisect_left, bisect_right
+from operator import itemgetter
+from typing import List, Dict, Any, Optional, Tuple, Set, AsyncIterator
+from datetime import datetime, timezone
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, and_, or_, func
-from neo4j import GraphDatabase
+from sqlalchemy import select, and_, or_, func, tuple_
+from sqlalchemy.dialects.postgresql import JSONB, insert as pg_insert
+from sqlalchemy.orm import selectinload
+from neo4j import AsyncGraphDatabase, AsyncResult, READ_ACCESS
+from neo4j.graph import Node, Relationship, Path
 import jieba
 import jieba.posseg as pseg
 from collections import defaultdict, Counter
+from itertools import chain
 import networkx as nx
-from py2neo import Graph, Node, Relationship
+import numpy as np
+import orjson
+from scipy.cluster.hierarchy import linkage, fcluster
+from sentence_transformers import SentenceTransformer
 
-from app.models.knowledge import KnowledgeNode, KnowledgeRelation, KnowledgePath
+from app.models.knowledge import (
+    KnowledgeNode, KnowledgeRelation, KnowledgePath, KnowledgeUserStats, KG_USER_STATS_LOCK_CLASS
+)
 from app.models.document import Document, DocumentChunk
 from app.schemas.knowledge import (
     EntityCreate, RelationCreate, PathCreate, EntityExtractionRequest,
@@ -23,14 +36,81 @@ from app.schemas.knowledge import (
 )
 from app.core.config import settings
 from app.core.logging import logger
+from app.db.session import redis_client, get_read_db_session
+from app.utils.pattern_scanner import MultiPatternScanner
+from app.utils.text_dedup import normalize_entity_name, simhash64, find_near_duplicates
+
+
+# 实体类型编号，共现关系按编号查表推断类型
+ENTITY_TYPES = (
+    'person', 'organization', 'location', 'technology', 'cost', 'time',
+    'project', 'material', 'standard', 'metric', 'product', 'generic'
+)
+ENTITY_TYPE_IDS = {entity_type: i for i, entity_type in enumerate(ENTITY_TYPES)}
+UNKNOWN_TYPE_ID = len(ENTITY_TYPES)
+
+# 实体类型之间的关系映射，未列出的类型组合为related_to
+_TYPE_RELATIONS = {
+    ('person', 'organization'): 'work_for',
+    ('organization', 'person'): 'employ',
+    ('person', 'location'): 'located_in',
+    ('organization', 'location'): 'located_in',
+    ('project', 'organization'): 'owned_by',
+    ('organization', 'project'): 'own',
+    ('material', 'project'): 'used_in',
+    ('project', 'material'): 'use',
+    ('technology', 'project'): 'implement_in',
+    ('project', 'technology'): 'implement',
+    ('cost', 'project'): 'cost_of',
+    ('project', 'cost'): 'have_cost',
+}
+RELATION_NAMES = ('related_to',) + tuple(dict.fromkeys(_TYPE_RELATIONS.values()))
+RELATION_TABLE = np.zeros((UNKNOWN_TYPE_ID + 1, UNKNOWN_TYPE_ID + 1), dtype=np.uint8)
+for (_source_type, _target_type), _relation in _TYPE_RELATIONS.items():
+    RELATION_TABLE[ENTITY_TYPE_IDS[_source_type], ENTITY_TYPE_IDS[_target_type]] = RELATION_NAMES.index(_relation)
+
+# 用户Cypher查询计划中禁止出现的操作（过程调用可绕过只读与用户隔离）
+CYPHER_FORBIDDEN_OPERATORS = ('ProcedureCall', 'LoadCSV')
 
 
 class KnowledgeGraphService:
     """知识图谱服务类"""
 
+    # 词性到实体类型的映射
+    POS_ENTITY_TYPES = {
+        'nr': 'person',       # 人名
+        'ns': 'location',     # 地名
+        'nt': 'organization', # 机构名
+        'nz': 'product',      # 其他专名
+        'm': 'metric',        # 数词
+        't': 'time',          # 时间词
+        'eng': 'technology',  # 英文词
+        'n': 'generic',       # 普通名词
+    }
+
+    # 有方向的关系类型，正反方向是不同的关系
+    ASYMMETRIC_RELATIONS = frozenset({
+        'work_for', 'employ', 'owned_by', 'own', 'used_in', 'use',
+        'implement_in', 'implement', 'cost_of', 'have_cost', 'belong_to',
+        'contain', 'located_in', 'produce', 'require', 'manage', 'before', 'after'
+    })
+
+    # Neo4j节点、关系上的内置字段，其余属性为自定义属性
+    NEO4J_NODE_FIELDS = frozenset({
+        'id', 'name', 'type', 'confidence', 'source', 'user_id', 'created_at'
+    })
+    NEO4J_RELATION_FIELDS = frozenset({
+        'id', 'type', 'confidence', 'source', 'context', 'user_id', 'created_at'
+    })
+
+    # 文档分块并发提取的最大并发数
+    CHUNK_EXTRACTION_CONCURRENCY = 8
+
     def __init__(self):
         self.neo4j_driver = None
-        self.graph = None
+        self._neo4j_connect_lock = asyncio.Lock()
+        self.entity_embedding_model = None
+        self._entity_embedding_model_lock = asyncio.Lock()
         self.entity_patterns = {
             'organization': r'(?:公司|企业|集团|机构|单位|部门)([\w\u4e00-\u9fa5]+)',
             'person': r'([\u4e00-\u9fa5]{2,4})(?:先生|女士|总经理|总监|工程师|专家)',
@@ -43,6 +123,9 @@ class KnowledgeGraphService:
             'standard': r'(GB|ISO|ASTM|JIS|DIN)(?:-\d+)+',
             'metric': r'([\d,，、]+)(?:mm|cm|m|kg|t|㎡|㎡|ℏ|kWh|MPa)'
         }
+        self.entity_patterns = {
+            name: re.compile(pattern) for name, pattern in self.entity_patterns.items()
+        }
         self.relation_patterns = {
             'belong_to': r'(?:属于|隶属|归)',
             'contain': r'(?:包含|含有|包括)',
@@ -58,37 +141,62 @@ class KnowledgeGraphService:
             'before': r'(?:之前|早于|先于)',
             'after': r'(?:之后|晚于|后于)'
         }
+        self.relation_patterns = {
+            name: re.compile(pattern) for name, pattern in self.relation_patterns.items()
+        }
+        self.sentence_delimiter = re.compile(r'[。！？\n]')
+        self.entity_scanner = MultiPatternScanner(self.entity_patterns)
+        self.relation_scanner = MultiPatternScanner(self.relation_patterns)
 
     async def connect_neo4j(self) -> bool:
-        """连接到Neo4j数据库"""
-        try:
-            self.neo4j_driver = GraphDatabase.driver(
+        """连接到Neo4j数据库（应用启动时调用，驱动在各协程间共享）"""
+        async with self._neo4j_connect_lock:
+            if self.neo4j_driver:
+                return True
+
+            driver = AsyncGraphDatabase.driver(
                 settings.NEO4J_URI,
-                auth=(settings.NEO4J_USER, settings.NEO4J_PASSWORD)
+                auth=(settings.NEO4J_USER, settings.NEO4J_PASSWORD),
+                max_connection_pool_size=settings.NEO4J_MAX_CONNECTION_POOL_SIZE,
+                connection_acquisition_timeout=settings.NEO4J_CONNECTION_ACQUISITION_TIMEOUT
             )
 
-            # 测试连接
-            with self.neo4j_driver.session() as session:
-                session.run("RETURN 1")
+            try:
+                # 测试连接
+                await driver.verify_connectivity()
 
-            # 初始化py2neo图对象
-            self.graph = Graph(
-                settings.NEO4J_URI,
-                auth=(settings.NEO4J_USER, settings.NEO4J_PASSWORD)
-            )
+                # 按用户过滤、按用户定位实体的索引
+                for index_query in (
+                    "CREATE INDEX entity_user IF NOT EXISTS FOR (n:Entity) ON (n.user_id)",
+                    "CREATE INDEX entity_user_id IF NOT EXISTS FOR (n:Entity) ON (n.user_id, n.id)",
+                ):
+                    await driver.execute_query(index_query, database_=settings.NEO4J_DATABASE)
 
-            logger.info("成功连接到Neo4j数据库")
-            return True
+                self.neo4j_driver = driver
+                logger.info("成功连接到Neo4j数据库")
+                return True
 
-        except Exception as e:
-            logger.error(f"连接Neo4j失败: {str(e)}")
-            return False
+            except Exception as e:
+                await driver.close()
+                logger.error(f"连接Neo4j失败: {str(e)}")
+                return False
+
+    async def _get_driver(self):
+        """获取共享的Neo4j驱动，未连接时在锁内完成连接，保证只创建一个驱动"""
+        if self.neo4j_driver:
+            return self.neo4j_driver
+
+        if not await self.connect_neo4j():
+            raise RuntimeError("Neo4j数据库不可用")
+        return self.neo4j_driver
 
     async def disconnect_neo4j(self):
         """断开Neo4j连接"""
-        if self.neo4j_driver:
-            self.neo4j_driver.close()
-            logger.info("Neo4j连接已关闭")
+        async with self._neo4j_connect_lock:
+            if self.neo4j_driver:
+                await self.neo4j_driver.close()
+                self.neo4j_driver = None
+                logger.info("Neo4j连接已关闭")
 
     async def extract_entities(
         self,
@@ -106,38 +214,81 @@ class KnowledgeGraphService:
             提取的实体列表
         """
         try:
-            entities = []
+            # 分词与正则匹配为纯CPU计算，放到线程中执行以免阻塞事件循环
+            return await asyncio.to_thread(self._extract_entities_sync, text, extraction_method)
 
-            if extraction_method == "rule_based":
-                entities = await self._extract_entities_by_rules(text)
-            elif extraction_method == "jieba":
-                entities = await self._extract_entities_by_jieba(text)
-            elif extraction_method == "hybrid":
-                # 混合方法：先规则提取，再用jieba补充
-                rule_entities = await self._extract_entities_by_rules(text)
-                jieba_entities = await self._extract_entities_by_jieba(text)
-                entities = await self._merge_entities(rule_entities, jieba_entities)
+        except Exception as e:
+            logger.error(f"实体提取失败: {str(e)}")
+            return []
+
+    def _extract_entities_sync(self, text: str, extraction_method: str) -> List[Dict[str, Any]]:
+        """同步提取实体（失败时抛出异常，由调用方决定如何处理）"""
+        entities = []
+
+        if extraction_method == "rule_based":
+            entities = self._extract_entities_by_rules(text)
+        elif extraction_method == "jieba":
+            entities = self._extract_entities_by_jieba(text)
+        elif extraction_method == "hybrid":
+            # 混合方法：先规则提取，再用jieba补充
+            rule_entities = self._extract_entities_by_rules(text)
+            jieba_entities = self._extract_entities_by_jieba(text)
+            entities = self._merge_entities(rule_entities, jieba_entities)
+
+        # 去重和评分
+        entities = self._deduplicate_entities(entities)
+
+        logger.info(f"从文本中提取了 {len(entities)} 个实体")
+        return entities
 
-            # 去重和评分
-            entities = await self._deduplicate_entities(entities)
+    async def _extract_entities_cached(
+        self,
+        text: str,
+        extraction_method: str = "rule_based"
+    ) -> List[Dict[str, Any]]:
+        """按文本内容哈希缓存实体提取结果，重复分块跳过分词与正则扫描"""
+        if not settings.CACHE_ENABLED:
+            return await self.extract_entities(text, extraction_method)
 
-            logger.info(f"从文本中提取了 {len(entities)} 个实体")
-            return entities
+        content_hash = hashlib.blake2b(text.encode('utf-8'), digest_size=16).hexdigest()
+        cache_key = f"kg:entities:{extraction_method}:{content_hash}"
 
+        try:
+            cached = await redis_client.get(cache_key)
+            if cached:
+                return json.loads(cached)
+        except Exception as e:
+            logger.warning(f"读取实体缓存失败: {str(e)}")
+
+        # 只缓存成功的提取结果，失败返回的空列表不写入缓存，下次重新提取
+        try:
+            entities = await asyncio.to_thread(self._extract_entities_sync, text, extraction_method)
         except Exception as e:
             logger.error(f"实体提取失败: {str(e)}")
             return []
 
-    async def _extract_entities_by_rules(self, text: str) -> List[Dict[str, Any]]:
+        try:
+            await redis_client.setex(cache_key, settings.CACHE_TTL, json.dumps(entities, ensure_ascii=False))
+        except Exception as e:
+            logger.warning(f"写入实体缓存失败: {str(e)}")
+
+        return entities
+
+    def _extract_entities_by_rules(self, text: str) -> List[Dict[str, Any]]:
         """基于规则提取实体"""
         entities = []
 
+        matched_types = self.entity_scanner.scan(text)
+
         for entity_type, pattern in self.entity_patterns.items():
-            matches = re.finditer(pattern, text)
+            if entity_type not in matched_types:
+                continue
+            matches = pattern.finditer(text)
             for match in matches:
                 entity = {
                     'text': match.group(1) if match.groups() else match.group(0),
                     'type': entity_type,
+                    'type_id': ENTITY_TYPE_IDS[entity_type],
                     'start': match.start(),
                     'end': match.end(),
                     'confidence': 0.8,
@@ -147,25 +298,28 @@ class KnowledgeGraphService:
 
         return entities
 
-    async def _extract_entities_by_jieba(self, text: str) -> List[Dict[str, Any]]:
+    def _extract_entities_by_jieba(self, text: str) -> List[Dict[str, Any]]:
         """使用jieba提取实体"""
         entities = []
 
-        # 词性标注
-        words = pseg.cut(text)
+        # 词性标注结果按原文顺序连续覆盖全文，累加偏移即可得到位置
+        offset = 0
+        for word, flag in pseg.cut(text):
+            start = offset
+            offset += len(word)
 
-        for word, flag in words:
             # 过滤停用词和短词
-            if len(word) < 2 or flag in ['x', 'w', 'u', 'c', 'p']:
+            if len(word) < 2 or flag in ('x', 'w', 'u', 'c', 'p'):
                 continue
 
-            entity_type = self._map_pos_to_entity_type(flag)
+            entity_type = self.POS_ENTITY_TYPES.get(flag)
             if entity_type:
                 entity = {
                     'text': word,
                     'type': entity_type,
-                    'start': text.find(word),
-                    'end': text.find(word) + len(word),
+                    'type_id': ENTITY_TYPE_IDS[entity_type],
+                    'start': start,
+                    'end': offset,
                     'confidence': 0.6,
                     'method': 'jieba',
                     'pos': flag
@@ -174,21 +328,7 @@ class KnowledgeGraphService:
 
         return entities
 
-    async def _map_pos_to_entity_type(self, pos_flag: str) -> Optional[str]:
-        """将词性映射到实体类型"""
-        pos_mapping = {
-            'nr': 'person',       # 人名
-            'ns': 'location',     # 地名
-            'nt': 'organization', # 机构名
-            'nz': 'product',      # 其他专名
-            'm': 'metric',        # 数词
-            't': 'time',          # 时间词
-            'eng': 'technology',  # 英文词
-            'n': 'generic',       # 普通名词
-        }
-        return pos_mapping.get(pos_flag)
-
-    async def _merge_entities(
+    def _merge_entities(
         self,
         rule_entities: List[Dict],
         jieba_entities: List[Dict]
@@ -197,14 +337,13 @@ class KnowledgeGraphService:
         merged = defaultdict(list)
 
         # 按实体文本分组
-        for entity in rule_entities + jieba_entities:
-            key = (entity['text'].lower(), entity['type'])
-            merged[key].append(entity)
+        for entity in chain(rule_entities, jieba_entities):
+            merged[(entity['text'].lower(), entity['type'])].append(entity)
 
         # 合并重复实体，选择最高置信度
         result = []
-        for (text, entity_type), entity_list in merged.items():
-            best_entity = max(entity_list, key=lambda x: x['confidence'])
+        for entity_list in merged.values():
+            best_entity = max(entity_list, key=itemgetter('confidence'))
 
             # 如果有多个方法都提取到了，提高置信度
             if len(entity_list) > 1:
@@ -215,18 +354,187 @@ class KnowledgeGraphService:
 
         return result
 
-    async def _deduplicate_entities(self, entities: List[Dict]) -> List[Dict]:
-        """去重实体"""
-        seen = set()
-        deduplicated = []
-
+    def _deduplicate_entities(self, entities: List[Dict]) -> List[Dict]:
+        """去重实体（保留每个键首次出现的实体）"""
+        deduplicated = {}
         for entity in entities:
-            key = (entity['text'].lower(), entity['type'], entity['start'])
-            if key not in seen:
-                seen.add(key)
-                deduplicated.append(entity)
+            deduplicated.setdefault((entity['text'].lower(), entity['type'], entity['start']), entity)
+
+        return list(deduplicated.values())
+
+    def _fold_near_duplicate_entities(
+        self,
+        entities: List[Dict[str, Any]]
+    ) -> Dict[Tuple[str, str], Dict[str, Any]]:
+        """
+        折叠近似重复实体
+
+        先按规范化名称精确去重，再在同类型内用SimHash汉明距离合并近似名称；
+        按置信度从高到低处理，代表实体即置信度最高者，其余名称记为别名。
+
+        Args:
+            entities: 实体列表
 
-        return deduplicated
+        Returns:
+            (实体文本, 类型) 到代表实体的映射
+        """
+        # 按置信度降序，每个规范化名称取首个（置信度最高的）实体
+        ordered = sorted(entities, key=itemgetter('confidence'), reverse=True)
+        first_by_name = {}
+        for entity in ordered:
+            first_by_name.setdefault((normalize_entity_name(entity['text']), entity['type']), entity)
+
+        normalized_keys = list(first_by_name)
+        type_ids = {}
+        parents = find_near_duplicates(
+            [simhash64(name) for name, _ in normalized_keys],
+            [type_ids.setdefault(entity_type, len(type_ids)) for _, entity_type in normalized_keys]
+        )
+
+        # 前序近似重复已先行确定代表，沿链即可得到代表实体
+        representatives = {}
+        for normalized_key, parent in zip(normalized_keys, parents):
+            if parent < 0:
+                representatives[normalized_key] = {**first_by_name[normalized_key], 'aliases': []}
+            else:
+                representatives[normalized_key] = representatives[normalized_keys[parent]]
+
+        resolved = {}
+        for entity in ordered:
+            key = (entity['text'], entity['type'])
+            if key in resolved:
+                continue
+
+            representative = representatives[(normalize_entity_name(entity['text']), entity['type'])]
+            if entity['text'] != representative['text'] and entity['text'] not in representative['aliases']:
+                representative['aliases'].append(entity['text'])
+            resolved[key] = representative
+
+        return resolved
+
+    async def _resolve_entities_by_embedding(
+        self,
+        resolved: Dict[Tuple[str, str], Dict[str, Any]]
+    ) -> Dict[Tuple[str, str], Dict[str, Any]]:
+        """
+        基于名称嵌入的实体消解
+
+        对同类型的代表实体做平均连接（UPGMA）层次聚类，余弦相似度不低于阈值的
+        归为同一簇，簇内以置信度最高者为代表，其余名称并入别名。
+
+        Args:
+            resolved: (实体文本, 类型) 到代表实体的映射
+
+        Returns:
+            消解后的映射
+        """
+        try:
+            groups = defaultdict(list)
+            for representative in {id(rep): rep for rep in resolved.values()}.values():
+                groups[representative['type']].append(representative)
+            groups = {entity_type: reps for entity_type, reps in groups.items() if len(reps) > 1}
+            if not groups:
+                return resolved
+
+            names = list(dict.fromkeys(
+                normalize_entity_name(rep['text']) for reps in groups.values() for rep in reps
+            ))
+            embeddings = await self._embed_entity_names(names)
+
+            matrices = [
+                np.stack([embeddings[normalize_entity_name(rep['text'])] for rep in reps])
+                for reps in groups.values()
+            ]
+            # 层次聚类为纯CPU计算，放到线程中执行
+            group_labels = await asyncio.to_thread(self._cluster_embeddings, matrices)
+
+            merged = {}
+            for reps, labels in zip(groups.values(), group_labels):
+                clusters = defaultdict(list)
+                for rep, label in zip(reps, labels):
+                    clusters[label].append(rep)
+
+                for members in clusters.values():
+                    if len(members) < 2:
+                        continue
+                    canonical = max(members, key=itemgetter('confidence'))
+                    for member in members:
+                        if member is canonical:
+                            continue
+                        for alias in [member['text'], *member['aliases']]:
+                            if alias != canonical['text'] and alias not in canonical['aliases']:
+                                canonical['aliases'].append(alias)
+                        merged[id(member)] = canonical
+
+            return {key: merged.get(id(rep), rep) for key, rep in resolved.items()}
+
+        except Exception as e:
+            logger.warning(f"实体语义消解失败，保留原实体: {str(e)}")
+            return resolved
+
+    @staticmethod
+    def _cluster_embeddings(matrices: List[np.ndarray]) -> List[np.ndarray]:
+        """对每组嵌入做平均连接层次聚类，返回各组的簇标签"""
+        distance_threshold = 1.0 - settings.ENTITY_RESOLUTION_THRESHOLD
+        return [
+            fcluster(
+                linkage(matrix, method='average', metric='cosine'),
+                t=distance_threshold,
+                criterion='distance'
+            )
+            for matrix in matrices
+        ]
+
+    async def _get_entity_embedding_model(self) -> SentenceTransformer:
+        """懒加载实体消解嵌入模型：在线程中加载避免阻塞事件循环，加锁保证只加载一次"""
+        if self.entity_embedding_model is None:
+            async with self._entity_embedding_model_lock:
+                if self.entity_embedding_model is None:
+                    self.entity_embedding_model = await asyncio.to_thread(
+                        SentenceTransformer, settings.ENTITY_RESOLUTION_MODEL
+                    )
+        return self.entity_embedding_model
+
+    async def _embed_entity_names(self, names: List[str]) -> Dict[str, np.ndarray]:
+        """获取实体名称的归一化嵌入，跨文档缓存在Redis中"""
+        cache_keys = {name: f"kg:entity_emb:{settings.ENTITY_RESOLUTION_MODEL}:{name}" for name in names}
+        embeddings = {}
+
+        try:
+            cached_values = await redis_client.mget(list(cache_keys.values()))
+        except Exception as e:
+            logger.warning(f"读取实体嵌入缓存失败: {str(e)}")
+            cached_values = [None] * len(names)
+
+        for name, cached in zip(names, cached_values):
+            if cached:
+                embeddings[name] = np.frombuffer(base64.b64decode(cached), dtype=np.float32)
+
+        missing = [name for name in names if name not in embeddings]
+        if missing:
+            model = await self._get_entity_embedding_model()
+            vectors = await asyncio.to_thread(
+                model.encode,
+                missing,
+                batch_size=64,
+                normalize_embeddings=True
+            )
+            vectors = np.asarray(vectors, dtype=np.float32)
+            embeddings.update(zip(missing, vectors))
+
+            try:
+                pipe = redis_client.pipeline()
+                for name, vector in zip(missing, vectors):
+                    pipe.setex(
+                        cache_keys[name],
+                        settings.REDIS_CACHE_TTL,
+                        base64.b64encode(vector.tobytes()).decode('ascii')
+                    )
+                await pipe.execute()
+            except Exception as e:
+                logger.warning(f"写入实体嵌入缓存失败: {str(e)}")
+
+        return embeddings
 
     async def extract_relations(
         self,
@@ -243,19 +551,30 @@ class KnowledgeGraphService:
         Returns:
             提取的关系列表
         """
+        return await asyncio.to_thread(self._extract_relations_sync, text, entities)
+
+    def _extract_relations_sync(
+        self,
+        text: str,
+        entities: List[Dict[str, Any]]
+    ) -> List[Dict[str, Any]]:
+        """同步提取关系"""
         try:
             relations = []
 
+            # 实体按起点排序一次，两种抽取共用同一份二分索引
+            sorted_entities, entity_starts = self._sort_entities_by_start(entities)
+
             # 基于规则的关系抽取
-            rule_relations = await self._extract_relations_by_rules(text, entities)
+            rule_relations = self._extract_relations_by_rules(text, sorted_entities, entity_starts)
             relations.extend(rule_relations)
 
             # 基于共现的关系抽取
-            cooccurrence_relations = await self._extract_relations_by_cooccurrence(text, entities)
+            cooccurrence_relations = self._extract_relations_by_cooccurrence(text, sorted_entities, entity_starts)
             relations.extend(cooccurrence_relations)
 
             # 去重关系
-            relations = await self._deduplicate_relations(relations)
+            relations = self._deduplicate_relations(relations)
 
             logger.info(f"从文本中提取了 {len(relations)} 个关系")
             return relations
@@ -264,68 +583,94 @@ class KnowledgeGraphService:
             logger.error(f"关系提取失败: {str(e)}")
             return []
 
-    async def _extract_relations_by_rules(
+    def _extract_relations_by_rules(
         self,
         text: str,
-        entities: List[Dict[str, Any]]
+        sorted_entities: List[Dict[str, Any]],
+        entity_starts: List[int]
     ) -> List[Dict[str, Any]]:
-        """基于规则提取关系"""
+        """基于规则提取关系（实体需已按起点排序）"""
         relations = []
+        seen = set()
+
+        matched_types = self.relation_scanner.scan(text)
 
         for relation_type, pattern in self.relation_patterns.items():
-            matches = re.finditer(pattern, text)
+            if relation_type not in matched_types:
+                continue
+            matches = pattern.finditer(text)
 
             for match in matches:
                 # 查找关系词附近的关键词
                 start_pos = max(0, match.start() - 50)
                 end_pos = min(len(text), match.end() + 50)
-                context = text[start_pos:end_pos]
 
-                # 在上下文中查找实体
-                related_entities = []
-                for entity in entities:
-                    if start_pos <= entity['start'] <= end_pos:
-                        related_entities.append(entity)
+                # 二分定位起点落在上下文窗口内的实体
+                lo = bisect_left(entity_starts, start_pos)
+                hi = bisect_right(entity_starts, end_pos)
+
+                # 如果找到至少两个实体，创建关系（同一关系只生成一次）
+                if hi - lo >= 2:
+                    source, target = sorted_entities[lo], sorted_entities[lo + 1]
+                    key = self._relation_key(source, target, relation_type)
+                    if key in seen:
+                        continue
+                    seen.add(key)
 
-                # 如果找到至少两个实体，创建关系
-                if len(related_entities) >= 2:
                     relation = {
-                        'source': related_entities[0],
-                        'target': related_entities[1],
+                        'source': source,
+                        'target': target,
                         'type': relation_type,
                         'confidence': 0.7,
-                        'context': context,
+                        'context': text[start_pos:end_pos],
                         'method': 'rule_based'
                     }
                     relations.append(relation)
 
         return relations
 
-    async def _extract_relations_by_cooccurrence(
+    def _extract_relations_by_cooccurrence(
         self,
         text: str,
-        entities: List[Dict[str, Any]]
+        sorted_entities: List[Dict[str, Any]],
+        entity_starts: List[int]
     ) -> List[Dict[str, Any]]:
-        """基于共现提取关系"""
+        """基于共现提取关系（实体需已按起点排序）"""
         relations = []
+        seen = set()
+
+        # 一次扫描得到句子区间，再按起点二分把实体分配到句子
+        delimiters = [m.start() for m in self.sentence_delimiter.finditer(text)]
+        sentence_spans = zip([0] + [end + 1 for end in delimiters], delimiters + [len(text)])
+
+        for sentence_start, sentence_end in sentence_spans:
+            lo = bisect_left(entity_starts, sentence_start)
+            hi = bisect_left(entity_starts, sentence_end)
+            sentence_entities = [
+                entity for entity in sorted_entities[lo:hi]
+                if entity['end'] <= sentence_end
+            ]
 
-        # 在同一句话中共现的实体
-        sentences = re.split(r'[。！？\n]', text)
+            if len(sentence_entities) < 2:
+                continue
+
+            # 只有产生关系的句子才切出上下文文本
+            sentence = text[sentence_start:sentence_end]
 
-        for sentence in sentences:
-            sentence_entities = []
-            for entity in entities:
-                if entity['start'] >= text.find(sentence) and \
-                   entity['end'] <= text.find(sentence) + len(sentence):
-                    sentence_entities.append(entity)
+            # 一次查表得到句内所有实体对的关系类型
+            type_ids = [self._entity_type_id(entity) for entity in sentence_entities]
+            relation_ids = RELATION_TABLE[np.ix_(type_ids, type_ids)].tolist()
 
             # 为共现实体的每对创建关系
             for i in range(len(sentence_entities)):
                 for j in range(i + 1, len(sentence_entities)):
                     entity1, entity2 = sentence_entities[i], sentence_entities[j]
+                    relation_type = RELATION_NAMES[relation_ids[i][j]]
 
-                    # 根据实体类型推断关系
-                    relation_type = self._infer_relation_type(entity1, entity2)
+                    key = self._relation_key(entity1, entity2, relation_type)
+                    if key in seen:
+                        continue
+                    seen.add(key)
 
                     relation = {
                         'source': entity1,
@@ -339,47 +684,42 @@ class KnowledgeGraphService:
 
         return relations
 
-    async def _infer_relation_type(self, entity1: Dict, entity2: Dict) -> str:
+    @staticmethod
+    def _sort_entities_by_start(
+        entities: List[Dict[str, Any]]
+    ) -> Tuple[List[Dict[str, Any]], List[int]]:
+        """按起始位置排序实体，并返回用于二分查找的起点列表"""
+        sorted_entities = sorted(entities, key=itemgetter('start'))
+        return sorted_entities, [entity['start'] for entity in sorted_entities]
+
+    @staticmethod
+    def _entity_type_id(entity: Dict[str, Any]) -> int:
+        """实体类型编号（外部传入的实体可能没有type_id）"""
+        type_id = entity.get('type_id')
+        if type_id is None:
+            return ENTITY_TYPE_IDS.get(entity['type'], UNKNOWN_TYPE_ID)
+        return type_id
+
+    def _infer_relation_type(self, entity1: Dict, entity2: Dict) -> str:
         """根据实体类型推断关系类型"""
-        type1, type2 = entity1['type'], entity2['type']
-
-        # 定义实体类型之间的关系映射
-        relation_map = {
-            ('person', 'organization'): 'work_for',
-            ('organization', 'person'): 'employ',
-            ('person', 'location'): 'located_in',
-            ('organization', 'location'): 'located_in',
-            ('project', 'organization'): 'owned_by',
-            ('organization', 'project'): 'own',
-            ('material', 'project'): 'used_in',
-            ('project', 'material'): 'use',
-            ('technology', 'project'): 'implement_in',
-            ('project', 'technology'): 'implement',
-            ('cost', 'project'): 'cost_of',
-            ('project', 'cost'): 'have_cost',
-        }
-
-        return relation_map.get((type1, type2), 'related_to')
-
-    async def _deduplicate_relations(self, relations: List[Dict]) -> List[Dict]:
-        """去重关系"""
-        seen = set()
-        deduplicated = []
-
+        return RELATION_NAMES[RELATION_TABLE[self._entity_type_id(entity1), self._entity_type_id(entity2)]]
+
+    def _relation_key(self, source: Dict, target: Dict, relation_type: str) -> Tuple[str, str, str]:
+        """关系的唯一标识（对称关系不区分方向）"""
+        source_text = source['text'].lower()
+        target_text = target['text'].lower()
+        if relation_type not in self.ASYMMETRIC_RELATIONS and target_text < source_text:
+            source_text, target_text = target_text, source_text
+        return source_text, target_text, relation_type
+
+    def _deduplicate_relations(self, relations: List[Dict]) -> List[Dict]:
+        """去重关系（仅对称关系的正反方向视为同一关系）"""
+        deduplicated = {}
         for relation in relations:
-            # 创建关系的唯一标识
-            source_text = relation['source']['text'].lower()
-            target_text = relation['target']['text'].lower()
-            relation_type = relation['type']
-
-            key = (source_text, target_text, relation_type)
-            reverse_key = (target_text, source_text, relation_type)
+            key = self._relation_key(relation['source'], relation['target'], relation['type'])
+            deduplicated.setdefault(key, relation)
 
-            if key not in seen and reverse_key not in seen:
-                seen.add(key)
-                deduplicated.append(relation)
-
-        return deduplicated
+        return list(deduplicated.values())
 
     async def create_knowledge_node(
         self,
@@ -399,22 +739,54 @@ class KnowledgeGraphService:
             创建的知识节点
         """
         try:
-            # 检查节点是否已存在
-            existing = await db.execute(
-                select(KnowledgeNode).where(
-                    and_(
-                        KnowledgeNode.name == entity_data.name,
-                        KnowledgeNode.type == entity_data.type,
-                        KnowledgeNode.user_id == user_id
-                    )
+            nodes, new_nodes = await self._get_or_create_nodes([entity_data], user_id, db)
+            node = nodes[(entity_data.name, entity_data.type)]
+
+            if new_nodes:
+                # 在Neo4j中创建节点
+                await self._create_neo4j_nodes(new_nodes)
+                logger.info(f"创建知识节点: {node.name} ({node.type})")
+
+            return node
+
+        except Exception as e:
+            logger.error(f"创建知识节点失败: {str(e)}")
+            await db.rollback()
+            raise
+
+    async def _get_or_create_nodes(
+        self,
+        entities: List[EntityCreate],
+        user_id: int,
+        db: AsyncSession
+    ) -> Tuple[Dict[Tuple[str, str], KnowledgeNode], List[KnowledgeNode]]:
+        """
+        批量获取或创建节点：一次查询已存在节点，缺失的批量插入并一次提交
+
+        Returns:
+            (name, type) 到节点的映射，以及新建节点列表
+        """
+        keys = list(dict.fromkeys((entity.name, entity.type) for entity in entities))
+        if not keys:
+            return {}, []
+
+        existing = await db.execute(
+            select(KnowledgeNode).where(
+                and_(
+                    KnowledgeNode.user_id == user_id,
+                    tuple_(KnowledgeNode.name, KnowledgeNode.type).in_(keys)
                 )
             )
-            existing_node = existing.scalar_one_or_none()
+        )
+        nodes = {(node.name, node.type): node for node in existing.scalars()}
 
-            if existing_node:
-                return existing_node
+        created_at = datetime.utcnow()
+        new_nodes = []
+        for entity_data in entities:
+            key = (entity_data.name, entity_data.type)
+            if key in nodes:
+                continue
 
-            # 创建新节点
             node = KnowledgeNode(
                 user_id=user_id,
                 name=entity_data.name,
@@ -422,58 +794,79 @@ class KnowledgeGraphService:
                 properties=entity_data.properties or {},
                 confidence=entity_data.confidence,
                 source=entity_data.source,
-                metadata=entity_data.metadata or {}
+                created_at=created_at
             )
+            nodes[key] = node
+            new_nodes.append(node)
 
-            db.add(node)
+        if new_nodes:
+            db.add_all(new_nodes)
             await db.commit()
-            await db.refresh(node)
+            await self._invalidate_statistics_cache(user_id)
 
-            # 在Neo4j中创建节点
-            await self._create_neo4j_node(node)
+        return nodes, new_nodes
 
-            logger.info(f"创建知识节点: {node.name} ({node.type})")
-            return node
+    async def _create_neo4j_nodes(self, nodes: List[KnowledgeNode]):
+        """在Neo4j中批量创建节点（单次UNWIND写入）"""
+        if not nodes:
+            return
 
-        except Exception as e:
-            logger.error(f"创建知识节点失败: {str(e)}")
-            await db.rollback()
-            raise
-
-    async def _create_neo4j_node(self, node: KnowledgeNode):
-        """在Neo4j中创建节点"""
         try:
-            if not self.neo4j_driver:
-                await self.connect_neo4j()
-
-            with self.neo4j_driver.session() as session:
-                query = """
-                CREATE (n:Entity {
-                    id: $id,
-                    name: $name,
-                    type: $type,
-                    properties: $properties,
-                    confidence: $confidence,
-                    source: $source,
-                    user_id: $user_id,
-                    created_at: $created_at
-                })
-                """
-
-                session.run(query, {
-                    'id': node.id,
-                    'name': node.name,
-                    'type': node.type,
-                    'properties': json.dumps(node.properties),
-                    'confidence': node.confidence,
-                    'source': node.source,
-                    'user_id': node.user_id,
-                    'created_at': node.created_at.isoformat()
-                })
+            driver = await self._get_driver()
+
+            # 自定义属性以原生属性写入，内置字段覆盖同名自定义属性
+            query = """
+            UNWIND $rows AS row
+            CREATE (n:Entity)
+            SET n = row.properties, n += row.fields
+            """
+
+            await driver.execute_query(query, {
+                'rows': [
+                    {
+                        'properties': self._to_neo4j_properties(node.properties),
+                        'fields': {
+                            'id': node.id,
+                            'name': node.name,
+                            'type': node.type,
+                            'confidence': node.confidence,
+                            'source': node.source,
+                            'user_id': node.user_id,
+                            'created_at': node.created_at.isoformat()
+                        }
+                    }
+                    for node in nodes
+                ]
+            }, database_=settings.NEO4J_DATABASE)
 
         except Exception as e:
             logger.error(f"在Neo4j中创建节点失败: {str(e)}")
 
+    def _relation_properties(self, rel) -> Dict[str, Any]:
+        """从Neo4j关系中取出自定义属性"""
+        return {
+            key: value for key, value in rel.items()
+            if key not in self.NEO4J_RELATION_FIELDS
+        }
+
+    @staticmethod
+    def _to_neo4j_properties(properties: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        转换为Neo4j原生属性
+
+        Neo4j属性值只能是基本类型或同类基本类型的列表，
+        嵌套的字典和混合列表编码为JSON字符串，其余原样写入。
+        """
+        converted = {}
+        for key, value in (properties or {}).items():
+            if isinstance(value, dict) or isinstance(value, (list, tuple)) and (
+                len({type(item) for item in value}) > 1
+                or any(isinstance(item, (dict, list, tuple)) for item in value)
+            ):
+                value = json.dumps(value, ensure_ascii=False)
+            converted[key] = value
+        return converted
+
     async def create_knowledge_relation(
         self,
         relation_data: RelationCreate,
@@ -516,23 +909,66 @@ class KnowledgeGraphService:
             if not source_node or not target_node:
                 raise ValueError("源节点或目标节点不存在")
 
-            # 检查关系是否已存在
-            existing = await db.execute(
-                select(KnowledgeRelation).where(
-                    and_(
-                        KnowledgeRelation.source_node_id == relation_data.source_node_id,
-                        KnowledgeRelation.target_node_id == relation_data.target_node_id,
-                        KnowledgeRelation.type == relation_data.type,
-                        KnowledgeRelation.user_id == user_id
-                    )
+            relations, new_relations = await self._get_or_create_relations([relation_data], user_id, db)
+            relation = relations[
+                (relation_data.source_node_id, relation_data.target_node_id, relation_data.type)
+            ]
+
+            if new_relations:
+                # 在Neo4j中创建关系
+                await self._create_neo4j_relations(new_relations)
+                logger.info(f"创建知识关系: {source_node.name} -> {target_node.name} ({relation.type})")
+
+            return relation
+
+        except Exception as e:
+            logger.error(f"创建知识关系失败: {str(e)}")
+            await db.rollback()
+            raise
+
+    async def _get_or_create_relations(
+        self,
+        relations: List[RelationCreate],
+        user_id: int,
+        db: AsyncSession
+    ) -> Tuple[Dict[Tuple[int, int, str], KnowledgeRelation], List[KnowledgeRelation]]:
+        """
+        批量获取或创建关系：一次查询已存在关系，缺失的批量插入并一次提交
+
+        Returns:
+            (source_node_id, target_node_id, type) 到关系的映射，以及新建关系列表
+        """
+        keys = list(dict.fromkeys(
+            (relation.source_node_id, relation.target_node_id, relation.type)
+            for relation in relations
+        ))
+        if not keys:
+            return {}, []
+
+        existing = await db.execute(
+            select(KnowledgeRelation).where(
+                and_(
+                    KnowledgeRelation.user_id == user_id,
+                    tuple_(
+                        KnowledgeRelation.source_node_id,
+                        KnowledgeRelation.target_node_id,
+                        KnowledgeRelation.type
+                    ).in_(keys)
                 )
             )
-            existing_relation = existing.scalar_one_or_none()
+        )
+        relations_by_key = {
+            (relation.source_node_id, relation.target_node_id, relation.type): relation
+            for relation in existing.scalars()
+        }
 
-            if existing_relation:
-                return existing_relation
+        created_at = datetime.utcnow()
+        new_relations = []
+        for relation_data in relations:
+            key = (relation_data.source_node_id, relation_data.target_node_id, relation_data.type)
+            if key in relations_by_key:
+                continue
 
-            # 创建新关系
             relation = KnowledgeRelation(
                 user_id=user_id,
                 source_node_id=relation_data.source_node_id,
@@ -542,66 +978,127 @@ class KnowledgeGraphService:
                 confidence=relation_data.confidence,
                 source=relation_data.source,
                 context=relation_data.context,
-                metadata=relation_data.metadata or {}
+                created_at=created_at
             )
+            relations_by_key[key] = relation
+            new_relations.append(relation)
 
-            db.add(relation)
+        if new_relations:
+            db.add_all(new_relations)
             await db.commit()
-            await db.refresh(relation)
+            await self._invalidate_statistics_cache(user_id)
 
-            # 在Neo4j中创建关系
-            await self._create_neo4j_relation(relation, source_node, target_node)
+        return relations_by_key, new_relations
 
-            logger.info(f"创建知识关系: {source_node.name} -> {target_node.name} ({relation.type})")
-            return relation
+    async def _create_neo4j_relations(self, relations: List[KnowledgeRelation]):
+        """在Neo4j中批量创建关系（单次UNWIND写入）"""
+        if not relations:
+            return
 
-        except Exception as e:
-            logger.error(f"创建知识关系失败: {str(e)}")
-            await db.rollback()
-            raise
-
-    async def _create_neo4j_relation(
-        self,
-        relation: KnowledgeRelation,
-        source_node: KnowledgeNode,
-        target_node: KnowledgeNode
-    ):
-        """在Neo4j中创建关系"""
         try:
-            if not self.neo4j_driver:
-                await self.connect_neo4j()
-
-            with self.neo4j_driver.session() as session:
-                query = """
-                MATCH (source:Entity {id: $source_id}), (target:Entity {id: $target_id})
-                CREATE (source)-[r:RELATION {
-                    id: $id,
-                    type: $type,
-                    properties: $properties,
-                    confidence: $confidence,
-                    source: $source,
-                    context: $context,
-                    user_id: $user_id,
-                    created_at: $created_at
-                }]->(target)
-                """
-
-                session.run(query, {
-                    'source_id': source_node.id,
-                    'target_id': target_node.id,
-                    'id': relation.id,
-                    'type': relation.type,
-                    'properties': json.dumps(relation.properties),
-                    'confidence': relation.confidence,
-                    'source': relation.source,
-                    'context': relation.context,
-                    'user_id': relation.user_id,
-                    'created_at': relation.created_at.isoformat()
-                })
+            driver = await self._get_driver()
+
+            query = """
+            UNWIND $rows AS row
+            MATCH (source:Entity {id: row.source_id}), (target:Entity {id: row.target_id})
+            CREATE (source)-[r:RELATION]->(target)
+            SET r = row.properties, r += row.fields
+            """
+
+            await driver.execute_query(query, {
+                'rows': [
+                    {
+                        'source_id': relation.source_node_id,
+                        'target_id': relation.target_node_id,
+                        'properties': self._to_neo4j_properties(relation.properties),
+                        'fields': {
+                            'id': relation.id,
+                            'type': relation.type,
+                            'confidence': relation.confidence,
+                            'source': relation.source,
+                            'context': relation.context,
+                            'user_id': relation.user_id,
+                            'created_at': relation.created_at.isoformat()
+                        }
+                    }
+                    for relation in relations
+                ]
+            }, database_=settings.NEO4J_DATABASE)
 
         except Exception as e:
             logger.error(f"在Neo4j中创建关系失败: {str(e)}")
 
+    async def migrate_legacy_properties(self, batch_size: int = 1000) -> int:
+        """
+        把旧版以JSON字符串存储在properties字段中的自定义属性迁移为Neo4j原生属性
+
+        Args:
+            batch_size: 每批迁移的节点或关系数量
+
+        Returns:
+            迁移的节点与关系总数
+        """
+        driver = await self._get_driver()
+
+        migrated = 0
+        targets = (
+            ("(e:Entity)", self.NEO4J_NODE_FIELDS),
+            ("()-[e:RELATION]->()", self.NEO4J_RELATION_FIELDS),
+        )
+
+        for pattern, builtin_fields in targets:
+            # 无法解析的值（如同名的原生属性）保留原样，并在后续批次中跳过
+            skipped = []
+            while True:
+                records, _, _ = await driver.execute_query(
+                    f"""
+                    MATCH {pattern}
+                    WHERE e.properties IS NOT NULL AND NOT elementId(e) IN $skipped
+                    RETURN elementId(e) AS element_id, e.properties AS properties
+                    LIMIT $limit
+                    """,
+                    {'skipped': skipped, 'limit': batch_size},
+                    database_=settings.NEO4J_DATABASE
+                )
+                if not records:
+                    break
+
+                rows = []
+                for record in records:
+                    try:
+                        properties = orjson.loads(record['properties'])
+                    except (TypeError, orjson.JSONDecodeError):
+                        properties = None
+
+                    if not isinstance(properties, dict):
+                        skipped.append(record['element_id'])
+                        continue
+
+                    rows.append({
+                        'element_id': record['element_id'],
+                        'properties': self._to_neo4j_properties({
+                            key: value for key, value in properties.items()
+                            if key not in builtin_fields
+                        })
+                    })
+
+                if rows:
+                    await driver.execute_query(
+                        f"""
+                        UNWIND $rows AS row
+                        MATCH {pattern}
+                        WHERE elementId(e) = row.element_id
+                        SET e += row.properties
+                        REMOVE e.properties
+                        """,
+                        {'rows': rows},
+                        database_=settings.NEO4J_DATABASE
+                    )
+                    migrated += len(rows)
+
+        logger.info(f"Neo4j旧版属性迁移完成，共 {migrated} 条")
+        return migrated
+
     async def process_document_knowledge(
         self,
         document_id: int,
@@ -649,59 +1146,91 @@ class KnowledgeGraphService:
             total_nodes = 0
             total_edges = 0
 
-            # 处理每个分块
-            for chunk in chunks:
-                # 提取实体
-                entities = await self.extract_entities(chunk.content)
-
-                # 提取关系
-                relations = await self.extract_relations(chunk.content, entities)
-
-                # 创建知识节点
-                created_nodes = []
-                for entity_data in entities:
-                    entity_create = EntityCreate(
+            # 分块之间相互独立，并发提取实体与关系（限制并发数）
+            semaphore = asyncio.Semaphore(self.CHUNK_EXTRACTION_CONCURRENCY)
+
+            async def extract_chunk(chunk: DocumentChunk):
+                async with semaphore:
+                    entities = await self._extract_entities_cached(chunk.content)
+                    relations = await self.extract_relations(chunk.content, entities)
+                    # 近似重复折叠逐个计算SimHash，同样放到线程中执行
+                    folded = await asyncio.to_thread(self._fold_near_duplicate_entities, entities)
+                    return chunk, entities, relations, folded
+
+            extracted = await asyncio.gather(*(extract_chunk(chunk) for chunk in chunks))
+
+            # 汇总整篇文档的节点与关系，每篇文档一次存在性查询、一次提交、一次图数据库写入
+            entity_creates = []
+            chunk_entity_keys = []
+            for chunk, entities, relations, resolved_entities in extracted:
+                # 对折叠后的实体做语义消解，每个代表实体只建一个节点
+                if settings.ENTITY_RESOLUTION_ENABLED:
+                    resolved_entities = await self._resolve_entities_by_embedding(resolved_entities)
+                representatives = list({id(rep): rep for rep in resolved_entities.values()}.values())
+
+                chunk_source = f"document_{document_id}_chunk_{chunk.id}"
+                entity_creates.extend(
+                    EntityCreate(
                         name=entity_data['text'],
                         type=entity_data['type'],
-                        properties={'method': entity_data['method']},
+                        properties=(
+                            {'method': entity_data['method'], 'aliases': entity_data['aliases']}
+                            if entity_data['aliases'] else {'method': entity_data['method']}
+                        ),
                         confidence=entity_data['confidence'],
-                        source=f"document_{document_id}_chunk_{chunk.id}"
+                        source=chunk_source
                     )
+                    for entity_data in representatives
+                )
+                chunk_entity_keys.append(resolved_entities)
 
-                    try:
-                        node = await self.create_knowledge_node(entity_create, user_id, db)
-                        created_nodes.append(node)
-                        total_nodes += 1
-                    except Exception as e:
-                        logger.warning(f"创建节点失败: {str(e)}")
+                total_entities += len(entities)
+                total_relations += len(relations)
+
+            # 创建知识节点
+            try:
+                nodes_by_key, new_nodes = await self._get_or_create_nodes(entity_creates, user_id, db)
+                total_nodes += len(entity_creates)
+                await self._create_neo4j_nodes(new_nodes)
+            except Exception as e:
+                logger.warning(f"创建节点失败: {str(e)}")
+                await db.rollback()
+                nodes_by_key = {}
+
+            # 创建知识关系
+            relation_creates = []
+            for (chunk, _, relations, _), resolved_entities in zip(extracted, chunk_entity_keys):
+                chunk_source = f"document_{document_id}_chunk_{chunk.id}"
+
+                # 实体 (名称, 类型) 经代表实体映射到节点
+                entity_nodes = {
+                    key: nodes_by_key.get((rep['text'], rep['type']))
+                    for key, rep in resolved_entities.items()
+                }
 
-                # 创建知识关系
                 for relation_data in relations:
-                    # 查找对应的节点
-                    source_node = next((n for n in created_nodes
-                                       if n.name == relation_data['source']['text']), None)
-                    target_node = next((n for n in created_nodes
-                                       if n.name == relation_data['target']['text']), None)
-
-                    if source_node and target_node:
-                        relation_create = RelationCreate(
+                    source_entity, target_entity = relation_data['source'], relation_data['target']
+                    source_node = entity_nodes.get((source_entity['text'], source_entity['type']))
+                    target_node = entity_nodes.get((target_entity['text'], target_entity['type']))
+
+                    if source_node and target_node and source_node is not target_node:
+                        relation_creates.append(RelationCreate(
                             source_node_id=source_node.id,
                             target_node_id=target_node.id,
                             type=relation_data['type'],
                             properties={'method': relation_data['method']},
                             confidence=relation_data['confidence'],
-                            source=f"document_{document_id}_chunk_{chunk.id}",
+                            source=chunk_source,
                             context=relation_data.get('context', '')
-                        )
+                        ))
 
-                        try:
-                            await self.create_knowledge_relation(relation_create, user_id, db)
-                            total_edges += 1
-                        except Exception as e:
-                            logger.warning(f"创建关系失败: {str(e)}")
-
-                total_entities += len(entities)
-                total_relations += len(relations)
+            try:
+                _, new_relations = await self._get_or_create_relations(relation_creates, user_id, db)
+                total_edges += len(relation_creates)
+                await self._create_neo4j_relations(new_relations)
+            except Exception as e:
+                logger.warning(f"创建关系失败: {str(e)}")
+                await db.rollback()
 
             result = {
                 'document_id': document_id,
@@ -773,9 +1302,12 @@ class KnowledgeGraphService:
         if query_request.min_confidence:
             query = query.where(KnowledgeNode.confidence >= query_request.min_confidence)
 
-        # 执行查询
-        result = await db.execute(query)
+        # 结果只取当前页，总数仅在调用方需要时单独统计
+        result = await db.execute(
+            query.order_by(KnowledgeNode.id).limit(query_request.limit).offset(query_request.offset)
+        )
         nodes = result.scalars().all()
+        total = await self._count_total(query, query_request, len(nodes), db)
 
         return {
             'nodes': [
@@ -790,9 +1322,16 @@ class KnowledgeGraphService:
                 }
                 for node in nodes
             ],
-            'total': len(nodes)
+            'total': total
         }
 
+    @staticmethod
+    async def _count_total(query, query_request: GraphQueryRequest, page_size: int, db: AsyncSession) -> int:
+        """统计查询结果总数；调用方不需要时跳过count查询，返回已知的结果数"""
+        if not query_request.include_total:
+            return query_request.offset + page_size
+        return await db.scalar(select(func.count()).select_from(query.subquery()))
+
     async def _search_relations(
         self,
         query_request: GraphQueryRequest,
@@ -801,6 +1340,11 @@ class KnowledgeGraphService:
     ) -> Dict[str, Any]:
         """搜索关系"""
         query = select(KnowledgeRelation).where(KnowledgeRelation.user_id == user_id)
+        # 两端节点与关系同批加载，归属校验在SQL中完成
+        query = query.where(
+            KnowledgeRelation.source_node.has(KnowledgeNode.user_id == user_id),
+            KnowledgeRelation.target_node.has(KnowledgeNode.user_id == user_id)
+        )
 
         # 添加过滤条件
         if query_request.relation_type:
@@ -812,39 +1356,29 @@ class KnowledgeGraphService:
         if query_request.target_node_id:
             query = query.where(KnowledgeRelation.target_node_id == query_request.target_node_id)
 
-        # 执行查询
-        result = await db.execute(query)
-        relations = result.scalars().all()
-
-        # 获取关联的节点信息
-        node_ids = set()
-        for relation in relations:
-            node_ids.add(relation.source_node_id)
-            node_ids.add(relation.target_node_id)
-
-        nodes_result = await db.execute(
-            select(KnowledgeNode).where(
-                and_(
-                    KnowledgeNode.id.in_(node_ids),
-                    KnowledgeNode.user_id == user_id
-                )
-            )
+        # 结果只取当前页，总数仅在调用方需要时单独统计
+        result = await db.execute(
+            query.options(
+                selectinload(KnowledgeRelation.source_node),
+                selectinload(KnowledgeRelation.target_node)
+            ).order_by(KnowledgeRelation.id).limit(query_request.limit).offset(query_request.offset)
         )
-        nodes = {node.id: node for node in nodes_result.scalars().all()}
+        relations = result.scalars().all()
+        total = await self._count_total(query, query_request, len(relations), db)
 
         return {
             'relations': [
                 {
                     'id': relation.id,
                     'source_node': {
-                        'id': nodes[relation.source_node_id].id,
-                        'name': nodes[relation.source_node_id].name,
-                        'type': nodes[relation.source_node_id].type
+                        'id': relation.source_node.id,
+                        'name': relation.source_node.name,
+                        'type': relation.source_node.type
                     },
                     'target_node': {
-                        'id': nodes[relation.target_node_id].id,
-                        'name': nodes[relation.target_node_id].name,
-                        'type': nodes[relation.target_node_id].type
+                        'id': relation.target_node.id,
+                        'name': relation.target_node.name,
+                        'type': relation.target_node.type
                     },
                     'type': relation.type,
                     'properties': relation.properties,
@@ -852,9 +1386,9 @@ class KnowledgeGraphService:
                     'context': relation.context,
                     'created_at': relation.created_at
                 }
-                for relation in relations if relation.source_node_id in nodes and relation.target_node_id in nodes
+                for relation in relations
             ],
-            'total': len(relations)
+            'total': total
         }
 
     async def _search_paths(
@@ -868,149 +1402,221 @@ class KnowledgeGraphService:
             raise ValueError("路径搜索需要指定源节点和目标节点")
 
         try:
-            if not self.neo4j_driver:
-                await self.connect_neo4j()
-
-            with self.neo4j_driver.session() as session:
-                # 使用Neo4j图算法查找最短路径
-                cypher_query = """
-                MATCH (start:Entity {id: $source_id, user_id: $user_id}),
-                      (end:Entity {id: $target_id, user_id: $user_id})
-                MATCH path = shortestPath((start)-[*1..6]-(end))
-                RETURN path, length(path) as path_length
-                ORDER BY path_length
-                LIMIT $limit
-                """
-
-                result = session.run(cypher_query, {
-                    'source_id': query_request.source_node_id,
-                    'target_id': query_request.target_node_id,
-                    'user_id': user_id,
-                    'limit': query_request.limit or 10
-                })
-
-                paths = []
-                for record in result:
-                    path = record['path']
-                    path_length = record['path_length']
-
-                    # 提取路径中的节点和关系
-                    nodes = []
-                    relations = []
-
-                    for node in path.nodes:
-                        nodes.append({
-                            'id': node['id'],
-                            'name': node['name'],
-                            'type': node['type']
-                        })
-
-                    for rel in path.relationships:
-                        relations.append({
-                            'type': rel['type'],
-                            'properties': json.loads(rel.get('properties', '{}')),
-                            'confidence': rel['confidence']
-                        })
+            paths = [path async for path in self.stream_paths(query_request, user_id)]
 
-                    paths.append({
-                        'nodes': nodes,
-                        'relations': relations,
-                        'length': path_length
-                    })
-
-                return {
-                    'paths': paths,
-                    'total': len(paths)
-                }
+            return {
+                'paths': paths,
+                'total': len(paths)
+            }
 
         except Exception as e:
             logger.error(f"搜索路径失败: {str(e)}")
             return {'paths': [], 'total': 0}
 
+    async def stream_paths(
+        self,
+        query_request: GraphQueryRequest,
+        user_id: int
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """
+        逐条产出路径
+
+        记录从Neo4j游标按批拉取，每条路径处理完即产出，不在内存中累积整个结果集
+
+        Args:
+            query_request: 查询请求（需指定源节点和目标节点）
+            user_id: 用户ID
+
+        Yields:
+            路径字典，nodes、relations按列组织（每个字段一个数组），另含length
+        """
+        driver = await self._get_driver()
+
+        # 使用Neo4j图算法查找最短路径，起止节点通过 (user_id, id) 复合索引定位；
+        # 长度上限与关系类型在服务端剪枝，节点与关系字段按列投影，响应中每个字段名只出现一次。
+        # 变长模式的上限不能参数化，max_length 已由请求模式校验为整数
+        cypher_query = f"""
+        MATCH (start:Entity), (end:Entity)
+        WHERE start.user_id = $user_id AND start.id = $source_id
+          AND end.user_id = $user_id AND end.id = $target_id
+        MATCH path = shortestPath((start)-[*1..{int(query_request.max_length)}]-(end))
+        WHERE $relation_types IS NULL OR all(r IN relationships(path) WHERE r.type IN $relation_types)
+        WITH path, nodes(path) AS ns, relationships(path) AS rs
+        WHERE length(path) >= $min_length
+        RETURN {{id: [n IN ns | n.id], name: [n IN ns | n.name], type: [n IN ns | n.type]}} AS nodes,
+               {{type: [r IN rs | r.type], properties: [r IN rs | properties(r)],
+                confidence: [r IN rs | r.confidence]}} AS relations,
+               length(path) AS length
+        ORDER BY length
+        LIMIT $limit
+        """
+
+        async with driver.session(database=settings.NEO4J_DATABASE) as session:
+            result = await session.run(
+                cypher_query,
+                source_id=query_request.source_node_id,
+                target_id=query_request.target_node_id,
+                user_id=user_id,
+                min_length=query_request.min_length,
+                relation_types=[
+                    relation_type.value for relation_type in query_request.relation_types
+                ] if query_request.relation_types else None,
+                limit=query_request.limit or 10
+            )
+
+            async for record in result:
+                path = record.data()
+                # 不依赖APOC，内置字段在这里从关系属性中去除
+                relations = path['relations']
+                relations['properties'] = [
+                    self._relation_properties(properties) for properties in relations['properties']
+                ]
+                yield path
+
     async def _execute_cypher_query(
         self,
         query_request: GraphQueryRequest,
         user_id: int
     ) -> Dict[str, Any]:
-        """执行Cypher查询"""
+        """执行Cypher查询（只读，结果限定为当前用户的图数据）"""
         try:
-            if not self.neo4j_driver:
-                await self.connect_neo4j()
-
-            with self.neo4j_driver.session() as session:
-                # 在查询中添加用户ID过滤，确保数据安全
-                modified_query = query_request.cypher_query.replace(
-                    "MATCH (",
-                    f"MATCH (n:Entity {{user_id: {user_id}}})"
+            driver = await self._get_driver()
+
+            # 读会话由服务端强制只读，写子句即使绕过计划检查也会被拒绝
+            async with driver.session(
+                database=settings.NEO4J_DATABASE,
+                default_access_mode=READ_ACCESS
+            ) as session:
+                await session.execute_read(
+                    self._check_read_only_plan, query_request.cypher_query, user_id
+                )
+                records = await session.execute_read(
+                    self._read_user_scoped_records, query_request.cypher_query, user_id
                 )
 
-                result = session.run(modified_query)
-
-                records = []
-                for record in result:
-                    records.append(dict(record))
-
-                return {
-                    'records': records,
-                    'total': len(records)
-                }
+            return {
+                'records': records,
+                'total': len(records)
+            }
 
         except Exception as e:
             logger.error(f"执行Cypher查询失败: {str(e)}")
             raise
 
+    @staticmethod
+    async def _check_read_only_plan(tx, cypher_query: str, user_id: int):
+        """通过 EXPLAIN 校验查询计划为只读且不调用过程"""
+        result = await tx.run(f"EXPLAIN {cypher_query}", {'user_id': user_id})
+        summary = await result.consume()
+
+        if summary.query_type != 'r':
+            raise ValueError("Cypher查询只允许只读操作")
+
+        plans = [summary.plan] if summary.plan else []
+        while plans:
+            plan = plans.pop()
+            operator = plan.get('operatorType', '')
+            if any(name in operator for name in CYPHER_FORBIDDEN_OPERATORS):
+                raise ValueError(f"Cypher查询不允许使用操作: {operator}")
+            plans.extend(plan.get('children', []))
+
+    @classmethod
+    async def _read_user_scoped_records(
+        cls,
+        tx,
+        cypher_query: str,
+        user_id: int
+    ) -> List[Dict[str, Any]]:
+        """执行查询并校验返回的每个图元素都属于当前用户"""
+        result = await tx.run(cypher_query, {'user_id': user_id})
+        records = [record async for record in result]
+
+        # 标量值无法判断归属，只允许返回节点、关系、路径及其列表/映射
+        for record in records:
+            for value in record.values():
+                cls._check_user_scope(value, user_id)
+
+        return [record.data() for record in records]
+
+    @classmethod
+    def _check_user_scope(cls, value: Any, user_id: int):
+        """校验返回值中的节点与关系均归属当前用户"""
+        if isinstance(value, Path):
+            for element in chain(value.nodes, value.relationships):
+                cls._check_user_scope(element, user_id)
+        elif isinstance(value, (Node, Relationship)):
+            if value.get('user_id') != user_id:
+                raise PermissionError("Cypher查询结果包含其他用户的数据")
+            if isinstance(value, Relationship):
+                for node in (value.start_node, value.end_node):
+                    if node is not None and 'user_id' in node and node['user_id'] != user_id:
+                        raise PermissionError("Cypher查询结果包含其他用户的数据")
+        elif isinstance(value, list):
+            for item in value:
+                cls._check_user_scope(item, user_id)
+        elif isinstance(value, dict):
+            for item in value.values():
+                cls._check_user_scope(item, user_id)
+        elif value is not None:
+            raise ValueError("Cypher查询只能返回节点、关系或路径")
+
     async def get_knowledge_statistics(
         self,
         user_id: int,
         db: AsyncSession
     ) -> Dict[str, Any]:
         """获取知识图谱统计信息"""
+        cache_key = self._statistics_cache_key(user_id)
         try:
-            # 节点统计
-            node_count_query = select(func.count(KnowledgeNode.id)).where(
-                KnowledgeNode.user_id == user_id
-            )
-            node_count_result = await db.execute(node_count_query)
-            total_nodes = node_count_result.scalar() or 0
+            cached = await redis_client.get(cache_key)
+            if cached:
+                return json.loads(cached)
+        except Exception as e:
+            logger.warning(f"读取知识图谱统计缓存失败: {str(e)}")
 
-            # 关系统计
-            relation_count_query = select(func.count(KnowledgeRelation.id)).where(
-                KnowledgeRelation.user_id == user_id
-            )
-            relation_count_result = await db.execute(relation_count_query)
-            total_relations = relation_count_result.scalar() or 0
-
-            # 按类型统计节点
-            node_type_query = select(
-                KnowledgeNode.type,
-                func.count().label('count')
-            ).where(
-                KnowledgeNode.user_id == user_id
-            ).group_by(KnowledgeNode.type)
-
-            node_type_result = await db.execute(node_type_query)
-            node_types = {row.type: row.count for row in node_type_result}
-
-            # 按类型统计关系
-            relation_type_query = select(
-                KnowledgeRelation.type,
-                func.count().label('count')
-            ).where(
-                KnowledgeRelation.user_id == user_id
-            ).group_by(KnowledgeRelation.type)
-
-            relation_type_result = await db.execute(relation_type_query)
-            relation_types = {row.type: row.count for row in relation_type_result}
+        try:
+            # 计数由触发器随节点、关系增删增量维护，统计只需读取一行
+            # 只取需要的列并按映射读取，不经过ORM实体加载与标识映射
+            async with get_read_db_session() as read_db:
+                user_stats = (await read_db.execute(
+                    select(
+                        KnowledgeUserStats.total_nodes,
+                        KnowledgeUserStats.total_relations,
+                        KnowledgeUserStats.node_types,
+                        KnowledgeUserStats.relation_types
+                    ).where(KnowledgeUserStats.user_id == user_id)
+                )).mappings().first()
+
+            if user_stats:
+                total_nodes = user_stats['total_nodes']
+                total_relations = user_stats['total_relations']
+                node_types = user_stats['node_types'] or {}
+                relation_types = user_stats['relation_types'] or {}
+            else:
+                node_types, relation_types = await self._rebuild_user_stats(user_id, db)
+                total_nodes = sum(node_types.values())
+                total_relations = sum(relation_types.values())
 
-            return {
+            statistics = {
                 'total_nodes': total_nodes,
                 'total_relations': total_relations,
                 'node_types': node_types,
                 'relation_types': relation_types,
                 'graph_density': (2 * total_relations) / (total_nodes * (total_nodes - 1)) if total_nodes > 1 else 0,
-                'updated_at': datetime.utcnow().isoformat()
+                'updated_at': datetime.now(timezone.utc).isoformat(timespec='seconds')
             }
 
+            try:
+                await redis_client.setex(
+                    cache_key,
+                    settings.KNOWLEDGE_STATISTICS_CACHE_TTL,
+                    json.dumps(statistics)
+                )
+            except Exception as e:
+                logger.warning(f"写入知识图谱统计缓存失败: {str(e)}")
+
+            return statistics
+
         except Exception as e:
             logger.error(f"获取知识图谱统计失败: {str(e)}")
             return {
@@ -1020,6 +1626,69 @@ class KnowledgeGraphService:
                 'relation_types': {}
             }
 
+    async def _rebuild_user_stats(
+        self,
+        user_id: int,
+        db: AsyncSession
+    ) -> Tuple[Dict[str, int], Dict[str, int]]:
+        """全量计算用户的统计行并写入（之后由触发器增量维护）"""
+        # 与触发器持同一把咨询锁直到提交：并发的增删要么已提交并计入快照，
+        # 要么等待统计行写入后再由触发器更新
+        await db.execute(select(func.pg_advisory_xact_lock(KG_USER_STATS_LOCK_CLASS, user_id)))
+
+        # 节点与关系按类型分组计数，由数据库聚合为映射后在一行中返回
+        node_counts = select(
+            KnowledgeNode.type.label('type'),
+            func.count().label('count')
+        ).where(
+            KnowledgeNode.user_id == user_id
+        ).group_by(KnowledgeNode.type).subquery()
+
+        relation_counts = select(
+            KnowledgeRelation.type.label('type'),
+            func.count().label('count')
+        ).where(
+            KnowledgeRelation.user_id == user_id
+        ).group_by(KnowledgeRelation.type).subquery()
+
+        statistics_query = select(
+            select(
+                func.jsonb_object_agg(node_counts.c.type, node_counts.c.count, type_=JSONB)
+            ).scalar_subquery().label('node_types'),
+            select(
+                func.jsonb_object_agg(relation_counts.c.type, relation_counts.c.count, type_=JSONB)
+            ).scalar_subquery().label('relation_types')
+        )
+
+        row = (await db.execute(statistics_query)).one()
+        node_types = row.node_types or {}
+        relation_types = row.relation_types or {}
+
+        await db.execute(
+            pg_insert(KnowledgeUserStats).values(
+                user_id=user_id,
+                total_nodes=sum(node_types.values()),
+                total_relations=sum(relation_types.values()),
+                node_types=node_types,
+                relation_types=relation_types
+            ).on_conflict_do_nothing(index_elements=[KnowledgeUserStats.user_id])
+        )
+        await db.commit()
+
+        return node_types, relation_types
+
+    @staticmethod
+    def _statistics_cache_key(user_id: int) -> str:
+        """知识图谱统计缓存键"""
+        return f"kg:stats:{user_id}"
+
+    async def _invalidate_statistics_cache(self, user_id: int):
+        """节点或关系变更后失效统计缓存"""
+        try:
+            await redis_client.delete(self._statistics_cache_key(user_id))
+        except Exception as e:
+            logger.warning(f"清除知识图谱统计缓存失败: {str(e)}")
+
 
 # 全局知识图谱服务实例
 knowledge_graph_service = KnowledgeGraphService()
\ No newline at end of file
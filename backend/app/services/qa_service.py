@@ -3,125 +3,367 @@
 实现多源查询检索和答案融合
 """
 import asyncio
+import hashlib
+import re
 import time
 import uuid
+from bisect import bisect_right
 from datetime import datetime
-from typing import List, Dict, Any, Optional, Tuple
+from itertools import chain
+from operator import itemgetter
+from typing import List, Dict, Any, Optional, Tuple, Set, AsyncIterator, Iterator
 import logging
 import json
 
+import numpy as np
+from cachetools import LRUCache, TTLCache
+
 from app.schemas.qa import (
     QueryRequest, QueryResponse, RetrievalResult, AnswerGenerationRequest,
     GeneratedAnswer, RetrievedDocument, RetrievedKnowledge, RetrievedCostData,
     QueryType, DataSource, ConversationContext, QuerySuggestion,
     QualityMetrics, AnswerQuality
 )
-from app.services.document_service import DocumentService
-from app.services.knowledge_graph_service import KnowledgeGraphService
-from app.services.cost_estimation_service import CostEstimationService
-from app.services.ai_model_service import AIModelService, AIProvider
+from app.services.document_service import document_service
+from app.services.document_processor import document_processor
+from app.services.knowledge_graph_service import knowledge_graph_service
+from app.services.cost_estimation_service import cost_estimation_service
+from app.services.ai_model_service import ai_model_service, AIProvider
 from app.core.config import get_settings
+from app.utils.pattern_scanner import MultiPatternScanner
+from app.utils.similarity import cosine_scores
+from app.utils.text_dedup import content_defined_chunks
 
 logger = logging.getLogger(__name__)
 settings = get_settings()
 
+# 固定不变的系统提示词放在消息最前面，检索上下文与问题放在其后，
+# 使各次请求共享相同的前缀，可命中模型提供商的前缀缓存
+QA_SYSTEM_PROMPT = """你是一个专业的工程成本咨询专家，请基于提供的上下文信息回答用户问题。
+
+请提供：
+1. 准确、详细的答案
+2. 相关的数据和事实支持
+3. 实用的建议或结论
+
+回答要求：
+- 专业且准确
+- 条理清晰
+- 信息完整
+- 语言简洁明了"""
+
+# 用户消息的固定开头，每次只拼接上下文与问题
+QA_PROMPT_HEAD = "请基于以下上下文信息回答用户问题：\n\n上下文信息：\n"
+
+# 查询类型关键词，按优先级排列，问题同时命中多个类型时取靠前的类型
+QUERY_TYPE_KEYWORDS = (
+    # 成本估算关键词
+    (QueryType.COST_ESTIMATION, frozenset({"成本", "价格", "费用", "预算", "造价", "报价", "投资"})),
+    # 技术咨询关键词
+    (QueryType.TECHNICAL, frozenset({"技术", "工艺", "标准", "规范", "方法", "方案"})),
+    # 市场分析关键词
+    (QueryType.MARKET, frozenset({"市场", "趋势", "行情", "供需", "价格走势"})),
+    # 法规咨询关键词
+    (QueryType.REGULATORY, frozenset({"法规", "标准", "规范", "政策", "规定"})),
+    # 项目管理关键词
+    (QueryType.PROJECT_MANAGEMENT, frozenset({"项目", "管理", "进度", "计划", "风险", "质量"})),
+    # 材料咨询关键词
+    (QueryType.MATERIAL, frozenset({"材料", "原料", "建材", "耗材"})),
+    # 设备咨询关键词
+    (QueryType.EQUIPMENT, frozenset({"设备", "机械", "工具", "仪器"})),
+)
+
+# 查询失败时返回的答案模板
+ERROR_ANSWER = GeneratedAnswer(
+    answer="抱歉，处理您的问题时遇到了错误，请稍后重试。",
+    confidence_score=0.0,
+    quality_score=0.0,
+    generation_time=0.0,
+    model_used="error_handler"
+)
+
+# 非简单查询未检索到任何内容时返回的答案模板，不调用AI模型
+INSUFFICIENT_CONTEXT_ANSWER = GeneratedAnswer(
+    answer="抱歉，未检索到与您问题相关的资料，暂时无法给出可靠答案。请补充问题细节或换个问法后重试。",
+    confidence_score=0.0,
+    quality_score=0.0,
+    generation_time=0.0,
+    model_used="none",
+    metadata={"path": "insufficient_context"}
+)
+
+# 各生成路径使用的模型：检索结果较少时改用轻量模型
+QA_PATH_MODELS = {
+    "full": "glm-4",
+    "light": "glm-4-flash",
+}
+
+# 检索结果少于该数量时走轻量模型路径
+QA_LIGHT_PATH_MAX_RETRIEVED = 2
+
+# 检索结果指纹版本，指纹的计算方式变化时递增，使旧缓存键失效
+RETRIEVAL_FINGERPRINT_VERSION = "v1"
+
+# 最近问题文本的嵌入缓存条目数，同一请求内上下文增强、语义缓存与对话历史复用同一次编码
+QUESTION_EMBEDDING_CACHE_SIZE = 1024
+
+# 各查询类型需要优先检索的数据源
+QUERY_TYPE_PRIORITY_SOURCES = {
+    QueryType.COST_ESTIMATION: DataSource.COST_DATABASE,
+    QueryType.TECHNICAL: DataSource.KNOWLEDGE_GRAPH,
+    QueryType.MATERIAL: DataSource.COST_DATABASE,
+    QueryType.EQUIPMENT: DataSource.COST_DATABASE,
+}
+
 
 class QAService:
     """智能问答服务类"""
 
     def __init__(self):
-        self.document_service = DocumentService()
-        self.knowledge_graph_service = KnowledgeGraphService()
-        self.cost_estimation_service = CostEstimationService()
-        self.ai_model_service = AIModelService()
-
-        # 对话上下文缓存
-        self.conversation_cache: Dict[str, ConversationContext] = {}
-
-        # 查询类型处理策略
-        self.query_strategies = {
-            QueryType.SIMPLE: self._handle_simple_query,
-            QueryType.COMPLEX: self._handle_complex_query,
-            QueryType.COST_ESTIMATION: self._handle_cost_estimation_query,
-            QueryType.TECHNICAL: self._handle_technical_query,
-            QueryType.MARKET: self._handle_market_query,
-            QueryType.REGULATORY: self._handle_regulatory_query,
-            QueryType.PROJECT_MANAGEMENT: self._handle_project_management_query,
-            QueryType.MATERIAL: self._handle_material_query,
-            QueryType.EQUIPMENT: self._handle_equipment_query
+        # 复用全局服务实例，共享已预热的Neo4j驱动、嵌入模型与HTTP连接池
+        self.document_service = document_service
+        self.knowledge_graph_service = knowledge_graph_service
+        self.cost_estimation_service = cost_estimation_service
+        self.ai_model_service = ai_model_service
+
+        # 对话上下文缓存，超过容量时淘汰最久未使用的会话，闲置超时的会话在写入时清除
+        self.conversation_cache: TTLCache = TTLCache(
+            maxsize=settings.QA_CONVERSATION_CACHE_SIZE,
+            ttl=settings.QA_CONVERSATION_TTL
+        )
+        # 各会话历史问题的嵌入矩阵，行与 conversation_history 一一对应
+        self._history_embeddings: TTLCache = TTLCache(
+            maxsize=settings.QA_CONVERSATION_CACHE_SIZE,
+            ttl=settings.QA_CONVERSATION_TTL
+        )
+        self._question_embeddings: LRUCache = LRUCache(maxsize=QUESTION_EMBEDDING_CACHE_SIZE)
+
+        # 答案缓存：精确缓存按 (用户, 问题, 查询类型, 检索结果指纹) 命中；
+        # 语义缓存按问题嵌入相似度命中，并要求查询类型、检索结果指纹与对话上下文链一致，避免追问误命中
+        self._exact_cache: TTLCache = TTLCache(
+            maxsize=settings.QA_ANSWER_CACHE_SIZE,
+            ttl=settings.QA_ANSWER_CACHE_TTL
+        )
+        self._semantic_embeddings: Optional[np.ndarray] = None
+        # (用户, 上下文链, 缓存范围, 过期时间, 答案)，按写入顺序排列，过期时间随之递增
+        self._semantic_entries: List[Tuple[Optional[int], str, str, float, GeneratedAnswer]] = []
+
+        # 进行中的查询，相同的并发查询共享同一个处理任务
+        self._inflight: Dict[str, asyncio.Task] = {}
+
+        # 每个查询类型的关键词编译为一个正则，一次扫描找出命中的类型
+        self.query_type_patterns = {
+            query_type: re.compile("|".join(map(re.escape, sorted(keywords))))
+            for query_type, keywords in QUERY_TYPE_KEYWORDS
         }
+        self.query_type_scanner = MultiPatternScanner(self.query_type_patterns)
 
     async def process_query(self, query_request: QueryRequest) -> QueryResponse:
         """
         处理查询请求
 
+        与进行中的相同查询合并：后到的请求等待同一个处理任务，不重复检索和生成
+
         Args:
             query_request: 查询请求
 
         Returns:
             查询响应
         """
-        start_time = time.time()
-        query_id = f"query_{uuid.uuid4().hex[:12]}"
-
-        try:
-            logger.info(f"开始处理查询: {query_id}, 问题: {query_request.question[:50]}...")
-
-            # 1. 查询预处理
-            processed_query = await self._preprocess_query(query_request)
-
-            # 2. 多源检索
-            retrieval_result = await self._multi_source_retrieval(processed_query)
-
-            # 3. 答案生成
-            answer = await self._generate_answer(processed_query, retrieval_result)
-
-            # 4. 后处理和优化
-            optimized_answer = await self._postprocess_answer(answer, retrieval_result)
-
-            # 5. 构建响应
-            processing_time = time.time() - start_time
-            response = QueryResponse(
-                query_id=query_id,
-                question=query_request.question,
-                answer=optimized_answer,
-                retrieval_result=retrieval_result,
-                query_type=query_request.query_type,
-                processing_time=processing_time,
-                user_id=query_request.user_id,
-                session_id=query_request.session_id
+        key = self._inflight_key(query_request)
+        if key is None:
+            return await self._process_query_pipeline(query_request)
+
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.create_task(self._process_query_pipeline(query_request))
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+            # shield：发起请求被取消时，共享任务仍为其他请求继续执行
+            return await asyncio.shield(task)
+
+        shared = await asyncio.shield(task)
+        response = shared.model_copy(deep=True, update={
+            "query_id": f"query_{uuid.uuid4().hex[:12]}",
+            "session_id": query_request.session_id
+        })
+        if query_request.session_id:
+            await self._update_conversation_context(
+                query_request, response, self._normalize_question(query_request.question)
             )
+        return response
 
-            # 6. 更新对话上下文
-            if query_request.session_id:
-                await self._update_conversation_context(query_request, response)
+    def _inflight_key(self, query_request: QueryRequest) -> Optional[str]:
+        """查询合并键；会话已有对话上下文时问题会被上下文增强，不参与合并"""
+        if query_request.session_id and query_request.session_id in self.conversation_cache:
+            return None
+
+        key = json.dumps(
+            [
+                query_request.user_id,
+                self._normalize_question(query_request.question),
+                query_request.query_type,
+                sorted(query_request.include_sources),
+                query_request.max_results,
+                query_request.filters
+            ],
+            ensure_ascii=False,
+            sort_keys=True,
+            default=str
+        )
+        return hashlib.blake2b(key.encode("utf-8"), digest_size=16).hexdigest()
 
-            logger.info(f"查询处理完成: {query_id}, 耗时: {processing_time:.2f}秒")
-            return response
+    async def _process_query_pipeline(self, query_request: QueryRequest) -> QueryResponse:
+        """执行查询处理流程，失败时返回错误响应"""
+        start_time = time.monotonic()
+        query_id = f"query_{uuid.uuid4().hex[:12]}"
 
+        try:
+            return await self._process_query_steps(query_request, query_id, start_time)
         except Exception as e:
             logger.error(f"查询处理失败: {query_id}, 错误: {str(e)}")
-            # 返回错误响应
-            return QueryResponse(
-                query_id=query_id,
-                question=query_request.question,
-                answer=GeneratedAnswer(
-                    answer="抱歉，处理您的问题时遇到了错误，请稍后重试。",
-                    confidence_score=0.0,
-                    quality_score=0.0,
-                    generation_time=time.time() - start_time,
-                    model_used="error_handler"
-                ),
-                retrieval_result=RetrievalResult(
-                    query=query_request.question,
-                    processing_time=0.0,
-                    retrieval_method="error"
-                ),
-                query_type=query_request.query_type,
-                processing_time=time.time() - start_time,
-                user_id=query_request.user_id,
-                session_id=query_request.session_id
-            )
+            return self._error_response(query_request, query_id, time.monotonic() - start_time)
+
+    async def _process_query_steps(
+        self,
+        query_request: QueryRequest,
+        query_id: str,
+        start_time: float
+    ) -> QueryResponse:
+        """查询处理步骤：预处理、多源检索、答案生成、后处理"""
+        logger.info(f"开始处理查询: {query_id}, 问题: {query_request.question[:50]}...")
+
+        # 1. 查询预处理（预处理会推断查询类型并用上下文改写问题，先保留调用方请求的类型与问题）
+        requested_type = query_request.query_type
+        original_question = self._normalize_question(query_request.question)
+        processed_query = await self._preprocess_query(query_request)
+
+        # 2. 多源检索
+        retrieval_result = await self._multi_source_retrieval(processed_query)
+
+        # 3. 答案生成
+        answer = await self._generate_answer(processed_query, retrieval_result, requested_type)
+
+        # 4. 后处理和优化
+        optimized_answer = await self._postprocess_answer(answer, retrieval_result)
+
+        # 5. 构建响应
+        processing_time = time.monotonic() - start_time
+        response = QueryResponse(
+            query_id=query_id,
+            question=query_request.question,
+            answer=optimized_answer,
+            retrieval_result=retrieval_result,
+            query_type=query_request.query_type,
+            processing_time=processing_time,
+            user_id=query_request.user_id,
+            session_id=query_request.session_id
+        )
+
+        # 6. 更新对话上下文
+        if query_request.session_id:
+            await self._update_conversation_context(query_request, response, original_question)
+
+        logger.info(f"查询处理完成: {query_id}, 耗时: {processing_time:.2f}秒")
+        return response
+
+    @staticmethod
+    def _error_response(query_request: QueryRequest, query_id: str, processing_time: float) -> QueryResponse:
+        """构建查询失败时的错误响应"""
+        return QueryResponse(
+            query_id=query_id,
+            question=query_request.question,
+            answer=ERROR_ANSWER.model_copy(deep=True, update={"generation_time": processing_time}),
+            retrieval_result=RetrievalResult(
+                query=query_request.question,
+                processing_time=0.0,
+                retrieval_method="error"
+            ),
+            query_type=query_request.query_type,
+            processing_time=processing_time,
+            user_id=query_request.user_id,
+            session_id=query_request.session_id
+        )
+
+    async def stream_query(self, query_request: QueryRequest) -> AsyncIterator[Dict[str, Any]]:
+        """
+        流式处理查询请求
+
+        检索完成后边接收模型输出边返回增量文本，来源与引用信息在生成期间并行构建
+
+        Args:
+            query_request: 查询请求
+
+        Yields:
+            {"event": "delta", "content": 文本片段}，最后为 {"event": "answer", "response": 查询响应}
+        """
+        start_time = time.monotonic()
+        query_id = f"query_{uuid.uuid4().hex[:12]}"
+        logger.info(f"开始流式处理查询: {query_id}, 问题: {query_request.question[:50]}...")
+
+        requested_type = query_request.query_type
+        original_question = self._normalize_question(query_request.question)
+        processed_query = await self._preprocess_query(query_request)
+        retrieval_result = await self._multi_source_retrieval(processed_query)
+
+        path = self._generation_path(requested_type, retrieval_result)
+        if path == "insufficient_context":
+            answer = self._insufficient_context_answer(0.0)
+            yield {"event": "delta", "content": answer.answer}
+        else:
+            sources_task = asyncio.create_task(asyncio.to_thread(self._build_sources_info, retrieval_result))
+            references_task = asyncio.create_task(asyncio.to_thread(self._build_references, retrieval_result))
+
+            try:
+                context = self._build_context_from_retrieval(retrieval_result)
+                prompt = self._build_generation_prompt(processed_query, context)
+
+                generation_start = time.monotonic()
+                chunks = []
+                async for delta in self.ai_model_service.chat_completion_stream(
+                    provider=AIProvider.ZHIPUAI,
+                    model=QA_PATH_MODELS[path],
+                    messages=[
+                        {"role": "system", "content": QA_SYSTEM_PROMPT},
+                        {"role": "user", "content": prompt}
+                    ],
+                    temperature=0.7,
+                    max_tokens=2000
+                ):
+                    chunks.append(delta)
+                    yield {"event": "delta", "content": delta}
+
+                answer_content = "".join(chunks)
+                answer = GeneratedAnswer(
+                    answer=answer_content,
+                    confidence_score=self._calculate_confidence_score(answer_content, retrieval_result),
+                    quality_score=self._calculate_quality_score(answer_content, retrieval_result),
+                    sources=await sources_task,
+                    references=await references_task,
+                    metadata={"path": path},
+                    generation_time=time.monotonic() - generation_start,
+                    model_used=QA_PATH_MODELS[path]
+                )
+            finally:
+                sources_task.cancel()
+                references_task.cancel()
+
+        response = QueryResponse(
+            query_id=query_id,
+            question=query_request.question,
+            answer=await self._postprocess_answer(answer, retrieval_result),
+            retrieval_result=retrieval_result,
+            query_type=query_request.query_type,
+            processing_time=time.monotonic() - start_time,
+            user_id=query_request.user_id,
+            session_id=query_request.session_id
+        )
+
+        if query_request.session_id:
+            await self._update_conversation_context(query_request, response, original_question)
+
+        logger.info(f"流式查询处理完成: {query_id}, 耗时: {response.processing_time:.2f}秒")
+        yield {"event": "answer", "response": response}
 
     async def batch_process_queries(self, batch_request) -> Dict[str, Any]:
         """
@@ -134,42 +376,40 @@ class QAService:
             批量查询响应
         """
         batch_id = f"batch_{uuid.uuid4().hex[:12]}"
-        start_time = time.time()
+        start_time = time.monotonic()
 
-        results = []
         successful_queries = 0
         failed_queries = 0
         errors = []
 
-        # 控制并发数量
-        semaphore = asyncio.Semaphore(batch_request.max_concurrent)
+        # 固定数量的工作协程从队列中取查询执行，并发数即工作协程数，
+        # 不为每个查询创建任务；结果按原始顺序写回
+        queue: asyncio.Queue = asyncio.Queue()
+        for index, query_request in enumerate(batch_request.queries):
+            queue.put_nowait((index, query_request))
+        results: List[Any] = [None] * len(batch_request.queries)
 
-        async def process_single_query(query_request):
-            async with semaphore:
+        async def worker():
+            while not queue.empty():
+                index, query_request = queue.get_nowait()
                 try:
-                    response = await self.process_query(query_request)
-                    return response
+                    results[index] = await self.process_query(query_request)
                 except Exception as e:
                     error_msg = f"查询失败: {str(e)}"
                     errors.append(error_msg)
-                    return {"error": error_msg, "query": query_request.question}
+                    results[index] = {"error": error_msg, "query": query_request.question}
 
-        # 并发执行查询
-        tasks = [process_single_query(query) for query in batch_request.queries]
-        raw_results = await asyncio.gather(*tasks, return_exceptions=True)
+        worker_count = min(batch_request.max_concurrent, len(batch_request.queries))
+        await asyncio.gather(*(worker() for _ in range(worker_count)))
 
         # 处理结果
-        for result in raw_results:
-            if isinstance(result, Exception):
-                failed_queries += 1
-                errors.append(f"查询异常: {str(result)}")
-            elif isinstance(result, dict) and "error" in result:
+        for result in results:
+            if isinstance(result, dict) and "error" in result:
                 failed_queries += 1
             else:
                 successful_queries += 1
-            results.append(result)
 
-        processing_time = time.time() - start_time
+        processing_time = time.monotonic() - start_time
 
         return {
             "batch_id": batch_id,
@@ -200,7 +440,10 @@ class QAService:
             inferred_type = await self._infer_query_type(normalized_question)
             query_request.query_type = inferred_type
 
-        # 3. 添加上下文信息
+        # 3. 按查询类型调整检索参数
+        query_request = self._adjust_request_for_type(query_request)
+
+        # 4. 添加上下文信息
         if query_request.session_id and query_request.session_id in self.conversation_cache:
             context = self.conversation_cache[query_request.session_id]
             # 基于对话历史增强查询
@@ -221,18 +464,18 @@ class QAService:
         Returns:
             检索结果
         """
-        start_time = time.time()
+        start_time = time.monotonic()
         retrieval_tasks = []
 
-        # 根据查询类型和数据源配置决定检索策略
+        # 根据查询类型和数据源配置决定检索策略，各数据源的检索创建后立即开始执行
         if DataSource.DOCUMENTS in query_request.include_sources:
-            retrieval_tasks.append(self._retrieve_documents(query_request))
+            retrieval_tasks.append(asyncio.create_task(self._retrieve_documents(query_request)))
 
         if DataSource.KNOWLEDGE_GRAPH in query_request.include_sources:
-            retrieval_tasks.append(self._retrieve_knowledge(query_request))
+            retrieval_tasks.append(asyncio.create_task(self._retrieve_knowledge(query_request)))
 
         if DataSource.COST_DATABASE in query_request.include_sources:
-            retrieval_tasks.append(self._retrieve_cost_data(query_request))
+            retrieval_tasks.append(asyncio.create_task(self._retrieve_cost_data(query_request)))
 
         # 并发执行检索
         retrieval_results = await asyncio.gather(*retrieval_tasks, return_exceptions=True)
@@ -257,9 +500,9 @@ class QAService:
                     cost_data.extend(result)
                 total_retrieved += len(result)
 
-        processing_time = time.time() - start_time
+        processing_time = time.monotonic() - start_time
 
-        return RetrievalResult(
+        retrieval_result = RetrievalResult(
             query=query_request.question,
             documents=documents,
             knowledge=knowledge,
@@ -268,6 +511,21 @@ class QAService:
             processing_time=processing_time,
             retrieval_method="multi_source_fusion"
         )
+        retrieval_result.fingerprint = self._retrieval_fingerprint(retrieval_result)
+        logger.info(f"多源检索完成: 共 {total_retrieved} 条, 指纹: {retrieval_result.fingerprint}")
+
+        return retrieval_result
+
+    @staticmethod
+    def _retrieval_fingerprint(retrieval_result: RetrievalResult) -> str:
+        """检索结果指纹：按稳定ID排序后对 (ID, 相关度分桶) 求哈希，与各数据源的返回顺序无关"""
+        items = (
+            sorted((doc.document_id, round(doc.relevance_score, 2)) for doc in retrieval_result.documents),
+            sorted((knowledge.node_id, round(knowledge.relevance_score, 2)) for knowledge in retrieval_result.knowledge),
+            sorted((cost.cost_id or 0, round(cost.relevance_score, 2)) for cost in retrieval_result.cost_data),
+        )
+        digest = hashlib.blake2b(repr(items).encode("utf-8"), digest_size=16).hexdigest()
+        return f"{RETRIEVAL_FINGERPRINT_VERSION}:{digest}"
 
     async def _retrieve_documents(self, query_request: QueryRequest) -> List[RetrievedDocument]:
         """
@@ -287,21 +545,10 @@ class QAService:
                 filters=query_request.filters
             )
 
-            documents = []
-            for result in search_results.get("results", []):
-                doc = RetrievedDocument(
-                    document_id=result.get("id", 0),
-                    title=result.get("title", ""),
-                    content=result.get("content", ""),
-                    file_path=result.get("file_path", ""),
-                    file_type=result.get("file_type", ""),
-                    relevance_score=result.get("score", 0.0),
-                    chunks=result.get("chunks", []),
-                    metadata=result.get("metadata", {})
-                )
-                documents.append(doc)
-
-            return documents
+            # 结果对象的构建与校验在线程中执行，不占用事件循环
+            return await asyncio.to_thread(
+                self._build_retrieved_documents, search_results.get("results", [])
+            )
 
         except Exception as e:
             logger.error(f"文档检索失败: {str(e)}")
@@ -325,20 +572,9 @@ class QAService:
                 filters=query_request.filters
             )
 
-            knowledge_items = []
-            for result in graph_results.get("results", []):
-                knowledge = RetrievedKnowledge(
-                    node_id=result.get("node_id", 0),
-                    node_name=result.get("name", ""),
-                    node_type=result.get("type", ""),
-                    properties=result.get("properties", {}),
-                    relationships=result.get("relationships", []),
-                    relevance_score=result.get("score", 0.0),
-                    explanation=result.get("explanation", "")
-                )
-                knowledge_items.append(knowledge)
-
-            return knowledge_items
+            return await asyncio.to_thread(
+                self._build_retrieved_knowledge, graph_results.get("results", [])
+            )
 
         except Exception as e:
             logger.error(f"知识图谱检索失败: {str(e)}")
@@ -362,31 +598,70 @@ class QAService:
                 filters=query_request.filters
             )
 
-            cost_items = []
-            for result in cost_results.get("results", []):
-                cost_data = RetrievedCostData(
-                    cost_id=result.get("id"),
-                    item_name=result.get("item_name", ""),
-                    category=result.get("category", ""),
-                    unit=result.get("unit", ""),
-                    price_range=result.get("price_range", {}),
-                    region=result.get("region"),
-                    time_period=result.get("time_period", ""),
-                    relevance_score=result.get("score", 0.0),
-                    source=result.get("source", "")
-                )
-                cost_items.append(cost_data)
-
-            return cost_items
+            return await asyncio.to_thread(
+                self._build_retrieved_cost_data, cost_results.get("results", [])
+            )
 
         except Exception as e:
             logger.error(f"成本数据检索失败: {str(e)}")
             return []
 
+    @staticmethod
+    def _build_retrieved_documents(results: List[Dict[str, Any]]) -> List[RetrievedDocument]:
+        """由文档检索结果构建文档对象（检索服务返回的数据可信，跳过校验直接构建）"""
+        return [
+            RetrievedDocument.model_construct(
+                document_id=result.get("id", 0),
+                title=result.get("title", ""),
+                content=result.get("content", ""),
+                file_path=result.get("file_path", ""),
+                file_type=result.get("file_type", ""),
+                relevance_score=result.get("score", 0.0),
+                chunks=result.get("chunks", []),
+                metadata=result.get("metadata", {})
+            )
+            for result in results
+        ]
+
+    @staticmethod
+    def _build_retrieved_knowledge(results: List[Dict[str, Any]]) -> List[RetrievedKnowledge]:
+        """由知识图谱检索结果构建知识对象（跳过校验直接构建）"""
+        return [
+            RetrievedKnowledge.model_construct(
+                node_id=result.get("node_id", 0),
+                node_name=result.get("name", ""),
+                node_type=result.get("type", ""),
+                properties=result.get("properties", {}),
+                relationships=result.get("relationships", []),
+                relevance_score=result.get("score", 0.0),
+                explanation=result.get("explanation", "")
+            )
+            for result in results
+        ]
+
+    @staticmethod
+    def _build_retrieved_cost_data(results: List[Dict[str, Any]]) -> List[RetrievedCostData]:
+        """由成本数据检索结果构建成本数据对象（跳过校验直接构建）"""
+        return [
+            RetrievedCostData.model_construct(
+                cost_id=result.get("id"),
+                item_name=result.get("item_name", ""),
+                category=result.get("category", ""),
+                unit=result.get("unit", ""),
+                price_range=result.get("price_range", {}),
+                region=result.get("region"),
+                time_period=result.get("time_period", ""),
+                relevance_score=result.get("score", 0.0),
+                source=result.get("source", "")
+            )
+            for result in results
+        ]
+
     async def _generate_answer(
         self,
         query_request: QueryRequest,
-        retrieval_result: RetrievalResult
+        retrieval_result: RetrievalResult,
+        requested_type: Optional[QueryType] = None
     ) -> GeneratedAnswer:
         """
         生成答案
@@ -394,11 +669,40 @@ class QAService:
         Args:
             query_request: 查询请求
             retrieval_result: 检索结果
+            requested_type: 调用方请求的查询类型（预处理前），默认取查询请求的类型
 
         Returns:
             生成的答案
         """
-        start_time = time.time()
+        start_time = time.monotonic()
+
+        # 0. 非简单查询没有检索到任何内容时直接返回，不调用AI模型
+        path = self._generation_path(requested_type or query_request.query_type, retrieval_result)
+        if path == "insufficient_context":
+            return self._insufficient_context_answer(time.monotonic() - start_time)
+
+        # 查询答案缓存，命中时不调用AI模型
+        cache_scope = self._answer_cache_scope(query_request, retrieval_result)
+        cache_key = self._answer_cache_key(query_request, cache_scope)
+        context_chain = self._context_chain(query_request.session_id)
+        question_embedding = None
+        if settings.QA_ANSWER_CACHE_ENABLED:
+            cached = self._exact_cache.get(cache_key)
+            hit_type = "exact"
+            if cached is None:
+                question_embedding = await self._embed_question(
+                    self._normalize_question(query_request.question)
+                )
+                cached = self._lookup_semantic_cache(
+                    question_embedding, query_request.user_id, context_chain, cache_scope
+                )
+                hit_type = "semantic"
+            if cached is not None:
+                answer = cached.model_copy(deep=True)
+                answer.generation_time = time.monotonic() - start_time
+                answer.metadata["cache_hit"] = hit_type
+                answer.metadata["path"] = "cache"
+                return answer
 
         # 1. 构建上下文
         context = self._build_context_from_retrieval(retrieval_result)
@@ -408,18 +712,18 @@ class QAService:
 
         # 3. 调用AI模型生成答案
         try:
-            ai_response = await self.ai_model_service.chat_completion({
-                "provider": AIProvider.ZHIPUAI,  # 可以根据查询类型选择不同的提供商
-                "model": "glm-4",
-                "messages": [
-                    {"role": "system", "content": "你是一个专业的工程成本咨询专家，请基于提供的上下文信息回答用户问题。"},
+            ai_response = await self.ai_model_service.chat_completion(
+                provider=AIProvider.ZHIPUAI,  # 可以根据查询类型选择不同的提供商
+                model=QA_PATH_MODELS[path],
+                messages=[
+                    {"role": "system", "content": QA_SYSTEM_PROMPT},
                     {"role": "user", "content": prompt}
                 ],
-                "temperature": 0.7,
-                "max_tokens": 2000
-            })
+                temperature=0.7,
+                max_tokens=2000
+            )
 
-            answer_content = ai_response.content
+            answer_content = ai_response["content"]
             confidence_score = self._calculate_confidence_score(answer_content, retrieval_result)
             quality_score = self._calculate_quality_score(answer_content, retrieval_result)
 
@@ -427,19 +731,27 @@ class QAService:
             sources = self._build_sources_info(retrieval_result)
             references = self._build_references(retrieval_result)
 
-            generation_time = time.time() - start_time
+            generation_time = time.monotonic() - start_time
 
-            return GeneratedAnswer(
+            answer = GeneratedAnswer(
                 answer=answer_content,
                 confidence_score=confidence_score,
                 quality_score=quality_score,
                 sources=sources,
                 references=references,
+                metadata={"path": path},
                 generation_time=generation_time,
-                model_used=ai_response.model,
-                token_usage=ai_response.usage
+                model_used=ai_response["model"],
+                token_usage=ai_response["usage"]
             )
 
+            if settings.QA_ANSWER_CACHE_ENABLED:
+                self._store_answer(
+                    cache_key, question_embedding, query_request.user_id, context_chain, cache_scope, answer
+                )
+
+            return answer
+
         except Exception as e:
             logger.error(f"答案生成失败: {str(e)}")
             # 返回基础答案
@@ -447,10 +759,133 @@ class QAService:
                 answer="抱歉，无法生成答案，请稍后重试。",
                 confidence_score=0.0,
                 quality_score=0.0,
-                generation_time=time.time() - start_time,
+                generation_time=time.monotonic() - start_time,
                 model_used="fallback"
             )
 
+    @staticmethod
+    def _generation_path(requested_type: QueryType, retrieval_result: RetrievalResult) -> str:
+        """
+        选择答案生成路径
+
+        Args:
+            requested_type: 调用方请求的查询类型，预处理会把简单查询改写为推断类型，不能用于判断
+            retrieval_result: 检索结果
+
+        Returns:
+            insufficient_context（不调用模型）、light（轻量模型）或 full（标准模型）
+        """
+        if retrieval_result.total_retrieved == 0 and requested_type != QueryType.SIMPLE:
+            return "insufficient_context"
+        if retrieval_result.total_retrieved < QA_LIGHT_PATH_MAX_RETRIEVED:
+            return "light"
+        return "full"
+
+    @staticmethod
+    def _insufficient_context_answer(generation_time: float) -> GeneratedAnswer:
+        """构建检索结果不足时的答案"""
+        return INSUFFICIENT_CONTEXT_ANSWER.model_copy(deep=True, update={"generation_time": generation_time})
+
+    def _answer_cache_scope(self, query_request: QueryRequest, retrieval_result: RetrievalResult) -> str:
+        """缓存范围：查询类型与检索结果指纹，两者一致时才复用答案"""
+        fingerprint = retrieval_result.fingerprint or self._retrieval_fingerprint(retrieval_result)
+        return f"{query_request.query_type.value}\x00{fingerprint}"
+
+    def _answer_cache_key(self, query_request: QueryRequest, cache_scope: str) -> str:
+        """精确缓存键：用户、规范化问题与缓存范围"""
+        key = f"{query_request.user_id}\x00{self._normalize_question(query_request.question)}\x00{cache_scope}"
+        return hashlib.blake2b(key.encode("utf-8"), digest_size=16).hexdigest()
+
+    def _context_chain(self, session_id: Optional[str]) -> str:
+        """对话上下文链：会话最近两轮问答的哈希"""
+        digest = hashlib.blake2b(digest_size=16)
+        context = self.conversation_cache.get(session_id) if session_id else None
+        if context:
+            for item in context.conversation_history[-2:]:
+                digest.update(item["question"].encode("utf-8") + b"\x00")
+                digest.update(item["answer"].encode("utf-8") + b"\x00")
+        return digest.hexdigest()
+
+    async def _embed_question(self, question: str) -> Optional[np.ndarray]:
+        """计算问题的归一化嵌入，失败时返回None（跳过语义缓存）"""
+        cached = self._question_embeddings.get(question)
+        if cached is not None:
+            return cached
+
+        try:
+            # 复用文档处理器已加载的嵌入模型，编码放到线程中避免阻塞事件循环
+            vector = await asyncio.to_thread(
+                document_processor.embedding_model.encode,
+                question,
+                normalize_embeddings=True
+            )
+            embedding = np.asarray(vector, dtype=np.float32)
+            self._question_embeddings[question] = embedding
+            return embedding
+
+        except Exception as e:
+            logger.warning(f"计算问题嵌入失败: {str(e)}")
+            return None
+
+    def _lookup_semantic_cache(
+        self,
+        question_embedding: Optional[np.ndarray],
+        user_id: Optional[int],
+        context_chain: str,
+        cache_scope: str
+    ) -> Optional[GeneratedAnswer]:
+        """在语义缓存中查找相似问题的答案"""
+        if question_embedding is None or self._semantic_embeddings is None:
+            return None
+
+        # 一次矩阵运算得到与所有缓存问题的相似度，按相似度从高到低校验用户、上下文链、缓存范围与有效期
+        now = time.monotonic()
+        scores = cosine_scores(question_embedding, self._semantic_embeddings)
+        for index in np.argsort(scores)[::-1]:
+            if scores[index] < settings.QA_SEMANTIC_CACHE_THRESHOLD:
+                break
+            entry_user_id, entry_chain, entry_scope, expires_at, answer = self._semantic_entries[index]
+            if (
+                entry_user_id == user_id
+                and entry_chain == context_chain
+                and entry_scope == cache_scope
+                and expires_at > now
+            ):
+                return answer
+        return None
+
+    def _store_answer(
+        self,
+        cache_key: str,
+        question_embedding: Optional[np.ndarray],
+        user_id: Optional[int],
+        context_chain: str,
+        cache_scope: str,
+        answer: GeneratedAnswer
+    ):
+        """写入答案缓存（保存副本，后处理对返回答案的修改不影响缓存）"""
+        cached = answer.model_copy(deep=True)
+        self._exact_cache[cache_key] = cached
+
+        if question_embedding is None:
+            return
+
+        # 语义缓存淘汰已过期以及超出容量的最早写入的条目
+        now = time.monotonic()
+        embeddings = question_embedding[np.newaxis, :]
+        if self._semantic_embeddings is not None:
+            embeddings = np.vstack((self._semantic_embeddings, embeddings))
+        self._semantic_entries.append(
+            (user_id, context_chain, cache_scope, now + settings.QA_ANSWER_CACHE_TTL, cached)
+        )
+
+        expired = bisect_right(self._semantic_entries, now, key=itemgetter(3))
+        overflow = max(expired, len(self._semantic_entries) - settings.QA_SEMANTIC_CACHE_SIZE)
+        if overflow > 0:
+            embeddings = embeddings[overflow:]
+            del self._semantic_entries[:overflow]
+        self._semantic_embeddings = embeddings
+
     async def _postprocess_answer(
         self,
         answer: GeneratedAnswer,
@@ -498,78 +933,70 @@ class QAService:
         """推断查询类型"""
         question_lower = question.lower()
 
-        # 成本估算关键词
-        cost_keywords = ["成本", "价格", "费用", "预算", "造价", "报价", "投资"]
-        # 技术咨询关键词
-        tech_keywords = ["技术", "工艺", "标准", "规范", "方法", "方案"]
-        # 市场分析关键词
-        market_keywords = ["市场", "趋势", "行情", "供需", "价格走势"]
-        # 法规咨询关键词
-        regulatory_keywords = ["法规", "标准", "规范", "政策", "规定"]
-        # 项目管理关键词
-        pm_keywords = ["项目", "管理", "进度", "计划", "风险", "质量"]
-        # 材料咨询关键词
-        material_keywords = ["材料", "原料", "建材", "耗材"]
-        # 设备咨询关键词
-        equipment_keywords = ["设备", "机械", "工具", "仪器"]
-
-        if any(keyword in question_lower for keyword in cost_keywords):
-            return QueryType.COST_ESTIMATION
-        elif any(keyword in question_lower for keyword in tech_keywords):
-            return QueryType.TECHNICAL
-        elif any(keyword in question_lower for keyword in market_keywords):
-            return QueryType.MARKET
-        elif any(keyword in question_lower for keyword in regulatory_keywords):
-            return QueryType.REGULATORY
-        elif any(keyword in question_lower for keyword in pm_keywords):
-            return QueryType.PROJECT_MANAGEMENT
-        elif any(keyword in question_lower for keyword in material_keywords):
-            return QueryType.MATERIAL
-        elif any(keyword in question_lower for keyword in equipment_keywords):
-            return QueryType.EQUIPMENT
-        else:
-            return QueryType.COMPLEX
+        # 先一次扫描筛出可能命中的类型，再按优先级确认
+        matched_types = self.query_type_scanner.scan(question_lower)
+        for query_type, pattern in self.query_type_patterns.items():
+            if query_type in matched_types and pattern.search(question_lower):
+                return query_type
 
-    def _build_context_from_retrieval(self, retrieval_result: RetrievalResult) -> str:
-        """从检索结果构建上下文"""
-        context_parts = []
+        return QueryType.COMPLEX
 
-        # 添加文档内容
-        for doc in retrieval_result.documents[:3]:  # 取前3个最相关的文档
-            context_parts.append(f"文档[{doc.title}]: {doc.content[:500]}...")
+    def _build_context_from_retrieval(self, retrieval_result: RetrievalResult) -> str:
+        """
+        从检索结果构建上下文
 
-        # 添加知识图谱信息
-        for knowledge in retrieval_result.knowledge[:3]:
-            context_parts.append(f"知识[{knowledge.node_name}]: {knowledge.properties}")
+        同样的检索结果总是生成相同的上下文文本，总长度不超过 RAG_MAX_CONTEXT_LENGTH
+        """
+        context_parts = []
+        context_length = 0
 
-        # 添加成本数据
-        for cost in retrieval_result.cost_data[:3]:
-            context_parts.append(f"成本数据[{cost.item_name}]: {cost.price_range}")
+        for block in self._context_blocks(retrieval_result):
+            # 放不下的片段跳过，后续较短的片段仍可加入
+            if context_length + len(block) > settings.RAG_MAX_CONTEXT_LENGTH:
+                continue
+            context_parts.append(block)
+            context_length += len(block) + 2  # 片段之间的分隔符
 
         return "\n\n".join(context_parts)
 
-    def _build_generation_prompt(self, query_request: QueryRequest, context: str) -> str:
-        """构建生成提示词"""
-        prompt = f"""
-请基于以下上下文信息回答用户问题：
-
-上下文信息：
-{context}
+    def _context_blocks(self, retrieval_result: RetrievalResult) -> Iterator[str]:
+        """按文档、知识、成本数据的顺序生成上下文片段（各取前3个最相关的，再按ID排序）"""
+        # 已写入上下文的内容哈希，重复内容只保留第一次出现
+        seen: Set[bytes] = set()
 
-用户问题：{query_request.question}
-
-请提供：
-1. 准确、详细的答案
-2. 相关的数据和事实支持
-3. 实用的建议或结论
+        # 相邻文档块之间有重叠，按内容定义的子块去重
+        for doc in sorted(retrieval_result.documents[:3], key=lambda doc: doc.document_id):
+            content = "".join(
+                chunk for chunk in content_defined_chunks(doc.content[:500])
+                if self._first_seen(chunk, seen)
+            )
+            if content.strip():
+                yield f"文档[{doc.title}]: {content}..."
+            else:
+                yield f"文档[{doc.title}]: （内容与上文重复）"
+
+        for knowledge in sorted(retrieval_result.knowledge[:3], key=lambda knowledge: knowledge.node_id):
+            block = f"知识[{knowledge.node_name}]: {knowledge.properties}"
+            if self._first_seen(block, seen):
+                yield block
+
+        for cost in sorted(retrieval_result.cost_data[:3], key=lambda cost: cost.cost_id or 0):
+            block = f"成本数据[{cost.item_name}]: {cost.price_range}"
+            if self._first_seen(block, seen):
+                yield block
+
+    @staticmethod
+    def _first_seen(text: str, seen: Set[bytes]) -> bool:
+        """内容是否首次出现（首次出现时记录其哈希）"""
+        digest = hashlib.blake2b(text.encode("utf-8"), digest_size=16).digest()
+        if digest in seen:
+            return False
+        seen.add(digest)
+        return True
 
-回答要求：
-- 专业且准确
-- 条理清晰
-- 信息完整
-- 语言简洁明了
-"""
-        return prompt
+    def _build_generation_prompt(self, query_request: QueryRequest, context: str) -> str:
+        """构建生成提示词（回答要求在系统提示词中，这里只包含上下文与问题，问题放在最后）"""
+        return f"{QA_PROMPT_HEAD}{context}\n\n用户问题：{query_request.question}\n"
 
     def _calculate_confidence_score(self, answer: str, retrieval_result: RetrievalResult) -> float:
         """计算置信度分数"""
@@ -600,62 +1027,40 @@ class QAService:
         if 100 <= len(answer) <= 2000:
             score += 0.2
 
-        # 基于检索结果质量
-        avg_relevance = 0.0
-        total_items = 0
-
-        for doc in retrieval_result.documents:
-            avg_relevance += doc.relevance_score
-            total_items += 1
-
-        for knowledge in retrieval_result.knowledge:
-            avg_relevance += knowledge.relevance_score
-            total_items += 1
-
-        if total_items > 0:
-            avg_relevance /= total_items
-            score += avg_relevance * 0.3
+        # 基于检索结果质量（文档与知识的平均相关度）
+        relevance_scores = self._relevance_scores(retrieval_result)
+        if relevance_scores.size:
+            score += float(relevance_scores.mean()) * 0.3
 
         return min(1.0, score)
 
+    @staticmethod
+    def _relevance_scores(retrieval_result: RetrievalResult) -> np.ndarray:
+        """文档与知识的相关度数组"""
+        return np.fromiter(
+            (item.relevance_score for item in chain(retrieval_result.documents, retrieval_result.knowledge)),
+            dtype=np.float64,
+            count=len(retrieval_result.documents) + len(retrieval_result.knowledge)
+        )
+
     def _build_sources_info(self, retrieval_result: RetrievalResult) -> List[Dict[str, Any]]:
         """构建来源信息"""
-        sources = []
-
-        # 文档来源
-        for doc in retrieval_result.documents[:5]:
-            sources.append({
-                "type": "document",
-                "id": doc.document_id,
-                "title": doc.title,
-                "relevance": doc.relevance_score
-            })
-
-        # 知识图谱来源
-        for knowledge in retrieval_result.knowledge[:5]:
-            sources.append({
-                "type": "knowledge",
-                "id": knowledge.node_id,
-                "name": knowledge.node_name,
-                "relevance": knowledge.relevance_score
-            })
-
-        return sources
+        # 文档来源 + 知识图谱来源
+        return [
+            {"type": "document", "id": doc.document_id, "title": doc.title, "relevance": doc.relevance_score}
+            for doc in retrieval_result.documents[:5]
+        ] + [
+            {"type": "knowledge", "id": knowledge.node_id, "name": knowledge.node_name, "relevance": knowledge.relevance_score}
+            for knowledge in retrieval_result.knowledge[:5]
+        ]
 
     def _build_references(self, retrieval_result: RetrievalResult) -> List[Dict[str, Any]]:
         """构建参考文献"""
-        references = []
-
         # 文档引用
-        for doc in retrieval_result.documents:
-            references.append({
-                "type": "document",
-                "title": doc.title,
-                "file_path": doc.file_path,
-                "relevance": doc.relevance_score
-            })
-
-        return references
+        return [
+            {"type": "document", "title": doc.title, "file_path": doc.file_path, "relevance": doc.relevance_score}
+            for doc in retrieval_result.documents
+        ]
 
     def _format_answer(self, answer: str) -> str:
         """格式化答案"""
@@ -686,38 +1091,61 @@ class QAService:
     async def _update_conversation_context(
         self,
         query_request: QueryRequest,
-        response: QueryResponse
+        response: QueryResponse,
+        question: Optional[str] = None
     ):
-        """更新对话上下文"""
+        """
+        更新对话上下文
+
+        Args:
+            query_request: 查询请求
+            response: 查询响应
+            question: 预处理前的标准化问题；预处理会把问题改写为带上下文的增强问题，
+                历史记录与嵌入只保存本轮问题本身，默认取查询请求中的问题
+        """
         if not query_request.session_id or not query_request.user_id:
             return
 
-        session_id = query_request.session_id
+        question = question or self._normalize_question(query_request.question)
 
-        # 获取或创建对话上下文
-        if session_id not in self.conversation_cache:
-            self.conversation_cache[session_id] = ConversationContext(
-                session_id=session_id,
-                user_id=query_request.user_id
-            )
+        session_id = query_request.session_id
 
-        context = self.conversation_cache[session_id]
+        # 获取或创建对话上下文，重新写入以刷新会话的过期时间
+        context = self.conversation_cache.get(session_id) or ConversationContext(
+            session_id=session_id,
+            user_id=query_request.user_id
+        )
+        self.conversation_cache[session_id] = context
 
-        # 添加对话记录
+        # 添加对话记录（时间取自响应，不再重复读取当前时间）
         context.conversation_history.append({
-            "timestamp": datetime.utcnow(),
-            "question": query_request.question,
+            "timestamp": response.timestamp,
+            "question": question,
             "answer": response.answer.answer,
             "query_type": query_request.query_type.value,
             "satisfaction": response.satisfaction_score
         })
 
-        # 保持历史记录在合理范围内
-        if len(context.conversation_history) > 20:
-            context.conversation_history = context.conversation_history[-20:]
+        # 保持历史记录在合理范围内（原地删除最早的记录）
+        del context.conversation_history[:-20]
+
+        # 记录问题嵌入（上下文增强时已计算过同一问题的嵌入，直接复用），
+        # 嵌入失败或与历史记录不再对齐时丢弃该会话的嵌入
+        question_embedding = await self._embed_question(question)
+        embeddings = self._history_embeddings.get(session_id)
+        if question_embedding is None:
+            self._history_embeddings.pop(session_id, None)
+        else:
+            embeddings = question_embedding[np.newaxis, :] if embeddings is None else np.vstack(
+                (embeddings, question_embedding)
+            )[-20:]
+            if len(embeddings) == len(context.conversation_history):
+                self._history_embeddings[session_id] = embeddings
+            else:
+                self._history_embeddings.pop(session_id, None)
 
         # 更新最后更新时间
-        context.last_updated = datetime.utcnow()
+        context.last_updated = response.timestamp
 
     async def _enhance_query_with_context(
         self,
@@ -728,8 +1156,18 @@ class QAService:
         if not context.conversation_history:
             return question
 
-        # 获取最近的对话
-        recent_history = context.conversation_history[-3:]
+        history = context.conversation_history
+
+        # 默认取最近的3轮对话；有历史问题嵌入时改取与当前问题最相关的3轮
+        recent_history = history[-3:]
+        embeddings = self._history_embeddings.get(context.session_id)
+        if len(history) > 3 and embeddings is not None and len(embeddings) == len(history):
+            question_embedding = await self._embed_question(question)
+            if question_embedding is not None:
+                scores = cosine_scores(question_embedding, embeddings)
+                # 选出相似度最高的3轮后按时间顺序排列
+                top_indices = np.sort(np.argpartition(-scores, 3)[:3])
+                recent_history = [history[i] for i in top_indices]
 
         # 构建上下文信息
         context_info = []
@@ -746,56 +1184,18 @@ class QAService:
 """
         return enhanced_question
 
-    # 查询类型处理器
-    async def _handle_simple_query(self, query_request: QueryRequest) -> QueryResponse:
-        """处理简单查询"""
-        return await self.process_query(query_request)
-
-    async def _handle_complex_query(self, query_request: QueryRequest) -> QueryResponse:
-        """处理复杂查询"""
-        # 增加检索数量
-        query_request.max_results = min(query_request.max_results * 1.5, 50)
-        return await self.process_query(query_request)
-
-    async def _handle_cost_estimation_query(self, query_request: QueryRequest) -> QueryResponse:
-        """处理成本估算查询"""
-        # 优先检索成本数据
-        if DataSource.COST_DATABASE not in query_request.include_sources:
-            query_request.include_sources.append(DataSource.COST_DATABASE)
-        return await self.process_query(query_request)
-
-    async def _handle_technical_query(self, query_request: QueryRequest) -> QueryResponse:
-        """处理技术咨询查询"""
-        # 优先检索知识图谱
-        if DataSource.KNOWLEDGE_GRAPH not in query_request.include_sources:
-            query_request.include_sources.insert(0, DataSource.KNOWLEDGE_GRAPH)
-        return await self.process_query(query_request)
-
-    async def _handle_market_query(self, query_request: QueryRequest) -> QueryResponse:
-        """处理市场分析查询"""
-        return await self.process_query(query_request)
-
-    async def _handle_regulatory_query(self, query_request: QueryRequest) -> QueryResponse:
-        """处理法规咨询查询"""
-        return await self.process_query(query_request)
-
-    async def _handle_project_management_query(self, query_request: QueryRequest) -> QueryResponse:
-        """处理项目管理查询"""
-        return await self.process_query(query_request)
-
-    async def _handle_material_query(self, query_request: QueryRequest) -> QueryResponse:
-        """处理材料咨询查询"""
-        # 优先检索成本数据和文档
-        if DataSource.COST_DATABASE not in query_request.include_sources:
-            query_request.include_sources.append(DataSource.COST_DATABASE)
-        return await self.process_query(query_request)
-
-    async def _handle_equipment_query(self, query_request: QueryRequest) -> QueryResponse:
-        """处理设备咨询查询"""
-        # 优先检索成本数据和文档
-        if DataSource.COST_DATABASE not in query_request.include_sources:
-            query_request.include_sources.append(DataSource.COST_DATABASE)
-        return await self.process_query(query_request)
+    def _adjust_request_for_type(self, query_request: QueryRequest) -> QueryRequest:
+        """按查询类型调整检索参数"""
+        if query_request.query_type == QueryType.COMPLEX:
+            # 复杂查询增加检索数量
+            query_request.max_results = min(int(query_request.max_results * 1.5), 50)
+
+        # 补充该类型优先检索的数据源
+        source = QUERY_TYPE_PRIORITY_SOURCES.get(query_request.query_type)
+        if source and source not in query_request.include_sources:
+            query_request.include_sources.append(source)
+
+        return query_request
 
     async def get_query_suggestions(
         self,
@@ -852,6 +1252,7 @@ class QAService:
         Returns:
             是否清除成功
         """
+        self._history_embeddings.pop(session_id, None)
         if session_id in self.conversation_cache:
             del self.conversation_cache[session_id]
             return True
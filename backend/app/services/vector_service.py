@@ -2,16 +2,23 @@
 向量数据库服务模块 - 基于Qdrant的向量存储和检索
 """
 import asyncio
-from typing import List, Dict, Any, Optional, Tuple
+from typing import List, Dict, Any, Optional, Tuple, Set
+import httpx
 import numpy as np
-from qdrant_client import QdrantClient
+from qdrant_client import AsyncQdrantClient
 from qdrant_client.models import (
     Distance, VectorParams, PointStruct, Filter, FieldCondition,
-    MatchValue, SearchRequest, SearchParams, RecommendRequest
+    MatchValue, MatchAny, SearchRequest, SearchParams, RecommendRequest, PayloadSchemaType,
+    HnswConfigDiff, ScalarQuantization, ScalarQuantizationConfig, ScalarType,
+    QuantizationSearchParams
 )
 from app.core.config import settings
 from app.core.logging import logger
 
+# 写入每个分块载荷的文档级字段，只保留搜索时用于过滤的字段；
+# 其余元数据保存在数据库的文档记录中，检索结果按document_id关联
+PAYLOAD_METADATA_FIELDS = ('user_id', 'category', 'tags', 'file_type')
+
 
 class VectorService:
     """向量数据库服务 - Qdrant"""
@@ -20,22 +27,42 @@ class VectorService:
         self.client = None
         self.collection_name = "documents"
         self.vector_size = 768  # text2vec-base-chinese的向量维度
+        self.upsert_batch_size = settings.QDRANT_UPSERT_BATCH_SIZE
+        self.upsert_parallelism = settings.QDRANT_UPSERT_PARALLELISM
+        self._ready = False
+        self._connect_lock = asyncio.Lock()
 
     async def connect(self) -> bool:
-        """连接到Qdrant服务器"""
+        """连接到Qdrant服务器，已连接时直接返回；并发调用只建立一次连接"""
+        if self._ready:
+            return True
+
+        async with self._connect_lock:
+            if self._ready:
+                return True
+            return await self._connect()
+
+    async def _connect(self) -> bool:
+        """创建客户端并确保文档集合存在"""
         try:
-            self.client = QdrantClient(
+            # 异步客户端：网络I/O在事件循环中等待，不阻塞其他请求
+            self.client = AsyncQdrantClient(
                 host=settings.QDRANT_HOST,
                 port=settings.QDRANT_PORT,
-                timeout=30
+                grpc_port=settings.QDRANT_GRPC_PORT,
+                prefer_grpc=settings.QDRANT_PREFER_GRPC,
+                timeout=settings.QDRANT_TIMEOUT,
+                # REST连接池，客户端默认的连接数不足以支撑并发写入
+                limits=httpx.Limits(max_connections=settings.QDRANT_HTTP_MAX_CONNECTIONS)
             )
 
             # 测试连接
-            collections = self.client.get_collections().collections
+            collections = (await self.client.get_collections()).collections
             logger.info(f"成功连接到Qdrant，现有集合: {[c.name for c in collections]}")
 
-            # 确保文档集合存在
-            await self._ensure_collection_exists()
+            # 确保文档集合存在，复用上面的集合列表，不再重复查询
+            await self._ensure_collection_exists({c.name for c in collections})
+            self._ready = True
             return True
 
         except Exception as e:
@@ -44,28 +71,49 @@ class VectorService:
 
     async def disconnect(self):
         """断开Qdrant连接"""
-        if self.client:
-            self.client.close()
-            logger.info("Qdrant连接已关闭")
-
-    async def _ensure_collection_exists(self):
+        async with self._connect_lock:
+            self._ready = False
+            if self.client:
+                await self.client.close()
+                self.client = None
+                logger.info("Qdrant连接已关闭")
+
+    async def _ensure_collection_exists(self, collection_names: Set[str]):
         """确保文档集合存在"""
         try:
-            collections = self.client.get_collections().collections
-            collection_names = [c.name for c in collections]
-
             if self.collection_name not in collection_names:
-                self.client.create_collection(
+                await self.client.create_collection(
                     collection_name=self.collection_name,
                     vectors_config=VectorParams(
                         size=self.vector_size,
                         distance=Distance.COSINE
-                    )
+                    ),
+                    hnsw_config=HnswConfigDiff(
+                        m=settings.QDRANT_HNSW_M,
+                        ef_construct=settings.QDRANT_HNSW_EF_CONSTRUCT,
+                        full_scan_threshold=settings.QDRANT_HNSW_FULL_SCAN_THRESHOLD
+                    ),
+                    # int8标量量化：HNSW遍历使用量化向量，内存带宽约为原来的1/4
+                    quantization_config=ScalarQuantization(
+                        scalar=ScalarQuantizationConfig(
+                            type=ScalarType.INT8,
+                            quantile=0.99,
+                            always_ram=True
+                        )
+                    ) if settings.QDRANT_SCALAR_QUANTIZATION else None
                 )
                 logger.info(f"创建集合: {self.collection_name}")
             else:
                 logger.info(f"集合已存在: {self.collection_name}")
 
+            # 删除、分块获取与过滤搜索都按document_id过滤，建立载荷索引避免全量扫描；
+            # 索引已存在时Qdrant直接返回，对已有集合同样生效
+            await self.client.create_payload_index(
+                collection_name=self.collection_name,
+                field_name="document_id",
+                field_schema=PayloadSchemaType.INTEGER
+            )
+
         except Exception as e:
             logger.error(f"创建集合失败: {str(e)}")
             raise
@@ -84,47 +132,38 @@ class VectorService:
             document_id: 文档ID
             chunks: 文本分块列表
             embeddings: 向量数组
-            metadata: 文档元数据
+            metadata: 文档元数据，只有PAYLOAD_METADATA_FIELDS中的字段写入分块载荷
 
         Returns:
             添加的向量点ID列表
         """
         try:
-            if not self.client:
-                await self.connect()
-
-            points = []
-            point_ids = []
-
-            for i, (chunk, embedding) in enumerate(zip(chunks, embeddings)):
-                point_id = f"{document_id}_{i}"
-
-                # 构建点数据
-                point_data = {
-                    'document_id': document_id,
-                    'chunk_index': i,
-                    'content': chunk['content'],
-                    'char_count': chunk.get('char_count', 0),
-                    'word_count': chunk.get('word_count', 0),
-                    'start_position': chunk.get('start_position', 0),
-                    'end_position': chunk.get('end_position', 0),
-                    **metadata  # 包含文档元数据
-                }
-
-                point = PointStruct(
-                    id=point_id,
-                    vector=embedding.tolist(),
-                    payload=point_data
+            await self.connect()
+
+            # 向量统一为连续的float32矩阵（与Qdrant存储精度一致），整体一次转换为列表，避免逐行调用tolist
+            vectors = np.ascontiguousarray(embeddings, dtype=np.float32).tolist()
+            document_payload = {key: metadata[key] for key in PAYLOAD_METADATA_FIELDS if key in metadata}
+            points = [
+                PointStruct(
+                    id=f"{document_id}_{i}",
+                    vector=vector,
+                    payload={
+                        'document_id': document_id,
+                        'chunk_index': i,
+                        'content': chunk['content'],
+                        'char_count': chunk.get('char_count', 0),
+                        'word_count': chunk.get('word_count', 0),
+                        'start_position': chunk.get('start_position', 0),
+                        'end_position': chunk.get('end_position', 0),
+                        **document_payload  # 文档级过滤字段
+                    }
                 )
+                for i, (chunk, vector) in enumerate(zip(chunks, vectors))
+            ]
+            point_ids = [point.id for point in points]
 
-                points.append(point)
-                point_ids.append(point_id)
-
-            # 批量插入
-            self.client.upsert(
-                collection_name=self.collection_name,
-                points=points
-            )
+            # 分批并行插入
+            await self._upsert_points_batching(points)
 
             logger.info(f"成功添加 {len(points)} 个向量点，文档ID: {document_id}")
             return point_ids
@@ -133,13 +172,32 @@ class VectorService:
             logger.error(f"添加向量失败: {str(e)}")
             raise
 
+    async def _upsert_points_batching(self, points: List[PointStruct]):
+        """按批次并行写入向量点，避免大文档阻塞在单次请求上"""
+        batches = [
+            points[i:i + self.upsert_batch_size]
+            for i in range(0, len(points), self.upsert_batch_size)
+        ]
+        semaphore = asyncio.Semaphore(self.upsert_parallelism)
+
+        async def _upsert(batch: List[PointStruct]):
+            async with semaphore:
+                await self.client.upsert(
+                    collection_name=self.collection_name,
+                    points=batch,
+                    wait=False
+                )
+
+        await asyncio.gather(*(_upsert(batch) for batch in batches))
+
     async def search_similar_vectors(
         self,
         query_vector: np.ndarray,
         limit: int = 10,
         score_threshold: float = 0.7,
         document_ids: Optional[List[int]] = None,
-        filters: Optional[Dict[str, Any]] = None
+        filters: Optional[Dict[str, Any]] = None,
+        hnsw_ef: Optional[int] = None
     ) -> List[Dict[str, Any]]:
         """
         搜索相似向量
@@ -150,61 +208,26 @@ class VectorService:
             score_threshold: 相似度阈值
             document_ids: 限制搜索的文档ID列表
             filters: 额外过滤条件
+            hnsw_ef: 搜索时的HNSW候选集大小，越大召回率越高、延迟越大，默认取配置值
 
         Returns:
             相似向量结果列表
         """
         try:
-            if not self.client:
-                await self.connect()
-
-            # 构建过滤器
-            search_filter = None
-            if document_ids or filters:
-                conditions = []
-
-                if document_ids:
-                    conditions.append(
-                        FieldCondition(
-                            key="document_id",
-                            match=MatchValue(any=document_ids)
-                        )
-                    )
-
-                if filters:
-                    for key, value in filters.items():
-                        conditions.append(
-                            FieldCondition(
-                                key=key,
-                                match=MatchValue(value=value)
-                            )
-                        )
-
-                if conditions:
-                    search_filter = Filter(must=conditions)
+            await self.connect()
 
             # 执行搜索
-            search_result = self.client.search(
+            search_result = await self.client.search(
                 collection_name=self.collection_name,
                 query_vector=query_vector.tolist(),
-                query_filter=search_filter,
+                query_filter=self._build_search_filter(document_ids, filters),
                 limit=limit,
                 score_threshold=score_threshold,
-                search_params=SearchParams(
-                    exact=False,
-                    hnsw_ef=128
-                )
+                search_params=self._search_params(hnsw_ef)
             )
 
             # 格式化结果
-            results = []
-            for scored_point in search_result:
-                result = {
-                    'id': scored_point.id,
-                    'score': scored_point.score,
-                    'payload': scored_point.payload
-                }
-                results.append(result)
+            results = self._format_scored_points(search_result)
 
             logger.info(f"向量搜索完成，返回 {len(results)} 个结果")
             return results
@@ -213,11 +236,129 @@ class VectorService:
             logger.error(f"向量搜索失败: {str(e)}")
             return []
 
+    async def search_similar_vectors_batch(
+        self,
+        query_vectors: np.ndarray,
+        limit: int = 10,
+        score_threshold: float = 0.7,
+        document_ids: Optional[List[int]] = None,
+        filters: Optional[Dict[str, Any]] = None,
+        hnsw_ef: Optional[int] = None
+    ) -> List[List[Dict[str, Any]]]:
+        """
+        批量搜索相似向量，多个查询向量在一次请求中由Qdrant并行处理
+
+        Args:
+            query_vectors: 查询向量矩阵，每行一个查询
+            limit: 每个查询返回的结果数量
+            score_threshold: 相似度阈值
+            document_ids: 限制搜索的文档ID列表
+            filters: 额外过滤条件
+            hnsw_ef: 搜索时的HNSW候选集大小，默认取配置值
+
+        Returns:
+            与查询向量一一对应的结果列表
+        """
+        try:
+            await self.connect()
+
+            return await self._search_batch(
+                query_vectors,
+                self._build_search_filter(document_ids, filters),
+                limit,
+                score_threshold,
+                hnsw_ef
+            )
+
+        except Exception as e:
+            logger.error(f"批量向量搜索失败: {str(e)}")
+            return [[] for _ in range(len(query_vectors))]
+
+    async def _search_batch(
+        self,
+        query_vectors: np.ndarray,
+        search_filter: Optional[Filter],
+        limit: int,
+        score_threshold: Optional[float],
+        hnsw_ef: Optional[int] = None
+    ) -> List[List[Dict[str, Any]]]:
+        """执行批量搜索"""
+        search_params = self._search_params(hnsw_ef)
+        batch_result = await self.client.search_batch(
+            collection_name=self.collection_name,
+            requests=[
+                SearchRequest(
+                    vector=vector,
+                    filter=search_filter,
+                    limit=limit,
+                    score_threshold=score_threshold,
+                    with_payload=True,
+                    params=search_params
+                )
+                for vector in np.asarray(query_vectors, dtype=np.float32).tolist()
+            ]
+        )
+
+        results = [self._format_scored_points(search_result) for search_result in batch_result]
+        logger.info(f"批量向量搜索完成，共 {len(results)} 个查询")
+        return results
+
+    @staticmethod
+    def _build_search_filter(
+        document_ids: Optional[List[int]],
+        filters: Optional[Dict[str, Any]]
+    ) -> Optional[Filter]:
+        """构建搜索过滤器"""
+        conditions = []
+
+        if document_ids:
+            conditions.append(
+                FieldCondition(
+                    key="document_id",
+                    match=MatchValue(any=document_ids)
+                )
+            )
+
+        if filters:
+            for key, value in filters.items():
+                conditions.append(
+                    FieldCondition(
+                        key=key,
+                        match=MatchValue(value=value)
+                    )
+                )
+
+        return Filter(must=conditions) if conditions else None
+
+    @staticmethod
+    def _search_params(hnsw_ef: Optional[int]) -> SearchParams:
+        """构建搜索参数"""
+        return SearchParams(
+            exact=False,
+            hnsw_ef=hnsw_ef or settings.QDRANT_SEARCH_HNSW_EF,
+            # 按量化向量多取候选，再用原始向量重新打分排序
+            quantization=QuantizationSearchParams(
+                rescore=True,
+                oversampling=settings.QDRANT_QUANTIZATION_OVERSAMPLING
+            )
+        )
+
+    @staticmethod
+    def _format_scored_points(search_result) -> List[Dict[str, Any]]:
+        """格式化搜索结果"""
+        return [
+            {
+                'id': scored_point.id,
+                'score': scored_point.score,
+                'payload': scored_point.payload
+            }
+            for scored_point in search_result
+        ]
+
     async def delete_document_vectors(self, document_id: int) -> bool:
         """删除指定文档的所有向量"""
         try:
-            if not self.client:
-                await self.connect()
+            await self.connect()
 
             # 构建过滤器
             delete_filter = Filter(
@@ -230,7 +371,7 @@ class VectorService:
             )
 
             # 删除向量
-            self.client.delete(
+            await self.client.delete(
                 collection_name=self.collection_name,
                 points_selector=delete_filter
             )
@@ -270,8 +411,7 @@ class VectorService:
     ) -> List[Dict[str, Any]]:
         """获取文档的所有分块"""
         try:
-            if not self.client:
-                await self.connect()
+            await self.connect()
 
             # 构建过滤器
             search_filter = Filter(
@@ -283,24 +423,17 @@ class VectorService:
                 ]
             )
 
-            # 搜索（使用全零向量获取所有点）
-            dummy_vector = np.zeros(self.vector_size)
-
-            search_result = self.client.search(
+            # 按载荷过滤遍历，无需向量相似度计算
+            points, _ = await self.client.scroll(
                 collection_name=self.collection_name,
-                query_vector=dummy_vector.tolist(),
-                query_filter=search_filter,
+                scroll_filter=search_filter,
                 limit=limit or 1000,
-                with_payload=True
+                with_payload=True,
+                with_vectors=False
             )
 
             # 按chunk_index排序
-            results = []
-            for scored_point in search_result:
-                chunk_data = scored_point.payload
-                chunk_data['score'] = scored_point.score
-                results.append(chunk_data)
-
+            results = [point.payload for point in points]
             results.sort(key=lambda x: x.get('chunk_index', 0))
             return results
 
@@ -326,44 +459,73 @@ class VectorService:
             推荐文档列表
         """
         try:
-            if not self.client:
-                await self.connect()
-
-            # 获取正例文档的向量
-            positive_vectors = []
-            for doc_id in positive_document_ids:
-                chunks = await self.get_document_chunks(doc_id, limit=1)
-                if chunks:
-                    # 这里简化处理，实际应该获取文档的代表性向量
-                    chunk_content = chunks[0].get('content', '')
-                    # 需要重新编码获取向量，这里简化处理
-                    pass
-
-            # 这里简化实现，实际应该基于向量做推荐
-            # 暂时返回相似文档ID
-            results = []
-            for doc_id in positive_document_ids:
-                similar_chunks = await self.get_document_chunks(doc_id)
-                if similar_chunks:
-                    results.append({
-                        'document_id': doc_id,
-                        'chunks_count': len(similar_chunks),
-                        'relevance_score': 1.0
-                    })
+            await self.connect()
 
+            # 每个文档取一个代表性分块作为正例/负例点
+            negative_document_ids = negative_document_ids or []
+            positive_points, negative_points = await asyncio.gather(
+                self._representative_point_ids(positive_document_ids),
+                self._representative_point_ids(negative_document_ids)
+            )
+            if not positive_points:
+                return []
+
+            # 由Qdrant在服务端根据正例、负例点计算查询，排除正例和负例文档本身
+            excluded_ids = list(positive_document_ids) + list(negative_document_ids)
+            recommend_result = await self.client.recommend(
+                collection_name=self.collection_name,
+                positive=positive_points,
+                negative=negative_points,
+                query_filter=Filter(
+                    must_not=[FieldCondition(key="document_id", match=MatchAny(any=excluded_ids))]
+                ),
+                search_params=self._search_params(None),
+                limit=limit * 5,
+                with_payload=True
+            )
+
+            # 按文档聚合，取命中分块的最高分
+            documents: Dict[int, Dict[str, Any]] = {}
+            for hit in self._format_scored_points(recommend_result):
+                doc_id = hit['payload'].get('document_id')
+                if doc_id is None:
+                    continue
+                document = documents.setdefault(
+                    doc_id, {'document_id': doc_id, 'chunks_count': 0, 'relevance_score': hit['score']}
+                )
+                document['chunks_count'] += 1
+                document['relevance_score'] = max(document['relevance_score'], hit['score'])
+
+            results = sorted(documents.values(), key=lambda d: d['relevance_score'], reverse=True)
             return results[:limit]
 
         except Exception as e:
             logger.error(f"文档推荐失败: {str(e)}")
             return []
 
+    async def _representative_point_ids(self, document_ids: List[int]) -> List[Any]:
+        """获取每个文档的一个代表性分块点ID"""
+        async def _first_point(document_id: int):
+            points, _ = await self.client.scroll(
+                collection_name=self.collection_name,
+                scroll_filter=Filter(
+                    must=[FieldCondition(key="document_id", match=MatchValue(value=document_id))]
+                ),
+                limit=1,
+                with_payload=False,
+                with_vectors=False
+            )
+            return points[0].id if points else None
+
+        point_ids = await asyncio.gather(*(_first_point(doc_id) for doc_id in document_ids))
+        return [point_id for point_id in point_ids if point_id is not None]
+
     async def get_collection_info(self) -> Dict[str, Any]:
         """获取集合信息"""
         try:
-            if not self.client:
-                await self.connect()
+            await self.connect()
 
-            collection_info = self.client.get_collection(self.collection_name)
+            collection_info = await self.client.get_collection(self.collection_name)
 
             return {
                 'name': self.collection_name,
@@ -380,7 +542,7 @@ class VectorService:
     async def health_check(self) -> bool:
         """健康检查"""
         try:
-            if not self.client:
+            if not self._ready:
                 return await self.connect()
 
             # 尝试获取集合信息
@@ -0,0 +1,71 @@
+"""
+多模式扫描工具
+基于Hyperscan一次线性扫描文本，找出实际命中的正则模式
+"""
+import re
+import logging
+from typing import Dict, Set
+
+logger = logging.getLogger(__name__)
+
+try:
+    import hyperscan
+    HYPERSCAN_AVAILABLE = True
+except ImportError:
+    HYPERSCAN_AVAILABLE = False
+    logger.info("未安装hyperscan，多模式扫描退化为逐个正则匹配")
+
+_UNICODE_ESCAPE = re.compile(r'\\u([0-9a-fA-F]{4})')
+
+
+class MultiPatternScanner:
+    """
+    多模式扫描器
+
+    Hyperscan不支持捕获组，因此只用它判断哪些模式在文本中出现；
+    分组提取仍由已编译的re模式完成，结果与逐个finditer一致。
+    """
+
+    def __init__(self, patterns: Dict[str, re.Pattern]):
+        self.names = list(patterns)
+        self.database = None
+
+        if HYPERSCAN_AVAILABLE and self.names:
+            try:
+                # Python的\uXXXX转义改写为PCRE的\x{XXXX}
+                expressions = [
+                    _UNICODE_ESCAPE.sub(r'\\x{\1}', patterns[name].pattern).encode('utf-8')
+                    for name in self.names
+                ]
+                flag = hyperscan.HS_FLAG_UTF8 | hyperscan.HS_FLAG_UCP | hyperscan.HS_FLAG_SINGLEMATCH
+                database = hyperscan.Database()
+                database.compile(
+                    expressions=expressions,
+                    ids=list(range(len(self.names))),
+                    elements=len(self.names),
+                    flags=[flag] * len(self.names)
+                )
+                self.database = database
+            except Exception as e:
+                logger.warning(f"Hyperscan模式编译失败，退化为逐个正则匹配: {str(e)}")
+
+    def scan(self, text: str) -> Set[str]:
+        """
+        扫描文本
+
+        Args:
+            text: 输入文本
+
+        Returns:
+            命中的模式名称集合
+        """
+        if self.database is None:
+            return set(self.names)
+
+        matched_ids = set()
+
+        def on_match(pattern_id, start, end, flags, context):
+            matched_ids.add(pattern_id)
+
+        self.database.scan(text.encode('utf-8'), match_event_handler=on_match)
+        return {self.names[i] for i in matched_ids}
@@ -4,8 +4,7 @@
 """
 import time
 import asyncio
-from typing import Dict, Any, Optional
-from collections import defaultdict, deque
+from typing import Dict, Any, List, Optional, Tuple
 import logging
 from datetime import datetime, timedelta
 import redis.asyncio as redis
@@ -14,14 +13,40 @@ from app.core.config import get_settings
 logger = logging.getLogger(__name__)
 settings = get_settings()
 
+# 秒与纳秒的换算
+NS_PER_SECOND = 1_000_000_000
+
+# 内存限流键的清理间隔（秒）
+MEMORY_CLEANUP_INTERVAL = 60
+
+# 滑动窗口限流脚本：原子地移除过期记录、计数，未超限时才记录本次请求
+# KEYS[1]=限制键，ARGV=[窗口起点, 当前时间, 限制次数, 窗口秒数, 请求标识]
+SLIDING_WINDOW_SCRIPT = """
+redis.call('ZREMRANGEBYSCORE', KEYS[1], 0, ARGV[1])
+if redis.call('ZCARD', KEYS[1]) >= tonumber(ARGV[3]) then
+    return 0
+end
+redis.call('ZADD', KEYS[1], ARGV[2], ARGV[5])
+redis.call('EXPIRE', KEYS[1], ARGV[4])
+return 1
+"""
+
 
 class RateLimiter:
     """速率限制器"""
 
-    def __init__(self):
-        self.memory_storage: Dict[str, deque] = defaultdict(deque)
+    def __init__(self, default_algorithm: str = "sliding"):
+        """
+        Args:
+            default_algorithm: Redis存储的默认限流算法，sliding（有序集合滑动窗口，精确）
+                或 fixed（INCR计数的固定窗口，每个窗口只占一个整数，开销更小）
+        """
+        self.default_algorithm = default_algorithm
+        # 内存令牌桶：键 -> (剩余令牌单位数, 上次更新时间（单调时钟纳秒）, 桶容量)
+        self.memory_storage: Dict[str, Tuple[int, int, int]] = {}
         self.redis_client: Optional[redis.Redis] = None
         self.use_redis = False
+        self._cleanup_task: Optional[asyncio.Task] = None
 
         # 初始化Redis连接
         if settings.REDIS_URL:
@@ -31,6 +56,8 @@ class RateLimiter:
                     encoding="utf-8",
                     decode_responses=True
                 )
+                # 脚本以EVALSHA执行，服务端未缓存时自动回退为EVAL
+                self._sliding_window_script = self.redis_client.register_script(SLIDING_WINDOW_SCRIPT)
                 self.use_redis = True
                 logger.info("Redis速率限制器初始化成功")
             except Exception as e:
@@ -38,12 +65,24 @@ class RateLimiter:
         else:
             logger.info("未配置Redis，使用内存存储速率限制")
 
+        # 按存储方式与默认算法预先绑定检查方法，默认调用只经过一次属性查找
+        self._check = self._select_check(self.use_redis and self.redis_client is not None, default_algorithm)
+
+    def _select_check(self, use_redis: bool, algorithm: str):
+        """选择检查方法，各方法签名均为 (key, limit, window)"""
+        if not use_redis:
+            return self._check_memory_limit_async
+        if algorithm == "fixed":
+            return self._check_redis_fixed_window
+        return self._check_redis_limit
+
     async def check_limit(
         self,
         key: str,
         limit: int,
         window: int,
-        use_redis: Optional[bool] = None
+        use_redis: Optional[bool] = None,
+        algorithm: Optional[str] = None
     ) -> bool:
         """
         检查速率限制
@@ -53,35 +92,62 @@ class RateLimiter:
             limit: 限制次数
             window: 时间窗口（秒）
             use_redis: 是否使用Redis存储
+            algorithm: Redis限流算法（sliding或fixed），默认取实例配置；内存存储始终使用令牌桶
 
         Returns:
             是否允许请求
         """
+        if use_redis is None and algorithm is None:
+            return await self._check(key, limit, window)
+
         use_redis = use_redis if use_redis is not None else self.use_redis
+        check = self._select_check(
+            use_redis and self.redis_client is not None,
+            algorithm or self.default_algorithm
+        )
+        return await check(key, limit, window)
+
+    @staticmethod
+    def _fixed_window_key(key: str, window: int) -> str:
+        """固定窗口计数键：限制键加当前窗口序号"""
+        return f"{key}:{int(time.time() // window)}"
+
+    async def _check_redis_fixed_window(self, key: str, limit: int, window: int) -> bool:
+        """使用Redis固定窗口计数检查速率限制"""
+        try:
+            bucket = self._fixed_window_key(key, window)
 
-        if use_redis and self.redis_client:
-            return await self._check_redis_limit(key, limit, window)
-        else:
+            pipe = self.redis_client.pipeline()
+            pipe.incr(bucket)
+            pipe.expire(bucket, window)
+            current_count, _ = await pipe.execute()
+
+            if current_count > limit:
+                logger.info(f"Redis速率限制触发: key={key}, count={current_count}, limit={limit}")
+                return False
+
+            return True
+
+        except Exception as e:
+            logger.error(f"Redis速率限制检查失败: {str(e)}")
+            # 降级到内存存储
             return self._check_memory_limit(key, limit, window)
 
     async def _check_redis_limit(self, key: str, limit: int, window: int) -> bool:
         """使用Redis检查速率限制"""
         try:
-            current_time = int(time.time())
-            window_start = current_time - window
+            current_ns = time.time_ns()
+            current_time = current_ns / NS_PER_SECOND
 
-            # 使用滑动窗口算法
-            pipe = self.redis_client.pipeline()
-            pipe.zremrangebyscore(key, 0, window_start)  # 移除过期记录
-            pipe.zcard(key)  # 获取当前计数
-            pipe.zadd(key, {str(current_time): current_time})  # 添加当前请求
-            pipe.expire(key, window)  # 设置过期时间
+            # 使用滑动窗口算法，一次脚本调用完成清理、计数与记录；
+            # 成员为8字节的纳秒时间戳（二进制，仅影响写入，响应解码不受影响），比字符串成员更省内存
+            allowed = await self._sliding_window_script(
+                keys=[key],
+                args=[current_time - window, current_time, limit, window, current_ns.to_bytes(8, 'little')]
+            )
 
-            results = await pipe.execute()
-            current_count = results[1]
-
-            if current_count >= limit:
-                logger.info(f"Redis速率限制触发: key={key}, count={current_count}, limit={limit}")
+            if not allowed:
+                logger.info(f"Redis速率限制触发: key={key}, limit={limit}")
                 return False
 
             return True
@@ -91,46 +157,74 @@ class RateLimiter:
             # 降级到内存存储
             return self._check_memory_limit(key, limit, window)
 
-    def _check_memory_limit(self, key: str, limit: int, window: int) -> bool:
-        """使用内存检查速率限制"""
-        try:
-            current_time = time.time()
-            window_start = current_time - window
-
-            # 获取该键的请求时间队列
-            request_times = self.memory_storage[key]
+    @staticmethod
+    def _available_units(bucket: Tuple[int, int, int], limit: int, window_ns: int, current_ns: int) -> int:
+        """
+        按经过的时间补充令牌
 
-            # 移除过期的请求记录
-            while request_times and request_times[0] <= window_start:
-                request_times.popleft()
+        令牌以整数单位计量，1个令牌为window_ns个单位，每纳秒补充limit个单位，
+        桶容量为limit个令牌，空桶在一个窗口内补满，全程为整数运算。
+        """
+        units, last_refill, _ = bucket
+        return min(limit * window_ns, units + (current_ns - last_refill) * limit)
 
-            # 检查当前窗口内的请求数
-            if len(request_times) >= limit:
-                logger.info(f"内存速率限制触发: key={key}, count={len(request_times)}, limit={limit}")
-                return False
+    def _consumed_tokens(self, bucket: Tuple[int, int, int], window: int, current_ns: int) -> int:
+        """已消耗的令牌数（向上取整）"""
+        limit = bucket[2]
+        window_ns = window * NS_PER_SECOND
+        units = self._available_units(bucket, limit, window_ns, current_ns)
+        return -((units - limit * window_ns) // window_ns)
 
-            # 添加当前请求时间
-            request_times.append(current_time)
+    async def _check_memory_limit_async(self, key: str, limit: int, window: int) -> bool:
+        """内存检查的异步包装，与Redis检查方法签名一致"""
+        return self._check_memory_limit(key, limit, window)
 
-            # 定期清理过期的键
-            if len(self.memory_storage) > 10000:  # 存储超过10000个键时清理
-                self._cleanup_expired_keys()
+    def _check_memory_limit(self, key: str, limit: int, window: int) -> bool:
+        """使用内存检查速率限制（令牌桶，每次检查常数时间）"""
+        try:
+            current_ns = time.monotonic_ns()
+            window_ns = window * NS_PER_SECOND
+            capacity = limit * window_ns
+            bucket = self.memory_storage.get(key)
+            if bucket is None:
+                units = capacity
+            else:
+                # 内联补充计算（同_available_units），每次请求少一次函数调用和默认元组的创建
+                units = min(capacity, bucket[0] + (current_ns - bucket[1]) * limit)
+
+            if units < window_ns:
+                self.memory_storage[key] = (units, current_ns, limit)
+                logger.info(f"内存速率限制触发: key={key}, limit={limit}")
+                return False
 
+            # 消耗一个令牌
+            self.memory_storage[key] = (units - window_ns, current_ns, limit)
             return True
 
         except Exception as e:
             logger.error(f"内存速率限制检查失败: {str(e)}")
             return True  # 出错时允许请求
 
+    def start(self):
+        """启动后台清理任务（已启动时不重复创建），由应用生命周期在启动时调用一次，过期键的清理不占用请求处理路径"""
+        if self._cleanup_task is None or self._cleanup_task.done():
+            self._cleanup_task = asyncio.create_task(self._cleanup_loop())
+
+    async def _cleanup_loop(self):
+        """定期清理过期的内存限流键"""
+        while True:
+            await asyncio.sleep(MEMORY_CLEANUP_INTERVAL)
+            self._cleanup_expired_keys()
+
     def _cleanup_expired_keys(self):
         """清理过期的键"""
         try:
-            current_time = time.time()
+            current_ns = time.monotonic_ns()
             expired_keys = []
 
-            for key, request_times in self.memory_storage.items():
+            for key, (_, last_refill, _) in self.memory_storage.items():
                 # 如果最近的请求超过1小时前，则认为键已过期
-                if request_times and request_times[-1] < current_time - 3600:
+                if last_refill < current_ns - 3600 * NS_PER_SECOND:
                     expired_keys.append(key)
 
             for key in expired_keys:
@@ -142,20 +236,24 @@ class RateLimiter:
         except Exception as e:
             logger.error(f"清理过期键失败: {str(e)}")
 
-    async def get_current_count(self, key: str, window: int) -> int:
+    async def get_current_count(self, key: str, window: int, algorithm: Optional[str] = None) -> int:
         """
         获取当前窗口内的请求计数
 
         Args:
             key: 限制键
             window: 时间窗口（秒）
+            algorithm: Redis限流算法（sliding或fixed），默认取实例配置
 
         Returns:
             当前计数
         """
         if self.use_redis and self.redis_client:
             try:
-                current_time = int(time.time())
+                if (algorithm or self.default_algorithm) == "fixed":
+                    return int(await self.redis_client.get(self._fixed_window_key(key, window)) or 0)
+
+                current_time = time.time()
                 window_start = current_time - window
                 count = await self.redis_client.zcount(key, window_start, current_time)
                 return count
@@ -164,13 +262,12 @@ class RateLimiter:
 
         # 使用内存存储
         try:
-            current_time = time.time()
-            window_start = current_time - window
-            request_times = self.memory_storage[key]
+            bucket = self.memory_storage.get(key)
+            if bucket is None:
+                return 0
 
-            # 计算窗口内的请求数
-            count = sum(1 for req_time in request_times if req_time > window_start)
-            return count
+            # 已消耗的令牌数即当前计数
+            return self._consumed_tokens(bucket, window, time.monotonic_ns())
         except Exception as e:
             logger.error(f"获取内存计数失败: {str(e)}")
             return 0
@@ -188,6 +285,9 @@ class RateLimiter:
         try:
             if self.use_redis and self.redis_client:
                 await self.redis_client.delete(key)
+                # 固定窗口的计数键
+                async for bucket in self.redis_client.scan_iter(match=f"{key}:*"):
+                    await self.redis_client.delete(bucket)
 
             # 同时清理内存存储
             if key in self.memory_storage:
@@ -293,34 +393,44 @@ class RateLimiter:
             active_limits = {}
 
             if self.use_redis and self.redis_client:
-                # 从Redis获取活跃限制
-                config_keys = await self.redis_client.keys("config:*")
+                # 从Redis获取活跃限制：SCAN遍历配置键，配置与计数各用一次管道批量读取
+                config_keys = await self._scan_keys("config:*")
 
+                pipe = self.redis_client.pipeline()
                 for config_key in config_keys:
-                    key = config_key.replace("config:", "")
-                    config_data = await self.redis_client.hgetall(config_key)
-
-                    current_count = await self.get_current_count(key, int(config_data.get("window", 60)))
-
-                    active_limits[key] = {
+                    pipe.hgetall(config_key)
+                configs = await pipe.execute()
+
+                current_time = time.time()
+                pipe = self.redis_client.pipeline()
+                for config_key, config_data in zip(config_keys, configs):
+                    key = config_key.removeprefix("config:")
+                    window = int(config_data.get("window", 60))
+                    if self.default_algorithm == "fixed":
+                        pipe.get(self._fixed_window_key(key, window))
+                    else:
+                        pipe.zcount(key, current_time - window, current_time)
+                counts = await pipe.execute()
+
+                for config_key, config_data, current_count in zip(config_keys, configs, counts):
+                    active_limits[config_key.removeprefix("config:")] = {
                         "limit": int(config_data.get("limit", 100)),
                         "window": int(config_data.get("window", 60)),
-                        "current_count": current_count,
+                        "current_count": int(current_count or 0),
                         "updated_at": config_data.get("updated_at")
                     }
 
             # 添加内存存储中的活跃限制
-            for key, request_times in self.memory_storage.items():
-                if key not in active_limits and request_times:
-                    # 估算限制配置（基于最近的请求模式）
-                    recent_requests = len(request_times)
-                    estimated_limit = max(100, recent_requests * 2)
-                    estimated_window = 60  # 默认1分钟窗口
+            current_ns = time.monotonic_ns()
+            for key, bucket in self.memory_storage.items():
+                if key not in active_limits:
+                    # 令牌桶不记录时间窗口，按默认1分钟窗口估算
+                    estimated_window = 60
 
                     active_limits[key] = {
-                        "limit": estimated_limit,
+                        "limit": bucket[2],
                         "window": estimated_window,
-                        "current_count": recent_requests,
+                        "current_count": self._consumed_tokens(bucket, estimated_window, current_ns),
                         "storage_type": "memory",
                         "estimated": True
                     }
@@ -331,6 +441,10 @@ class RateLimiter:
             logger.error(f"获取活跃限制失败: {str(e)}")
             return {}
 
+    async def _scan_keys(self, pattern: str) -> List[str]:
+        """使用SCAN增量遍历匹配的键，不阻塞Redis"""
+        return [key async for key in self.redis_client.scan_iter(match=pattern, count=500)]
+
     async def cleanup_expired_data(self, max_age_hours: int = 24) -> Dict[str, Any]:
         """
         清理过期的速率限制数据
@@ -346,10 +460,11 @@ class RateLimiter:
             current_time = time.time()
             max_age_seconds = max_age_hours * 3600
 
-            # 清理内存数据
+            # 清理内存数据（令牌桶使用单调时钟）
+            current_ns = time.monotonic_ns()
             expired_keys = []
-            for key, request_times in self.memory_storage.items():
-                if request_times and (current_time - request_times[-1]) > max_age_seconds:
+            for key, (_, last_refill, _) in self.memory_storage.items():
+                if (current_ns - last_refill) > max_age_seconds * NS_PER_SECOND:
                     expired_keys.append(key)
 
             for key in expired_keys:
@@ -359,9 +474,13 @@ class RateLimiter:
             # 清理Redis数据
             if self.use_redis and self.redis_client:
                 # 清理过期的配置数据
-                config_keys = await self.redis_client.keys("config:*")
+                config_keys = await self._scan_keys("config:*")
+                pipe = self.redis_client.pipeline()
                 for config_key in config_keys:
-                    updated_at = await self.redis_client.hget(config_key, "updated_at")
+                    pipe.hget(config_key, "updated_at")
+                updated_ats = await pipe.execute()
+
+                for config_key, updated_at in zip(config_keys, updated_ats):
                     if updated_at:
                         try:
                             update_time = datetime.fromisoformat(updated_at)
@@ -391,9 +510,14 @@ class RateLimiter:
     async def close(self):
         """关闭速率限制器，释放资源"""
         try:
+            if self._cleanup_task:
+                self._cleanup_task.cancel()
+                self._cleanup_task = None
+
             if self.redis_client:
                 await self.redis_client.close()
                 self.redis_client = None
+                self._check = self._check_memory_limit_async
 
             # 清空内存存储
             self.memory_storage.clear()
@@ -451,5 +575,5 @@ class RateLimitMiddleware:
             }
 
 
-# 默认速率限制器实例
-default_rate_limiter = RateLimiter()
\ No newline at end of file
+# 默认速率限制器实例（按用户限流，使用固定窗口）
+default_rate_limiter = RateLimiter(default_algorithm="fixed")
\ No newline at end of file
@@ -0,0 +1,60 @@
+"""
+向量相似度计算工具
+用于在本地对已取回的文本向量进行相关性打分
+"""
+import logging
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+try:
+    from numba import njit, prange
+    NUMBA_AVAILABLE = True
+except ImportError:
+    NUMBA_AVAILABLE = False
+    logger.info("未安装numba，相似度计算使用NumPy实现")
+
+
+if NUMBA_AVAILABLE:
+    @njit(parallel=True, fastmath=True, cache=True)
+    def _cosine_scores_kernel(query: np.ndarray, embeddings: np.ndarray, out: np.ndarray):
+        """余弦相似度内核（输入需已归一化）"""
+        for i in prange(embeddings.shape[0]):
+            s = 0.0
+            for k in range(embeddings.shape[1]):
+                s += query[k] * embeddings[i, k]
+            out[i] = s
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    """按行L2归一化"""
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+def cosine_scores(query: np.ndarray, embeddings: np.ndarray) -> np.ndarray:
+    """
+    计算查询向量与一组向量的余弦相似度
+
+    Args:
+        query: 查询向量，形状 (dim,)
+        embeddings: 候选向量矩阵，形状 (n, dim)
+
+    Returns:
+        相似度数组，形状 (n,)
+    """
+    embeddings = np.asarray(embeddings, dtype=np.float32)
+    if embeddings.ndim != 2 or embeddings.shape[0] == 0:
+        return np.zeros(0, dtype=np.float32)
+
+    query = np.ascontiguousarray(_normalize(np.asarray(query, dtype=np.float32)))
+    embeddings = np.ascontiguousarray(_normalize(embeddings))
+
+    if NUMBA_AVAILABLE:
+        out = np.empty(embeddings.shape[0], dtype=np.float32)
+        _cosine_scores_kernel(query, embeddings, out)
+        return out
+
+    return embeddings @ query
@@ -0,0 +1,157 @@
+"""
+文本近似去重工具
+基于SimHash指纹与汉明距离判断短文本（实体名称）是否近似重复
+"""
+import re
+import hashlib
+import logging
+from typing import List
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+try:
+    from numba import njit, prange
+    NUMBA_AVAILABLE = True
+except ImportError:
+    NUMBA_AVAILABLE = False
+    logger.info("未安装numba，近似去重使用纯Python实现")
+
+# 汉明距离小于该值视为近似重复
+SIMHASH_MAX_DISTANCE = 3
+
+_WHITESPACE = re.compile(r'\s+')
+
+
+def normalize_entity_name(text: str) -> str:
+    """规范化实体名称：去除空白并转小写"""
+    return _WHITESPACE.sub('', text).lower()
+
+
+def simhash64(text: str) -> int:
+    """
+    计算64位SimHash指纹
+
+    以字符二元组为特征（单字符文本以自身为特征），特征哈希使用blake2b，
+    保证跨进程结果稳定。
+
+    Args:
+        text: 输入文本（应已规范化）
+
+    Returns:
+        64位无符号整数指纹
+    """
+    features = [text[i:i + 2] for i in range(len(text) - 1)] or [text]
+    weights = [0] * 64
+
+    for feature in features:
+        digest = hashlib.blake2b(feature.encode('utf-8'), digest_size=8).digest()
+        value = int.from_bytes(digest, 'big')
+        for bit in range(64):
+            weights[bit] += 1 if (value >> bit) & 1 else -1
+
+    fingerprint = 0
+    for bit, weight in enumerate(weights):
+        if weight > 0:
+            fingerprint |= 1 << bit
+    return fingerprint
+
+
+def content_defined_chunks(text: str, boundary_mask: int = 0x3F) -> List[str]:
+    """
+    按内容定义的边界切分文本
+
+    逐行计算哈希，哈希低位全为0的行作为子块结尾。边界只取决于行内容，
+    文本前部插入或删除内容不会改变后续子块的切分，相同内容总是得到相同子块。
+
+    Args:
+        text: 输入文本
+        boundary_mask: 边界掩码，平均每 (boundary_mask + 1) 行切分一次
+
+    Returns:
+        子块列表，按顺序拼接即为原文
+    """
+    chunks = []
+    current = []
+
+    for line in text.splitlines(keepends=True):
+        current.append(line)
+        digest = hashlib.blake2b(line.encode('utf-8'), digest_size=8).digest()
+        if int.from_bytes(digest, 'big') & boundary_mask == 0:
+            chunks.append(''.join(current))
+            current = []
+
+    if current:
+        chunks.append(''.join(current))
+    return chunks
+
+
+def hamming_distance(a: int, b: int) -> int:
+    """两个指纹的汉明距离"""
+    return (a ^ b).bit_count()
+
+
+if NUMBA_AVAILABLE:
+    _M1 = np.uint64(0x5555555555555555)
+    _M2 = np.uint64(0x3333333333333333)
+    _M4 = np.uint64(0x0F0F0F0F0F0F0F0F)
+    _H01 = np.uint64(0x0101010101010101)
+
+    @njit(cache=True)
+    def _popcount64(x):
+        """64位整数置位数（SWAR）"""
+        x = x - ((x >> np.uint64(1)) & _M1)
+        x = (x & _M2) + ((x >> np.uint64(2)) & _M2)
+        x = (x + (x >> np.uint64(4))) & _M4
+        return (x * _H01) >> np.uint64(56)
+
+    @njit(parallel=True, cache=True)
+    def _near_duplicate_kernel(fingerprints, groups, max_distance, out):
+        """对每个位置查找同组内前序第一个近似重复的下标"""
+        for i in prange(fingerprints.shape[0]):
+            out[i] = -1
+            for j in range(i):
+                if groups[j] == groups[i] and _popcount64(fingerprints[i] ^ fingerprints[j]) < max_distance:
+                    out[i] = j
+                    break
+
+
+def find_near_duplicates(
+    fingerprints: List[int],
+    groups: List[int],
+    max_distance: int = SIMHASH_MAX_DISTANCE
+) -> List[int]:
+    """
+    查找近似重复
+
+    对每个指纹，在同组且排在其前面的指纹中查找第一个汉明距离小于阈值的。
+
+    Args:
+        fingerprints: SimHash指纹列表
+        groups: 每个指纹所属的分组编号（如实体类型）
+        max_distance: 汉明距离阈值
+
+    Returns:
+        每个位置对应的前序近似重复下标，没有则为-1
+    """
+    if NUMBA_AVAILABLE:
+        out = np.empty(len(fingerprints), dtype=np.int64)
+        _near_duplicate_kernel(
+            np.asarray(fingerprints, dtype=np.uint64),
+            np.asarray(groups, dtype=np.int64),
+            max_distance,
+            out
+        )
+        return out.tolist()
+
+    return [
+        next(
+            (
+                j for j in range(i)
+                if groups[j] == groups[i] and hamming_distance(fingerprints[i], fingerprints[j]) < max_distance
+            ),
+            -1
+        )
+        for i in range(len(fingerprints))
+    ]
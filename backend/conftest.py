@@ -2,13 +2,17 @@
 pytest配置文件
 定义全局测试夹具和配置
 """
-import asyncio
 import pytest
-from typing import AsyncGenerator
+from pytest_asyncio import is_async_test
+from typing import AsyncGenerator, Optional
+from fastapi.testclient import TestClient
+from httpx import AsyncClient
+from sqlalchemy import event
 from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.pool import StaticPool
 
+from app.main import app
 from app.db.session import get_db
 from app.models.base import Base
 from app.core.config import get_settings
@@ -27,6 +31,18 @@ test_engine = create_async_engine(
     echo=False,
 )
 
+
+# SQLite驱动默认自行管理事务，SAVEPOINT无法正常工作；
+# 关闭驱动的事务管理，由SQLAlchemy显式发出BEGIN
+@event.listens_for(test_engine.sync_engine, "connect")
+def _disable_driver_transactions(dbapi_connection, connection_record):
+    dbapi_connection.isolation_level = None
+
+
+@event.listens_for(test_engine.sync_engine, "begin")
+def _emit_begin(conn):
+    conn.exec_driver_sql("BEGIN")
+
 # 创建测试会话
 TestingSessionLocal = sessionmaker(
     autocommit=False,
@@ -35,13 +51,9 @@ TestingSessionLocal = sessionmaker(
     class_=AsyncSession,
 )
 
-
-@pytest.fixture(scope="session")
-def event_loop():
-    """创建事件循环"""
-    loop = asyncio.get_event_loop_policy().new_event_loop()
-    yield loop
-    loop.close()
+# 当前测试的数据库会话，由db_session夹具设置，会话级的测试客户端通过它使用每个测试各自的会话。
+# TestClient在独立线程中处理请求，测试中设置的ContextVar在那里不可见，因此使用模块级引用
+_current_session: Optional[AsyncSession] = None
 
 
 @pytest.fixture(scope="session")
@@ -56,17 +68,50 @@ async def test_db_setup():
 
 @pytest.fixture
 async def db_session(test_db_setup) -> AsyncGenerator[AsyncSession, None]:
-    """创建测试数据库会话"""
+    """
+    创建测试数据库会话
+
+    会话绑定到一个外层事务上，测试中的commit()只释放SAVEPOINT，
+    测试结束时回滚外层事务，各测试的数据互不影响，无需重建表结构
+    """
+    global _current_session
+
+    async with test_engine.connect() as conn:
+        transaction = await conn.begin()
+        async with AsyncSession(
+            bind=conn,
+            expire_on_commit=False,
+            join_transaction_mode="create_savepoint"
+        ) as session:
+            _current_session = session
+            try:
+                yield session
+            finally:
+                _current_session = None
+        await transaction.rollback()
+
+
+async def _override_get_db():
+    """数据库依赖覆盖：使用当前测试的会话，测试未请求db_session时创建临时会话"""
+    if _current_session is not None:
+        yield _current_session
+        return
+
     async with TestingSessionLocal() as session:
         yield session
 
 
+@pytest.fixture(scope="session", autouse=True)
+def override_dependencies():
+    """整个测试会话只设置一次依赖覆盖"""
+    app.dependency_overrides[get_db] = _override_get_db
+    yield
+    app.dependency_overrides.pop(get_db, None)
+
+
 @pytest.fixture
 async def override_get_db(db_session):
     """覆盖数据库依赖"""
-    async def _override_get_db():
-        yield db_session
-
     return _override_get_db
 
 
@@ -292,27 +337,34 @@ def mock_cost_estimation_service():
     return MockCostEstimationService()
 
 
-# 测试客户端
-@pytest.fixture
-async def client(override_get_db):
-    """创建测试客户端"""
-    from fastapi.testclient import TestClient
-    from app.main import app
+@pytest.fixture(autouse=True)
+async def clean_tables(request):
+    """
+    清空测试写入的数据
+
+    表结构在整个测试会话中保持。使用db_session的测试由外层事务回滚；
+    只使用测试客户端的测试，其请求通过临时会话真实提交，结束后按外键依赖的逆序删除各表数据
+    """
+    yield
+    if "db_session" in request.fixturenames or not {"client", "async_client"} & set(request.fixturenames):
+        return
 
-    app.dependency_overrides[get_db] = override_get_db
+    async with test_engine.begin() as conn:
+        for table in reversed(Base.metadata.sorted_tables):
+            await conn.execute(table.delete())
 
+
+# 测试客户端（整个测试会话共用，数据库会话按测试经_override_get_db切换）
+@pytest.fixture(scope="session")
+def client(test_db_setup):
+    """创建测试客户端"""
     with TestClient(app) as test_client:
         yield test_client
 
 
-@pytest.fixture
-async def async_client(override_get_db):
+@pytest.fixture(scope="session")
+async def async_client(test_db_setup):
     """创建异步测试客户端"""
-    from httpx import AsyncClient
-    from app.main import app
-
-    app.dependency_overrides[get_db] = override_get_db
-
     async with AsyncClient(app=app, base_url="http://test") as ac:
         yield ac
 
@@ -377,13 +429,12 @@ def test_data_factory():
     return TestDataFactory()
 
 
-# 测试工具函数
+# 测试工具函数（只flush不commit，数据随db_session的外层事务一起回滚）
 async def create_test_user(db_session: AsyncSession, **kwargs):
     """创建测试用户"""
     user = TestDataFactory.create_user(**kwargs)
     db_session.add(user)
-    await db_session.commit()
-    await db_session.refresh(user)
+    await db_session.flush()
     return user
 
 
@@ -391,8 +442,7 @@ async def create_test_document(db_session: AsyncSession, **kwargs):
     """创建测试文档"""
     document = TestDataFactory.create_document(**kwargs)
     db_session.add(document)
-    await db_session.commit()
-    await db_session.refresh(document)
+    await db_session.flush()
     return document
 
 
@@ -400,8 +450,7 @@ async def create_test_project(db_session: AsyncSession, **kwargs):
     """创建测试项目"""
     project = TestDataFactory.create_project(**kwargs)
     db_session.add(project)
-    await db_session.commit()
-    await db_session.refresh(project)
+    await db_session.flush()
     return project
 
 
@@ -410,6 +459,14 @@ pytest_plugins = [
     "pytest_asyncio",
 ]
 
+def pytest_collection_modifyitems(items):
+    """所有异步测试与异步夹具共用一个会话级事件循环，测试引擎的连接在整个测试会话中保持"""
+    session_loop_marker = pytest.mark.asyncio(loop_scope="session")
+    for item in items:
+        if is_async_test(item):
+            item.add_marker(session_loop_marker, append=False)
+
+
 # pytest配置
 def pytest_configure(config):
     """配置pytest"""
@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+"""
+知识图谱统计触发器安装脚本
+为已有数据库安装或更新 kg_user_stats 的增量维护函数与触发器（可重复执行）
+"""
+import sys
+import asyncio
+import argparse
+from pathlib import Path
+
+# 添加项目根目录到Python路径
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from sqlalchemy import text, delete
+
+from app.db.session import engine
+from app.models.knowledge import KnowledgeUserStats, KG_USER_STATS_DDL
+
+
+async def install(reset_stats: bool) -> int:
+    """安装触发器，可选清空统计行（之后由服务首次查询时全量重建）"""
+    try:
+        async with engine.begin() as conn:
+            await conn.run_sync(KnowledgeUserStats.__table__.create, checkfirst=True)
+            for statement in KG_USER_STATS_DDL:
+                await conn.execute(text(statement))
+
+            if not reset_stats:
+                return 0
+            result = await conn.execute(delete(KnowledgeUserStats))
+            return result.rowcount
+    finally:
+        await engine.dispose()
+
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description="安装知识图谱统计触发器")
+    parser.add_argument(
+        "--reset-stats", action="store_true",
+        help="清空已有统计行，修正旧版触发器造成的计数偏差"
+    )
+    args = parser.parse_args()
+
+    print("🔧 知识图谱统计触发器安装工具")
+    print("=" * 50)
+
+    try:
+        removed = asyncio.run(install(args.reset_stats))
+        print("✅ 触发器安装完成")
+        if args.reset_stats:
+            print(f"🧹 已清空 {removed} 行统计，将在首次查询时重建")
+
+    except Exception as e:
+        print(f"❌ 安装触发器时出错: {e}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
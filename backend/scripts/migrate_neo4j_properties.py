@@ -0,0 +1,47 @@
+#!/usr/bin/env python3
+"""
+Neo4j属性迁移脚本
+把旧版以JSON字符串存储的节点、关系properties迁移为Neo4j原生属性
+"""
+import sys
+import asyncio
+import argparse
+from pathlib import Path
+
+# 添加项目根目录到Python路径
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from app.services.knowledge_graph_service import knowledge_graph_service
+
+
+async def migrate(batch_size: int) -> int:
+    """执行迁移"""
+    if not await knowledge_graph_service.connect_neo4j():
+        raise RuntimeError("无法连接Neo4j")
+
+    try:
+        return await knowledge_graph_service.migrate_legacy_properties(batch_size)
+    finally:
+        await knowledge_graph_service.disconnect_neo4j()
+
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description="迁移Neo4j旧版JSON属性")
+    parser.add_argument("--batch-size", type=int, default=1000, help="每批迁移数量")
+    args = parser.parse_args()
+
+    print("🔄 Neo4j属性迁移工具")
+    print("=" * 50)
+
+    try:
+        migrated = asyncio.run(migrate(args.batch_size))
+        print(f"✅ 迁移完成，共处理 {migrated} 个节点和关系")
+
+    except Exception as e:
+        print(f"❌ 迁移时出错: {e}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
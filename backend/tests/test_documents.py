@@ -134,12 +134,16 @@ async def test_vector_search_service():
     service = vector_service
 
     # 测试连接
-    with patch.object(service, 'client') as mock_client:
-        mock_client.get_collections.return_value.collections = []
-        mock_client.create_collection = Mock()
+    with patch('app.services.vector_service.AsyncQdrantClient') as mock_client_class:
+        mock_client = mock_client_class.return_value
+        mock_client.get_collections = AsyncMock(return_value=Mock(collections=[]))
+        mock_client.create_collection = AsyncMock()
+        mock_client.create_payload_index = AsyncMock()
 
         result = await service.connect()
         assert result is True
+        mock_client.create_collection.assert_awaited_once()
+        mock_client.create_payload_index.assert_awaited_once()
 
 
 @pytest.mark.asyncio
@@ -1,6 +1,8 @@
 """
 服务层单元测试
 """
+import asyncio
+import numpy as np
 import pytest
 from unittest.mock import Mock, AsyncMock, patch
 from datetime import datetime
@@ -10,9 +12,9 @@ from app.services.ai_model_service import AIModelService
 from app.services.cost_tracking_service import CostTrackingService
 from app.schemas.qa import (
     QueryRequest, QueryResponse, RetrievalResult,
-    GeneratedAnswer, QueryType, DataSource
+    GeneratedAnswer, QueryType, DataSource, ConversationContext
 )
-from app.schemas.ai_model import ChatResponse, AIProvider
+from app.schemas.ai_model import AIProvider
 
 
 class TestQAService:
@@ -21,10 +23,10 @@ class TestQAService:
     @pytest.fixture
     def qa_service(self):
         """QA服务实例"""
-        with patch('app.services.qa_service.DocumentService'), \
-             patch('app.services.qa_service.KnowledgeGraphService'), \
-             patch('app.services.qa_service.CostEstimationService'), \
-             patch('app.services.qa_service.AIModelService'):
+        with patch('app.services.qa_service.document_service'), \
+             patch('app.services.qa_service.knowledge_graph_service'), \
+             patch('app.services.qa_service.cost_estimation_service'), \
+             patch('app.services.qa_service.ai_model_service'):
             return QAService()
 
     @pytest.mark.unit
@@ -35,6 +37,7 @@ class TestQAService:
         qa_service.knowledge_graph_service = Mock()
         qa_service.cost_estimation_service = Mock()
         qa_service.ai_model_service = Mock()
+        qa_service._embed_question = AsyncMock(return_value=None)
 
         # 设置模拟返回值
         qa_service.document_service.search_documents = AsyncMock(
@@ -55,13 +58,12 @@ class TestQAService:
         )
 
         qa_service.ai_model_service.chat_completion = AsyncMock(
-            return_value=ChatResponse(
-                content="这是测试答案",
-                model="glm-4",
-                provider="zhipuai",
-                usage={"input_tokens": 10, "output_tokens": 20},
-                response_time=1.0
-            )
+            return_value={
+                "content": "这是测试答案",
+                "model": "glm-4",
+                "provider": "zhipuai",
+                "usage": {"prompt_tokens": 10, "completion_tokens": 20, "total_tokens": 30}
+            }
         )
 
         # 创建查询请求
@@ -83,6 +85,119 @@ class TestQAService:
         assert response.answer.model_used == "glm-4"
         assert response.processing_time > 0
 
+    @pytest.mark.unit
+    async def test_repeated_question_uses_answer_cache(self, qa_service):
+        """测试重复问题命中答案缓存，不再调用AI模型"""
+        qa_service.ai_model_service = Mock()
+        qa_service.ai_model_service.chat_completion = AsyncMock(
+            return_value={
+                "content": "这是测试答案",
+                "model": "glm-4",
+                "provider": "zhipuai",
+                "usage": {"prompt_tokens": 10, "completion_tokens": 20, "total_tokens": 30}
+            }
+        )
+        qa_service._embed_question = AsyncMock(return_value=None)
+
+        request = QueryRequest(question="钢筋的价格是多少", user_id=1)
+        retrieval_result = RetrievalResult(
+            query=request.question,
+            processing_time=0.0,
+            retrieval_method="test"
+        )
+
+        first = await qa_service._generate_answer(request, retrieval_result)
+        second = await qa_service._generate_answer(request, retrieval_result)
+
+        assert qa_service.ai_model_service.chat_completion.await_count == 1
+        assert second.answer == first.answer
+        assert second.metadata["cache_hit"] == "exact"
+
+    @pytest.mark.unit
+    async def test_empty_retrieval_skips_generation(self, qa_service):
+        """测试非简单查询无检索结果时不调用AI模型"""
+        qa_service.ai_model_service = Mock()
+        qa_service.ai_model_service.chat_completion = AsyncMock()
+
+        request = QueryRequest(question="钢筋的价格是多少", query_type=QueryType.COST_ESTIMATION)
+        retrieval_result = RetrievalResult(
+            query=request.question,
+            processing_time=0.0,
+            retrieval_method="test"
+        )
+
+        answer = await qa_service._generate_answer(request, retrieval_result)
+
+        qa_service.ai_model_service.chat_completion.assert_not_awaited()
+        assert answer.metadata["path"] == "insufficient_context"
+        assert answer.confidence_score == 0.0
+
+    @pytest.mark.unit
+    async def test_empty_retrieval_for_simple_query_uses_light_model(self, qa_service):
+        """测试简单查询即使预处理后类型被改写，无检索结果时仍走轻量模型"""
+        qa_service.ai_model_service = Mock()
+        qa_service.ai_model_service.chat_completion = AsyncMock(
+            return_value={
+                "content": "这是测试答案",
+                "model": "glm-4-flash",
+                "provider": "zhipuai",
+                "usage": {"prompt_tokens": 10, "completion_tokens": 20, "total_tokens": 30}
+            }
+        )
+        qa_service._embed_question = AsyncMock(return_value=None)
+
+        request = QueryRequest(question="你好", query_type=QueryType.SIMPLE)
+        processed = await qa_service._preprocess_query(request)
+        retrieval_result = RetrievalResult(
+            query=processed.question,
+            processing_time=0.0,
+            retrieval_method="test"
+        )
+
+        answer = await qa_service._generate_answer(processed, retrieval_result, QueryType.SIMPLE)
+
+        assert processed.query_type != QueryType.SIMPLE
+        assert answer.metadata["path"] == "light"
+        assert qa_service.ai_model_service.chat_completion.await_args.kwargs["model"] == "glm-4-flash"
+
+    @pytest.mark.unit
+    async def test_concurrent_identical_queries_are_coalesced(self, qa_service):
+        """测试并发的相同查询只执行一次处理流程"""
+        response = QueryResponse(
+            query_id="query_1",
+            question="钢筋的价格是多少",
+            answer=GeneratedAnswer(
+                answer="答案",
+                confidence_score=0.8,
+                quality_score=0.8,
+                generation_time=1.0,
+                model_used="glm-4"
+            ),
+            retrieval_result=RetrievalResult(
+                query="钢筋的价格是多少",
+                processing_time=0.0,
+                retrieval_method="test"
+            ),
+            query_type=QueryType.SIMPLE,
+            processing_time=1.0
+        )
+
+        async def pipeline(query_request):
+            await asyncio.sleep(0.01)
+            return response
+
+        qa_service._process_query_pipeline = AsyncMock(side_effect=pipeline)
+
+        first, second = await asyncio.gather(
+            qa_service.process_query(QueryRequest(question="钢筋的价格是多少", user_id=1)),
+            qa_service.process_query(QueryRequest(question="钢筋的价格是多少", user_id=1))
+        )
+
+        assert qa_service._process_query_pipeline.await_count == 1
+        assert first.answer.answer == second.answer.answer
+        assert first.query_id != second.query_id
+        assert not qa_service._inflight
+
     @pytest.mark.unit
     async def test_query_preprocessing(self, qa_service):
         """测试查询预处理"""
@@ -282,6 +397,54 @@ class TestQAService:
         assert len(context.conversation_history) == 1
         assert context.conversation_history[0]["question"] == "测试问题"
 
+    @pytest.mark.unit
+    async def test_conversation_context_keeps_original_question(self, qa_service):
+        """测试对话历史保存预处理前的问题，并复用同一问题的嵌入"""
+        qa_service.conversation_cache["test_session"] = ConversationContext(
+            session_id="test_session",
+            user_id=1,
+            conversation_history=[
+                {"timestamp": datetime.utcnow(), "question": f"问题{i}", "answer": f"答案{i}"}
+                for i in range(4)
+            ]
+        )
+        qa_service._history_embeddings["test_session"] = np.ones((4, 4), dtype=np.float32)
+        query_request = QueryRequest(
+            question="钢筋的价格是多少",
+            user_id=1,
+            session_id="test_session"
+        )
+        response = QueryResponse(
+            query_id="test_query",
+            question=query_request.question,
+            answer=GeneratedAnswer(
+                answer="测试答案",
+                confidence_score=0.8,
+                quality_score=0.8,
+                generation_time=1.0,
+                model_used="glm-4"
+            ),
+            retrieval_result=RetrievalResult(
+                query="测试查询",
+                processing_time=1.0,
+                retrieval_method="test"
+            ),
+            query_type=QueryType.SIMPLE,
+            processing_time=2.0,
+            user_id=1,
+            session_id="test_session"
+        )
+
+        with patch('app.services.qa_service.document_processor') as processor:
+            processor.embedding_model.encode = Mock(return_value=np.ones(4, dtype=np.float32))
+            await qa_service._preprocess_query(query_request)
+            await qa_service._update_conversation_context(query_request, response, "钢筋的价格是多少")
+
+        history = qa_service.conversation_cache["test_session"].conversation_history
+        assert query_request.question != "钢筋的价格是多少"
+        assert history[-1]["question"] == "钢筋的价格是多少"
+        assert processor.embedding_model.encode.call_count == 1
+
     @pytest.mark.unit
     async def test_batch_query_processing(self, qa_service):
         """测试批量查询处理"""
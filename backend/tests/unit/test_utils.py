@@ -0,0 +1,148 @@
+"""
+工具模块单元测试
+"""
+import re
+import pytest
+import numpy as np
+
+from app.utils.similarity import cosine_scores
+from app.utils.rate_limit import RateLimiter
+from app.utils.pattern_scanner import MultiPatternScanner, HYPERSCAN_AVAILABLE
+from app.utils.text_dedup import (
+    normalize_entity_name, simhash64, hamming_distance, find_near_duplicates,
+    content_defined_chunks
+)
+
+
+class TestCosineScores:
+    """余弦相似度计算测试"""
+
+    @pytest.mark.unit
+    def test_scores_match_numpy(self):
+        """测试结果与NumPy参考实现一致"""
+        rng = np.random.default_rng(0)
+        query = rng.normal(size=16)
+        embeddings = rng.normal(size=(8, 16))
+
+        expected = embeddings @ query / (
+            np.linalg.norm(embeddings, axis=1) * np.linalg.norm(query)
+        )
+
+        np.testing.assert_allclose(cosine_scores(query, embeddings), expected, rtol=1e-4)
+
+    @pytest.mark.unit
+    def test_identical_vector_scores_one(self):
+        """测试相同向量相似度为1"""
+        vector = np.array([1.0, 2.0, 3.0])
+        scores = cosine_scores(vector, np.array([vector, -vector]))
+
+        assert scores[0] == pytest.approx(1.0, abs=1e-5)
+        assert scores[1] == pytest.approx(-1.0, abs=1e-5)
+
+    @pytest.mark.unit
+    def test_empty_embeddings(self):
+        """测试空候选集"""
+        scores = cosine_scores(np.ones(4), np.empty((0, 4)))
+        assert scores.shape == (0,)
+
+
+class TestMultiPatternScanner:
+    """多模式扫描测试"""
+
+    @pytest.mark.unit
+    def test_scan_reports_matching_patterns(self):
+        """测试命中的模式一定被报告"""
+        scanner = MultiPatternScanner({
+            'location': re.compile(r'([\u4e00-\u9fa5]+(?:省|市))'),
+            'standard': re.compile(r'(GB|ISO)(?:-\d+)+'),
+        })
+
+        matched = scanner.scan("项目位于浙江省杭州市")
+
+        assert 'location' in matched
+        if HYPERSCAN_AVAILABLE:
+            assert matched == {'location'}
+
+    @pytest.mark.unit
+    def test_empty_patterns(self):
+        """测试空模式集"""
+        assert MultiPatternScanner({}).scan("任意文本") == set()
+
+
+class TestTextDedup:
+    """文本近似去重测试"""
+
+    @pytest.mark.unit
+    def test_normalize_entity_name(self):
+        """测试名称规范化"""
+        assert normalize_entity_name("人工 智能") == "人工智能"
+        assert normalize_entity_name(" Python ") == "python"
+
+    @pytest.mark.unit
+    def test_simhash_is_stable(self):
+        """测试相同文本指纹一致"""
+        assert simhash64("钢筋混凝土") == simhash64("钢筋混凝土")
+        assert hamming_distance(simhash64("钢筋混凝土"), simhash64("钢筋混凝土")) == 0
+
+    @pytest.mark.unit
+    def test_different_text_distance(self):
+        """测试不同文本距离较大"""
+        assert hamming_distance(simhash64("钢筋"), simhash64("玻璃")) > 3
+
+    @pytest.mark.unit
+    def test_find_near_duplicates(self):
+        """测试同组内查找前序近似重复"""
+        base = simhash64("钢筋混凝土")
+        near = base ^ 0b1  # 仅相差1位
+        far = simhash64("玻璃幕墙")
+
+        parents = find_near_duplicates([base, near, far, near], [0, 0, 0, 1])
+
+        assert parents == [-1, 0, -1, -1]
+
+    @pytest.mark.unit
+    def test_content_defined_chunks_reassemble(self):
+        """测试子块按顺序拼接还原原文"""
+        text = "".join(f"第{i}行内容\n" for i in range(500))
+
+        chunks = content_defined_chunks(text)
+
+        assert "".join(chunks) == text
+        assert len(chunks) > 1
+
+    @pytest.mark.unit
+    def test_content_defined_chunks_shift_resistant(self):
+        """测试前部插入内容不影响后续子块切分"""
+        text = "".join(f"第{i}行内容\n" for i in range(500))
+
+        original = content_defined_chunks(text)
+        shifted = content_defined_chunks("新增的一行\n" + text)
+
+        assert original[1:] == shifted[1:]
+
+
+class TestRateLimiter:
+    """内存速率限制测试"""
+
+    @pytest.mark.unit
+    def test_memory_limit_rejects_after_burst(self):
+        """测试突发请求超过容量后被拒绝"""
+        limiter = RateLimiter()
+
+        allowed = [limiter._check_memory_limit("user:1", 3, 60) for _ in range(4)]
+
+        assert allowed == [True, True, True, False]
+        assert limiter._check_memory_limit("user:2", 3, 60) is True
+
+    @pytest.mark.unit
+    async def test_memory_count_and_reset(self):
+        """测试计数与重置"""
+        limiter = RateLimiter()
+        limiter.use_redis = False
+
+        limiter._check_memory_limit("user:1", 5, 60)
+        limiter._check_memory_limit("user:1", 5, 60)
+
+        assert await limiter.get_current_count("user:1", 60) == 2
+        await limiter.reset_limit("user:1")
+        assert await limiter.get_current_count("user:1", 60) == 0